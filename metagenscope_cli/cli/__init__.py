@@ -2,21 +2,18 @@
 
 import click
 
-from .auth_cli import register, login, status
-from .get_cli import get
-from .run_cli import run
-from .upload_cli import upload
+from .lazy_group import LazyGroup
 
 
-@click.group()
+@click.group(cls=LazyGroup, lazy_commands={
+    'register': 'metagenscope_cli.cli.auth_cli:register',
+    'login': 'metagenscope_cli.cli.auth_cli:login',
+    'status': 'metagenscope_cli.cli.auth_cli:status',
+    'get': 'metagenscope_cli.cli.get_cli:get',
+    'run': 'metagenscope_cli.cli.run_cli:run',
+    'upload': 'metagenscope_cli.cli.upload_cli:upload',
+    'bench': 'metagenscope_cli.cli.bench_cli:bench',
+})
 def main():
     """Use to interact with the MetaGenScope web platform."""
     pass
-
-
-main.add_command(register)
-main.add_command(login)
-main.add_command(status)
-main.add_command(get)
-main.add_command(run)
-main.add_command(upload)
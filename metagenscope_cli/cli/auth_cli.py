@@ -2,9 +2,7 @@
 
 import os
 import click
-from requests.exceptions import HTTPError
 
-from metagenscope_cli.network.authenticator import Authenticator
 from metagenscope_cli.config import config
 
 from .utils import add_authorization
@@ -12,6 +10,8 @@ from .utils import add_authorization
 
 def handle_auth_request(request_generator):
     """Perform common authentication request functions."""
+    from requests.exceptions import HTTPError
+
     try:
         jwt_token = request_generator()
         click.echo(f'JWT Token: {jwt_token}')
@@ -29,6 +29,9 @@ def handle_auth_request(request_generator):
 @click.argument('password')
 def register(host, username, user_email, password):
     """Register as a new MetaGenScope user."""
+    # Only commands talking to the server import requests
+    from metagenscope_cli.network.authenticator import Authenticator
+
     if host is None:
         host = os.environ['MGS_HOST']
     authenticator = Authenticator(host=host)
@@ -46,6 +49,8 @@ def register(host, username, user_email, password):
 @click.argument('password')
 def login(host, user_email, password):
     """Authenticate as an existing MetaGenScope user."""
+    from metagenscope_cli.network.authenticator import Authenticator
+
     if host is None:
         host = os.environ['MGS_HOST']
     authenticator = Authenticator(host=host)
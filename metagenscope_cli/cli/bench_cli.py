@@ -0,0 +1,131 @@
+"""CLI to benchmark parsing and uploads."""
+
+from contextlib import contextmanager
+from tempfile import TemporaryDirectory
+
+import click
+
+from metagenscope_cli.loadtest import FakeMetaGenScope, FAKE_TOKEN
+from metagenscope_cli.sample_sources.file_source import FileSource
+from metagenscope_cli.tools.benchmark import benchmark_parse
+from metagenscope_cli.tools.parsers import JSON_TOOLS, SIMPLE_PARSE, UnparsableError
+from metagenscope_cli.tools.synthetic import write_result_files
+
+
+@click.group()
+def bench():
+    """Benchmark parsing and uploads."""
+
+
+def report_benchmark(sample_name, stats):
+    """Report parsing benchmark results to the user."""
+    click.echo(f'{sample_name}\t{stats["result_type"]}\t{stats["rows"]}\t'
+               f'{stats["seconds"]:.4f}\t{stats["rows_per_second"]:.0f}\t'
+               f'{stats["peak_memory"] / 1024 / 1024:.1f}')
+
+
+def benchmark_catalog(catalog, repeat):
+    """Benchmark parsing every result of a catalog."""
+    click.echo('sample\tresult_type\trows\tseconds\trows_per_second\tpeak_memory_mb')
+    for sample_name, sample_schema in catalog.items():
+        for result_type, files_dict in sample_schema.items():
+            try:
+                stats = benchmark_parse(result_type, files_dict, repeat=repeat)
+            except UnparsableError:
+                click.echo(f'[parse-error] could not parse {result_type}', err=True)
+                continue
+            except KeyError:
+                click.echo(f'[key-error] {sample_name} :: {result_type}', err=True)
+                continue
+            report_benchmark(sample_name, stats)
+
+
+@bench.command(name='parse')
+@click.option('--repeat', default=3, help='Parses per result, the fastest is reported.')
+@click.option('--synthetic-rows', default=None, type=int,
+              help='Benchmark synthetic files of this many rows for every result type.')
+@click.argument('result_files', nargs=-1)
+def bench_parse(repeat, synthetic_rows, result_files):
+    """Report parsing speed for tool result files."""
+    if synthetic_rows is None:
+        catalog = FileSource(files=result_files).get_cataloged_files()
+        benchmark_catalog(catalog, repeat)
+        return
+
+    with TemporaryDirectory() as dirname:
+        result_types = sorted(set(JSON_TOOLS) | set(SIMPLE_PARSE))
+        catalog = {'synthetic': {
+            result_type: write_result_files(result_type, dirname, rows=synthetic_rows)
+            for result_type in result_types
+        }}
+        benchmark_catalog(catalog, repeat)
+
+
+def report_load_test(stats):
+    """Report upload load test results to the user."""
+    latencies = '\t'.join(
+        f'{stats[name]:.4f}' if stats[name] is not None else 'n/a'
+        for name in ['p50', 'p90', 'p99']
+    )
+    click.echo(f'{stats["workers"]}\t{stats["requests"]}\t{stats["errors"]}\t'
+               f'{stats["seconds"]:.2f}\t{stats["requests_per_second"]:.1f}\t'
+               f'{stats["bytes_per_second"]:.0f}\t{latencies}')
+
+
+def load_test_samples(samples, rows):
+    """Return parsed synthetic samples to load test uploads with."""
+    # Networking is only needed to load test uploads
+    from metagenscope_cli.loadtest.driver import synthetic_samples
+
+    with TemporaryDirectory() as dirname:
+        return synthetic_samples(dirname, samples, rows)
+
+
+@contextmanager
+def serving_unless_host(host, **fake_options):
+    """Yield `host`, or the URL of a fake server run for the duration if it is None."""
+    if host is not None:
+        yield host
+        return
+    with FakeMetaGenScope(**fake_options) as server:
+        yield server.url
+
+
+def report_load_tests(host, parsed_samples, worker_counts, **load_test_options):
+    """Load test uploads to a host once per worker count, reporting each run."""
+    from metagenscope_cli.loadtest.driver import run_load_test
+
+    click.echo('workers\trequests\terrors\tseconds\trequests_per_second\t'
+               'bytes_per_second\tp50\tp90\tp99')
+    for run, workers in enumerate(worker_counts):
+        stats = run_load_test(host, parsed_samples, workers, run_name=f'load_{run}',
+                              **load_test_options)
+        report_load_test(stats)
+
+
+@bench.command(name='upload')
+@click.option('-h', '--host', default=None,
+              help='Server to load test [default: a local fake server].')
+@click.option('-a', '--auth-token', default=FAKE_TOKEN)
+@click.option('--samples', default=20, help='Synthetic samples to upload per run.')
+@click.option('--rows', default=1000, help='Rows in each synthetic result file.')
+@click.option('--workers', 'worker_counts', multiple=True, type=int, default=[1, 4, 16],
+              help='Upload worker counts to compare, repeat for several.')
+@click.option('--latency', default=0.02, help='Mean fake server latency, in seconds.')
+@click.option('--error-rate', default=0.0, help='Fraction of fake server responses that are 500.')
+@click.option('--throttle-rate', default=0.0,
+              help='Fraction of fake server responses that are 429.')
+@click.option('--bandwidth', default=None, type=int,
+              help='Fake server upload bandwidth, in bytes per second.')
+@click.option('--compress', is_flag=True, help='Gzip request bodies.')
+@click.option('--retries', default=2, help='Times to resend a failed request.')
+@click.option('--adaptive', is_flag=True, help='Adapt requests in flight to the server.')
+def bench_upload(host, auth_token, samples, rows,  # pylint:disable=too-many-arguments
+                 worker_counts, latency, error_rate, throttle_rate, bandwidth,
+                 compress, retries, adaptive):
+    """Report upload throughput and latency for several worker counts."""
+    parsed_samples = load_test_samples(samples, rows)
+    with serving_unless_host(host, latency=latency, error_rate=error_rate,
+                             throttle_rate=throttle_rate, bandwidth=bandwidth) as url:
+        report_load_tests(url, parsed_samples, worker_counts, auth_token=auth_token,
+                          compress=compress, retries=retries, adaptive=adaptive)
@@ -1,8 +1,14 @@
 """CLI to get data from a MetaGenScope Server."""
 
+import os
+from itertools import chain
+
 import click
 
-from .utils import add_authorization
+from metagenscope_cli.constants import DEFAULT_UPLOAD_WORKERS
+from metagenscope_cli.sample_sources.file_source import read_manifest
+
+from .utils import add_authorization, report_download_results
 
 
 @click.group()
@@ -19,7 +25,10 @@ def uuids():
 
 def report_uuid(name, uuid):
     """Report a uuid to the user."""
-    click.echo(f'{name}\t{uuid}')
+    if isinstance(uuid, Exception):
+        click.echo(f'[uuid-error] {name} :: {uuid}', err=True)
+    else:
+        click.echo(f'{name}\t{uuid}')
 
 
 @uuids.command(name='samples')
@@ -27,10 +36,9 @@ def report_uuid(name, uuid):
 @click.argument('sample_names', nargs=-1)
 def sample_uuids(uploader, sample_names):
     """Get UUIDs for the given sample names."""
-    for sample_name in sample_names:
-        response = uploader.knex.get(f'/api/v1/samples/getid/{sample_name}')
-        report_uuid(response['data']['sample_name'],
-                    response['data']['sample_uuid'])
+    found_uuids = uploader.get_sample_uuids(sample_names)
+    for sample_name, sample_uuid in zip(sample_names, found_uuids):
+        report_uuid(sample_name, sample_uuid)
 
 
 @uuids.command(name='groups')
@@ -38,7 +46,75 @@ def sample_uuids(uploader, sample_names):
 @click.argument('sample_group_names', nargs=-1)
 def sample_group_uuids(uploader, sample_group_names):
     """Get UUIDs for the given sample groups."""
-    for sample_group_name in sample_group_names:
-        response = uploader.knex.get(f'/api/v1/sample_groups/getid/{sample_group_name}')
-        report_uuid(response['data']['sample_group_name'],
-                    response['data']['sample_group_uuid'])
+    found_uuids = uploader.get_sample_group_uuids(sample_group_names)
+    for sample_group_name, sample_group_uuid in zip(sample_group_names, found_uuids):
+        report_uuid(sample_group_name, sample_group_uuid)
+
+
+@get.group()
+def results():
+    """Download analysis results from the server."""
+    pass
+
+
+def add_download_options():
+    """Add options controlling which results are downloaded, where and how."""
+    def decorator(command):
+        """Empty wrapper around decoration to be consistent with Click style."""
+        options = [
+            click.option('-r', '--result-type', 'result_types', multiple=True, required=True,
+                         help='Result type to download, repeat for several.'),
+            click.option('-f', '--file', 'names_file', default=None, type=click.File('r'),
+                         help='File listing names, one per line, or - for stdin.'),
+            click.option('-o', '--out-dir', default='.', type=click.Path(file_okay=False),
+                         help='Directory to write <name>.<result_type>.json files to.'),
+            click.option('--workers', default=DEFAULT_UPLOAD_WORKERS, type=click.IntRange(min=1),
+                         help='Threads downloading results.'),
+        ]
+        for option in reversed(options):
+            command = option(command)
+        return command
+    return decorator
+
+
+def download_results(uploader, kind,  # pylint:disable=too-many-arguments
+                     names, result_types, out_dir, workers):
+    """Resolve the UUIDs of samples or groups, then download their results concurrently."""
+    uploader.set_workers(workers)
+    if kind == 'samples':
+        found_uuids = uploader.get_sample_uuids(names)
+    else:
+        found_uuids = uploader.get_sample_group_uuids(names)
+    uuid_map = {}
+    for name, uuid in zip(names, found_uuids):
+        if isinstance(uuid, Exception):
+            report_uuid(name, uuid)
+        else:
+            uuid_map[name] = uuid
+    os.makedirs(out_dir, exist_ok=True)
+    report_download_results(uploader.download_results(kind, uuid_map, result_types, out_dir))
+
+
+@results.command(name='samples')
+@add_authorization()
+@add_download_options()
+@click.argument('sample_names', nargs=-1)
+def sample_results(uploader, result_types,  # pylint:disable=too-many-arguments
+                   names_file, out_dir, workers, sample_names):
+    """Download results of the given samples, skipping files already present."""
+    if names_file is not None:
+        sample_names = list(chain(sample_names, read_manifest(names_file)))
+    download_results(uploader, 'samples', sample_names, result_types, out_dir, workers)
+
+
+@results.command(name='groups')
+@add_authorization()
+@add_download_options()
+@click.argument('sample_group_names', nargs=-1)
+def sample_group_results(uploader, result_types,  # pylint:disable=too-many-arguments
+                         names_file, out_dir, workers, sample_group_names):
+    """Download results of the given sample groups, skipping files already present."""
+    if names_file is not None:
+        sample_group_names = list(chain(sample_group_names, read_manifest(names_file)))
+    download_results(uploader, 'sample_groups', sample_group_names, result_types, out_dir,
+                     workers)
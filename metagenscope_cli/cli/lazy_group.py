@@ -0,0 +1,31 @@
+"""Click group importing subcommands only when they are used."""
+
+from importlib import import_module
+
+import click
+
+
+class LazyGroup(click.Group):
+    """
+    Click group importing each subcommand's module only when it is used.
+
+    `lazy_commands` maps command names to '<module>:<attribute>' import
+    paths, so starting the CLI does not import the dependencies of every
+    command.
+    """
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        """Initialize group with its lazily imported commands."""
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        """Return the names of eager and lazy commands."""
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        """Return a command, importing it if it is lazy."""
+        if cmd_name not in self.lazy_commands:
+            return super().get_command(ctx, cmd_name)
+        module_name, attribute = self.lazy_commands[cmd_name].split(':')
+        return getattr(import_module(module_name), attribute)
@@ -1,9 +1,14 @@
 """CLI to run commands on MGS server."""
 
+from itertools import chain
 from sys import stderr
 import click
 
-from .utils import add_authorization
+from metagenscope_cli.constants import DEFAULT_UPLOAD_WORKERS
+from metagenscope_cli.sample_sources.file_source import read_manifest
+
+from .utils import (add_authorization, report_middleware_progress, report_middleware_results,
+                    report_middleware_statuses)
 
 
 @click.group()
@@ -23,7 +28,7 @@ def middleware():
 @click.argument('group_uuid')
 def group_middleware(uploader, group_uuid):
     """Run middleware for a group."""
-    response = uploader.knex.post(f'/api/v1/sample_groups/{group_uuid}/middleware', {})
+    response = uploader.run_group_middleware(group_uuid)
     click.echo(response)
 
 
@@ -32,8 +37,39 @@ def group_middleware(uploader, group_uuid):
 @click.argument('sample_name')
 def sample_middleware(uploader, sample_name):
     """Run middleware for a sample."""
-    response = uploader.knex.get(f'/api/v1/samples/getid/{sample_name}')
-    sample_uuid = response['data']['sample_uuid']
+    sample_uuid = uploader.get_sample_uuid(sample_name)
     print(f'{sample_name} :: {sample_uuid}', file=stderr)
     response = uploader.knex.post(f'/api/v1/samples/{sample_uuid}/middleware', {})
     click.echo(response)
+
+
+@middleware.command(name='samples')
+@add_authorization()
+@click.option('-f', '--file', 'names_file', default=None, type=click.File('r'),
+              help='File listing sample names, one per line, or - for stdin.')
+@click.option('--workers', default=DEFAULT_UPLOAD_WORKERS, type=click.IntRange(min=1),
+              help='Threads running middleware.')
+@click.option('--wait', is_flag=True, help='Poll until middleware finishes, reporting progress.')
+@click.option('--poll-interval', default=5.0, help='Seconds between polls when waiting.')
+@click.option('--timeout', default=None, type=float,
+              help='Seconds to wait for middleware to finish [default: no limit].')
+@click.argument('sample_names', nargs=-1)
+def samples_middleware(uploader, names_file,  # pylint:disable=too-many-arguments
+                       workers, wait, poll_interval, timeout, sample_names):
+    """Run middleware for many samples."""
+    if names_file is not None:
+        sample_names = chain(sample_names, read_manifest(names_file))
+    # Middleware runs once per sample, however often it is named
+    sample_names = list(dict.fromkeys(sample_names))
+    uploader.set_workers(workers)
+    results = uploader.run_samples_middleware(sample_names)
+    failed = report_middleware_results(results)
+    if wait:
+        sample_names_by_uuid = {result['sample_uuid']: result['sample_name']
+                                for result in results if result['type'] == 'success'}
+        statuses = uploader.poll_samples_middleware(list(sample_names_by_uuid),
+                                                    interval=poll_interval, timeout=timeout,
+                                                    progress=report_middleware_progress)
+        failed += report_middleware_statuses(sample_names_by_uuid, statuses)
+    if failed:
+        exit(1)
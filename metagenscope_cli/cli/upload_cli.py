@@ -1,12 +1,16 @@
 """CLI to upload data to a MetaGenScope Server."""
 
-from sys import stderr
+from itertools import chain
+
 import click
 
-from metagenscope_cli.sample_sources.data_super_source import DataSuperSource
-from metagenscope_cli.sample_sources.file_source import FileSource
+from metagenscope_cli.constants import DEFAULT_UPLOAD_WORKERS
+from metagenscope_cli.sample_sources.constants import RESOLVE_WORKERS
+from metagenscope_cli.sample_sources.file_source import FileSource, read_manifest
 
-from .utils import batch_upload, add_authorization, parse_metadata
+from .utils import (batch_upload, add_authorization, add_parse_options,
+                    add_trace_option, add_upload_options, parse_metadata,
+                    report_metadata_results, validate_all_results)
 
 
 @click.group()
@@ -17,42 +21,84 @@ def upload():
 
 @upload.command()
 @add_authorization()
+@click.option('-c', '--column', 'columns', multiple=True,
+              help='Metadata column to upload, repeat for several [default: all].')
+@click.option('--workers', default=DEFAULT_UPLOAD_WORKERS, type=click.IntRange(min=1),
+              help='Threads uploading metadata.')
+@click.option('--batch-size', default=1,
+              help='Samples sent per request, if the server accepts batches.')
 @click.argument('metadata_csv')
 @click.argument('sample_names', nargs=-1)
-def metadata(uploader, metadata_csv, sample_names):
-    """Upload a CSV metadata file."""
-    parsed_metadata = parse_metadata(metadata_csv, sample_names)
-    for sample_name, metadata_dict in parsed_metadata.items():
-        payload = {
-            'sample_name': str(sample_name),
-            'metadata': metadata_dict,
-        }
-        try:
-            response = uploader.knex.post('/api/v1/samples/metadata', payload)
-            click.echo(response)
-        except Exception:  # pylint:disable=broad-except
-            print(f'[upload-metadata-error] {sample_name}', file=stderr)
+def metadata(uploader, columns,  # pylint:disable=too-many-arguments
+             workers, batch_size, metadata_csv, sample_names):
+    """Upload a CSV or TSV, optionally gzipped, metadata file."""
+    parsed_metadata = parse_metadata(metadata_csv, sample_names, columns=columns)
+    uploader.set_workers(workers)
+    results = uploader.upload_metadata(parsed_metadata, batch_size=batch_size)
+    if report_metadata_results(results):
+        exit(1)
 
 
 @upload.command()
 @add_authorization()
 @click.option('-g', '--group', default=None)
 @click.option('--group-name', default=None)
-def datasuper(uploader, group, group_name):
-    """Upload all samples from DataSuper repo."""
-    sample_source = DataSuperSource()
-    samples = sample_source.get_sample_payloads()
+@click.option('-s', '--sample', 'sample_names', multiple=True,
+              help='Sample to upload, repeat for several [default: all].')
+@click.option('-r', '--result-type', 'result_types', multiple=True,
+              help='Result type to upload, repeat for several [default: all].')
+@click.option('--modified-since', default=None, type=click.DateTime(),
+              help='Only upload results with a file modified since this time.')
+@click.option('--resolve-workers', default=RESOLVE_WORKERS,
+              help='Threads resolving sample file paths.')
+@add_parse_options()
+@add_upload_options()
+@add_trace_option()
+def datasuper(uploader, group, group_name,  # pylint:disable=too-many-arguments
+              sample_names, result_types, modified_since, resolve_workers,
+              parse_workers, parse_cache, validate_only, **upload_options):
+    """Upload samples from DataSuper repo."""
+    # datasuper is slow to import, only import it when uploading from it
+    from metagenscope_cli.sample_sources.data_super_source import DataSuperSource
 
-    batch_upload(uploader, samples, group_uuid=group, upload_group_name=group_name)
+    sample_source = DataSuperSource(sample_names=sample_names or None,
+                                    result_types=result_types or None,
+                                    modified_since=modified_since,
+                                    resolve_workers=resolve_workers)
+    if validate_only:
+        validate_all_results(sample_source, parse_workers=parse_workers,
+                             parse_cache=parse_cache)
+        return
+    batch_upload(uploader, sample_source, parse_workers=parse_workers, parse_cache=parse_cache,
+                 group_uuid=group, upload_group_name=group_name, **upload_options)
 
 
 @upload.command()
 @add_authorization()
 @click.option('-g', '--group', default=None)
+@click.option('--pattern', default=None,
+              help='Only upload files whose name matches this glob, eg. "*.mpa".')
+@click.option('--regex', default=None,
+              help='Only upload files whose name matches this regular expression.')
+@click.option('--manifest', default=None, type=click.File('r'),
+              help='File listing result files or directories, one per line, or - for stdin.')
+@click.option('--scan-workers', default=1, help='Threads scanning directories.')
+@add_parse_options()
+@add_upload_options()
+@add_trace_option()
 @click.argument('result_files', nargs=-1)
-def files(uploader, group, result_files):
-    """Upload all samples from llist of tool result files."""
-    sample_source = FileSource(files=result_files)
-    samples = sample_source.get_sample_payloads()
-
-    batch_upload(uploader, samples, group_uuid=group)
+def files(uploader, group, pattern,  # pylint:disable=too-many-arguments
+          regex, manifest, scan_workers, result_files,
+          parse_workers, parse_cache, validate_only, **upload_options):
+    """Upload all samples from tool result files and directories of them."""
+    paths = result_files
+    if manifest is not None:
+        paths = chain(result_files, read_manifest(manifest))
+    sample_source = FileSource(files=paths, pattern=pattern, regex=regex,
+                               scan_workers=scan_workers)
+    if validate_only:
+        validate_all_results(sample_source, parse_workers=parse_workers,
+                             parse_cache=parse_cache)
+        return
+    batch_upload(uploader, sample_source, parse_workers=parse_workers, parse_cache=parse_cache,
+                 group_uuid=group, **upload_options)
@@ -1,23 +1,43 @@
 """Utilities for MetaGenScope CLI."""
 
 import os
+from collections import Counter
 from sys import stderr
 from datetime import datetime
 from functools import wraps
 
 import click
-from requests.exceptions import HTTPError
+from click.core import ParameterSource
 
-from metagenscope_cli.network import Knex, Uploader
-from metagenscope_cli.network.token_auth import TokenAuth
-from metagenscope_cli.tools.parse_metadata import parse_metadata_from_csv
+from metagenscope_cli.constants import (DEFAULT_QUEUE_DEPTH, DEFAULT_ASYNC_CONCURRENCY,
+                                        DEFAULT_CHUNK_SIZE, DEFAULT_PARSE_CACHE_SIZE,
+                                        DEFAULT_REQUEST_TIMEOUT, DEFAULT_UPLOAD_WORKERS)
+from metagenscope_cli.tracing import start_tracing, stop_tracing
 
+# Networking, parsing and the local SQLite stores are imported by the
+# functions using them, so that loading a command stays fast
 
-def parse_metadata(filename, sample_names):
-    """Parse sample metadata."""
-    if filename[-4:] == '.csv':
-        return parse_metadata_from_csv(filename, sample_names)
-    raise ValueError(f'{filename} extension is unsupported')
+
+METADATA_DELIMITERS = {
+    '.csv': ',',
+    '.tsv': '\t',
+}
+
+
+def parse_metadata(filename, sample_names, columns=None):
+    """
+    Return an iterator of (sample_name, metadata) pairs from a CSV or TSV file.
+
+    Files may be gzipped. Every row is read if no sample names are given.
+    """
+    from metagenscope_cli.tools.parse_metadata import iter_metadata
+
+    extension = filename[:-3] if filename.endswith('.gz') else filename
+    delimiter = METADATA_DELIMITERS.get(extension[-4:])
+    if delimiter is None:
+        raise ValueError(f'{filename} extension is unsupported')
+    return iter_metadata(filename, sample_names=sample_names or None,
+                         columns=columns or None, delimiter=delimiter)
 
 
 def warn_missing_auth():
@@ -28,36 +48,386 @@ def warn_missing_auth():
                'MetaGenScope configuration file (see metagenscope login help).')
 
 
-def batch_upload(uploader, samples, group_uuid=None, upload_group_name=None):
-    """Batch upload a group of tool results, creating a new group for the upload."""
-    if group_uuid is None:
-        current_time = datetime.now().isoformat()
-        if upload_group_name is None:
-            upload_group_name = f'upload_group_{current_time}'
-        group_uuid = uploader.create_sample_group(upload_group_name)
-        click.echo(f'group created: <name: \'{upload_group_name}\' UUID: \'{group_uuid}\'>')
+def upload_all_results_async(uploader, group_uuid,  # pylint:disable=too-many-arguments
+                             samples, concurrency, queue_depth, sample_uuids=None):
+    """
+    Upload all results on an event loop instead of the uploader thread pool.
+
+    Returns the results and the AsyncKnex that sent them.
+    """
+    # aiohttp is an optional dependency, only import it when asked to
+    from metagenscope_cli.network.async_knex import AsyncKnex
+    from metagenscope_cli.network.async_uploader import AsyncUploader
+
+    async_knex = AsyncKnex.from_knex(uploader.knex, concurrency=concurrency)
+    async_uploader = AsyncUploader(async_knex, journal=uploader.journal, force=uploader.force,
+                                   uuid_cache=uploader.uuid_cache)
+    results = async_uploader.run_all_results(group_uuid, samples, queue_depth=queue_depth,
+                                             sample_uuids=sample_uuids)
+    return results, async_knex
+
+
+def batch_upload(uploader, sample_source,  # pylint:disable=too-many-arguments,too-many-locals
+                 parse_workers=1, parse_cache=None, group_uuid=None,
+                 upload_group_name=None, queue_depth=DEFAULT_QUEUE_DEPTH,
+                 async_upload=False, concurrency=DEFAULT_ASYNC_CONCURRENCY,
+                 workers=DEFAULT_UPLOAD_WORKERS, max_in_flight=None, force=False,
+                 compress=False, retries=0, timeout=DEFAULT_REQUEST_TIMEOUT, adaptive=False,
+                 chunk_size=DEFAULT_CHUNK_SIZE, bulk_create=False, run_middleware=False):
+    """
+    Batch upload a group of tool results, creating a new group for the upload.
+
+    With `bulk_create` the whole catalog is listed first and its samples
+    created or found in bulk, before any result is parsed. With
+    `run_middleware` the group's middleware is run once the upload is done.
+    """
+    from requests.exceptions import RequestException
+    from metagenscope_cli.journal import JOURNAL_FILENAME, UploadJournal
+    from metagenscope_cli.network.limiter import AdaptiveLimiter
+    from metagenscope_cli.network.uploader import SAMPLE_WORKERS
+
+    # Sample creation threads need connections alongside the upload workers
+    uploader.set_workers(workers, max_in_flight=max_in_flight, extra_connections=SAMPLE_WORKERS)
+    uploader.knex.compress = compress
+    uploader.knex.retries = retries
+    uploader.knex.timeout = timeout
+    if adaptive:
+        initial = min(workers, DEFAULT_UPLOAD_WORKERS)
+        uploader.knex.limiter = AdaptiveLimiter(initial, maximum=workers + SAMPLE_WORKERS)
+    journal = UploadJournal(JOURNAL_FILENAME)
+    uploader.journal = journal
+    uploader.force = force
+    uploader.chunk_size = chunk_size * 1024 * 1024
+    try:
+        if group_uuid is None:
+            current_time = datetime.now().isoformat()
+            if upload_group_name is None:
+                upload_group_name = f'upload_group_{current_time}'
+            group_uuid = uploader.create_sample_group(upload_group_name)
+            click.echo(f'group created: <name: \'{upload_group_name}\' UUID: \'{group_uuid}\'>')
+
+        results = []
+        # Requests carrying the results, whose connection reuse is reported
+        transport = uploader.knex
+        try:
+            sample_uuids = None
+            if bulk_create:
+                sample_source, sample_uuids = create_all_samples(uploader, sample_source,
+                                                                 group_uuid)
+            samples = sample_source.iter_sample_payloads(parse_workers=parse_workers,
+                                                         parse_cache=parse_cache)
+            if async_upload:
+                results, transport = upload_all_results_async(uploader, group_uuid, samples,
+                                                              concurrency, queue_depth,
+                                                              sample_uuids=sample_uuids)
+            else:
+                results = uploader.upload_all_results(group_uuid, samples,
+                                                      queue_depth=queue_depth,
+                                                      sample_uuids=sample_uuids)
+        except RequestException as error:
+            click.echo('Could not create Sample', err=True)
+            click.echo(error, err=True)
+
+        report_upload_results(results)
+        click.echo(f'group info: <name: \'{upload_group_name}\' UUID: \'{group_uuid}\'>')
+        if run_middleware:
+            run_group_middleware(uploader, group_uuid)
+        report_connection_stats(transport)
+        report_body_stats(uploader.knex)
+        if uploader.knex.limiter is not None:
+            report_limiter_stats(uploader.knex.limiter)
+    finally:
+        journal.close()
+
+
+def create_all_samples(uploader, sample_source, group_uuid):
+    """
+    Catalog every sample up front and create or find them all in bulk.
+
+    Returns a source yielding the same catalog and the name to UUID map.
+    """
+    from metagenscope_cli.sample_sources import CatalogSource
+
+    cataloged_files = list(sample_source.iter_cataloged_files())
+    sample_names = [sample_name for sample_name, _ in cataloged_files]
+    sample_uuids = uploader.create_samples(sample_names, group_uuid)
+    click.echo(f'samples: <created or found: {len(sample_uuids)} '
+               f'failed: {len(sample_names) - len(sample_uuids)}>', err=True)
+    return CatalogSource(cataloged_files), sample_uuids
+
+
+def run_group_middleware(uploader, group_uuid):
+    """Run a group's middleware, reporting whether it started."""
+    from requests.exceptions import HTTPError
 
     try:
-        results = uploader.upload_all_results(group_uuid, samples)
+        uploader.run_group_middleware(group_uuid)
+        click.echo(f'group middleware: <UUID: \'{group_uuid}\'>')
     except HTTPError as error:
-        click.echo('Could not create Sample', err=True)
+        click.echo('Could not run group middleware', err=True)
         click.echo(error, err=True)
 
-    if results:
-        click.echo('Upload results:')
-        for result in results:
-            sample_uuid = result['sample_uuid']
-            sample_name = result['sample_name']
-            result_type = result['result_type']
-
-            if result['type'] == 'error':
-                exception = result['exception']
-                click.secho(f'  - {sample_name} ({sample_uuid}): {result_type}',
-                            fg='red', err=True)
-                click.secho(f'    {exception}', fg='red', err=True)
-            else:
-                click.secho(f'  - {sample_name} ({sample_uuid}): {result_type}', fg='green')
-    click.echo(f'group info: <name: \'{upload_group_name}\' UUID: \'{group_uuid}\'>')
+
+def validate_all_results(sample_source, parse_workers=1, parse_cache=None):
+    """Parse and validate every result without uploading, failing if any is invalid."""
+    from metagenscope_cli.sample_sources import report_errors
+
+    failures = []
+
+    def report(errors):
+        """Report a sample's errors and count them."""
+        report_errors(errors)
+        failures.extend(errors)
+
+    samples = 0
+    results = 0
+    for _, tool_results in sample_source.iter_sample_payloads(parse_workers=parse_workers,
+                                                              parse_cache=parse_cache,
+                                                              report=report):
+        samples += 1
+        results += len(tool_results)
+    click.echo(f'validation: <samples: {samples} valid: {results} invalid: {len(failures)}>')
+    if failures:
+        raise click.ClickException(f'{len(failures)} results failed to parse or validate')
+
+
+def report_upload_results(results):
+    """Report the outcome of every result upload."""
+    if not results:
+        return
+    click.echo('Upload results:')
+    for result in results:
+        sample_uuid = result['sample_uuid']
+        sample_name = result['sample_name']
+        result_type = result['result_type']
+
+        if result['type'] == 'error':
+            exception = result['exception']
+            click.secho(f'  - {sample_name} ({sample_uuid}): {result_type}',
+                        fg='red', err=True)
+            click.secho(f'    {exception}', fg='red', err=True)
+        elif result['type'] == 'skipped':
+            click.secho(f'  - {sample_name} ({sample_uuid}): {result_type} (unchanged)',
+                        fg='yellow')
+        else:
+            click.secho(f'  - {sample_name} ({sample_uuid}): {result_type}', fg='green')
+
+
+def report_metadata_results(results):
+    """Report failed metadata uploads and a count of every outcome, returning the failures."""
+    failures = [result for result in results if result['type'] == 'error']
+    for result in failures:
+        click.secho(f'[upload-metadata-error] {result["sample_name"]} :: {result["exception"]}',
+                    fg='red', err=True)
+    click.echo(f'metadata: <uploaded: {len(results) - len(failures)} '
+               f'failed: {len(failures)}>')
+    return failures
+
+
+def report_middleware_results(results):
+    """Report samples whose middleware failed to run and a count of every outcome."""
+    failures = [result for result in results if result['type'] == 'error']
+    for result in failures:
+        click.secho(f'[middleware-error] {result["sample_name"]} :: {result["exception"]}',
+                    fg='red', err=True)
+    click.echo(f'middleware: <started: {len(results) - len(failures)} '
+               f'failed: {len(failures)}>')
+    return failures
+
+
+def middleware_status_name(status):
+    """Name a middleware status, or the exception raised fetching it."""
+    if isinstance(status, Exception):
+        return 'unreachable'
+    return 'waiting' if status is None else status
+
+
+def report_middleware_progress(statuses):
+    """Report how many samples are in each middleware status."""
+    counts = Counter(middleware_status_name(status) for status in statuses.values())
+    summary = ' '.join(f'{name}: {count}' for name, count in sorted(counts.items()))
+    click.echo(f'[middleware {datetime.now()}] <{summary}>', err=True)
+
+
+def report_middleware_statuses(sample_names_by_uuid, statuses):
+    """Report, and return, every sample whose middleware did not succeed."""
+    unsuccessful = [sample_uuid for sample_uuid, status in statuses.items()
+                    if status != 'success']
+    for sample_uuid in unsuccessful:
+        status = statuses[sample_uuid]
+        name = middleware_status_name(status)
+        detail = f' :: {status}' if isinstance(status, Exception) else ''
+        click.secho(f'[middleware-{name}] {sample_names_by_uuid[sample_uuid]}{detail}',
+                    fg='red', err=True)
+    click.echo(f'middleware finished: <success: {len(statuses) - len(unsuccessful)} '
+               f'other: {len(unsuccessful)}>')
+    return unsuccessful
+
+
+def report_download_results(results):
+    """Report failed downloads and a count of every outcome."""
+    counts = Counter(result['type'] for result in results)
+    for result in results:
+        if result['type'] == 'error':
+            click.secho(f'[download-error] {result["name"]} :: {result["result_type"]} :: '
+                        f'{result["exception"]}', fg='red', err=True)
+    click.echo(f'downloads: <downloaded: {counts["success"]} '
+               f'skipped: {counts["skipped"]} failed: {counts["error"]}>')
+
+
+def report_connection_stats(knex):
+    """Report how many requests reused a pooled connection."""
+    stats = knex.connection_stats()
+    click.echo(f'connections: <requests: {stats["requests"]} '
+               f'new: {stats["new_connections"]} '
+               f'reused: {stats["reused_connections"]}>', err=True)
+
+
+def report_body_stats(knex):
+    """Report request body sizes before and after compression."""
+    stats = knex.body_stats.summary()
+    click.echo(f'bodies: <requests: {stats["requests"]} '
+               f'raw: {stats["raw_bytes"]}B '
+               f'sent: {stats["sent_bytes"]}B '
+               f'ratio: {stats["ratio"]:.3f}>', err=True)
+
+
+def report_limiter_stats(limiter):
+    """Report the final adaptive request limit and observed latencies."""
+    stats = limiter.summary()
+    latencies = ' '.join(
+        f'{name}: {stats[name]:.3f}s' if stats[name] is not None else f'{name}: n/a'
+        for name in ['p50', 'p90', 'p99']
+    )
+    click.echo(f'limiter: <limit: {stats["limit"]} {latencies}>', err=True)
+
+
+def report_trace_summary(summary):
+    """Report time spent per traced stage and per result type."""
+    for heading, totals in [('stage', summary['stages']),
+                            ('result_type', summary['result_types'])]:
+        click.echo(f'{heading}\tspans\tseconds', err=True)
+        for key, total in sorted(totals.items(), key=lambda item: -item[1]['seconds']):
+            click.echo(f'{key}\t{total["count"]}\t{total["seconds"]:.3f}', err=True)
+
+
+def add_trace_option():
+    """Add a --trace option writing a timeline of the command."""
+    def decorator(command):
+        """Empty wrapper around decoration to be consistent with Click style."""
+        @click.option('--trace', 'trace_filename', default=None,
+                      help='Write a Chrome trace (chrome://tracing, Perfetto) of the run '
+                           'to this file and summarize time per stage.')
+        @wraps(command)
+        def wrapper(*args, trace_filename, **kwargs):
+            """Wrap command with span tracing, if wanted."""
+            if trace_filename is None:
+                return command(*args, **kwargs)
+            tracer = start_tracing()
+            try:
+                return command(*args, **kwargs)
+            finally:
+                stop_tracing()
+                tracer.write(trace_filename)
+                report_trace_summary(tracer.summary())
+        return wrapper
+    return decorator
+
+
+def add_parse_options():
+    """Add options controlling how tool results are parsed, passing a parse_cache."""
+    def decorator(command):
+        """Empty wrapper around decoration to be consistent with Click style."""
+        @click.option('--validate-only', is_flag=True,
+                      help='Parse and validate results offline, without uploading them.')
+        @click.option('--parse-workers', default=1,
+                      help='Processes used to parse tool results.')
+        @click.option('--parse-cache/--no-parse-cache', 'use_parse_cache', default=True,
+                      help='Reuse results parsed by earlier runs.')
+        @click.option('--parse-cache-size', default=DEFAULT_PARSE_CACHE_SIZE,
+                      help='Parse cache size in megabytes.')
+        @wraps(command)
+        def wrapper(*args, use_parse_cache, parse_cache_size, **kwargs):
+            """Wrap command with an open ParseCache, if wanted."""
+            from metagenscope_cli.tools.parse_cache import ParseCache, PARSE_CACHE_FILENAME
+
+            if not use_parse_cache:
+                return command(*args, parse_cache=None, **kwargs)
+            parse_cache = ParseCache(PARSE_CACHE_FILENAME, max_size=parse_cache_size)
+            try:
+                return command(*args, parse_cache=parse_cache, **kwargs)
+            finally:
+                parse_cache.close()
+        return wrapper
+    return decorator
+
+
+# Options the event loop uploader does not honour, by parameter name
+ASYNC_UNSUPPORTED_OPTIONS = {
+    'retries': '--retries',
+    'adaptive': '--adaptive',
+    'chunk_size': '--chunk-size',
+}
+
+
+def reject_async_unsupported(command):
+    """Wrap command to refuse options given alongside --async-upload that it would ignore."""
+    @wraps(command)
+    def wrapper(*args, **kwargs):
+        """Raise a UsageError if --async-upload is combined with an unsupported option."""
+        if kwargs.get('async_upload'):
+            context = click.get_current_context()
+            given = [flag for name, flag in ASYNC_UNSUPPORTED_OPTIONS.items()
+                     if context.get_parameter_source(name) != ParameterSource.DEFAULT]
+            if given:
+                raise click.UsageError(f'--async-upload does not support {", ".join(given)}')
+        return command(*args, **kwargs)
+    return wrapper
+
+
+def add_upload_options():
+    """Add options controlling how tool results are uploaded."""
+    def decorator(command):
+        """Empty wrapper around decoration to be consistent with Click style."""
+        command = reject_async_unsupported(command)
+        options = [
+            click.option('--queue-depth', default=DEFAULT_QUEUE_DEPTH,
+                         help='Parsed samples allowed to wait for upload.'),
+            click.option('--workers', default=DEFAULT_UPLOAD_WORKERS, type=click.IntRange(min=1),
+                         help='Threads uploading results.'),
+            click.option('--max-in-flight', default=None, type=click.IntRange(min=1),
+                         help='Results waiting to upload at once [default: twice --workers].'),
+            click.option('--force', is_flag=True,
+                         help='Upload results even if the local journal has them.'),
+            click.option('--compress', is_flag=True,
+                         help='Gzip request bodies.'),
+            click.option('--retries', default=2,
+                         help='Times to resend a request after a connection failure '
+                              '(not with --async-upload).'),
+            click.option('--timeout', default=DEFAULT_REQUEST_TIMEOUT,
+                         type=click.FloatRange(min=0, min_open=True),
+                         help='Seconds to wait on connecting to, or hearing back from, '
+                              'the server before resending a request.'),
+            click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE,
+                         help='Upload results larger than this many megabytes in '
+                              'resumable chunks of that size (not with --async-upload).'),
+            click.option('--bulk-create', is_flag=True,
+                         help='Create or find every sample in batches before uploading results.'),
+            click.option('--run-middleware', is_flag=True,
+                         help='Run middleware for the group once the upload is done.'),
+            click.option('--adaptive', is_flag=True,
+                         help='Adapt requests in flight to server latency and overload, '
+                              'up to --workers (not with --async-upload).'),
+            click.option('--async-upload', is_flag=True,
+                         help='Upload from an event loop instead of threads (needs aiohttp).'),
+            click.option('--concurrency', default=DEFAULT_ASYNC_CONCURRENCY,
+                         type=click.IntRange(min=1),
+                         help='Requests in flight when using --async-upload.'),
+        ]
+        for option in reversed(options):
+            command = option(command)
+        return command
+    return decorator
 
 
 def add_authorization():
@@ -69,6 +439,14 @@ def add_authorization():
         @wraps(command)
         def wrapper(host, auth_token, *args, **kwargs):
             """Wrap command with authorized Uploader creation."""
+            if kwargs.get('validate_only'):
+                # Validation is offline, it needs neither a host nor a token
+                return command(None, *args, **kwargs)
+
+            from metagenscope_cli.network import Knex, Uploader
+            from metagenscope_cli.network.token_auth import TokenAuth
+            from metagenscope_cli.uuid_cache import UuidCache, UUID_CACHE_FILENAME
+
             try:
                 auth = TokenAuth(jwt_token=auth_token)
             except KeyError:
@@ -81,9 +459,12 @@ def add_authorization():
                     print('No host. Exiting', file=stderr)
                     exit(1)
 
-            knex = Knex(token_auth=auth, host=host)
-            uploader = Uploader(knex=knex)
-
-            return command(uploader, *args, **kwargs)
+            uuid_cache = UuidCache(UUID_CACHE_FILENAME)
+            try:
+                with Knex(token_auth=auth, host=host) as knex:
+                    uploader = Uploader(knex=knex, uuid_cache=uuid_cache)
+                    return command(uploader, *args, **kwargs)
+            finally:
+                uuid_cache.close()
         return wrapper
     return decorator
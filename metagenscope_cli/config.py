@@ -13,13 +13,20 @@ class MetagenscopeConfiguration(object):
     """MetaGenScope configuration."""
 
     def __init__(self, filename, dirname='~'):
-        """Load configuration file, if it exists."""
-        self.config = configparser.ConfigParser()
+        """Locate configuration file, which is only read once needed."""
+        self.parsed_config = None
 
         expanded_dirname = os.path.expanduser(dirname)
         self.configuration_filename = os.path.join(expanded_dirname, filename)
-        if os.path.isfile(self.configuration_filename):
-            self.config.read(self.configuration_filename)
+
+    @property
+    def config(self):
+        """Return the configuration, loading the file, if it exists, on first use."""
+        if self.parsed_config is None:
+            self.parsed_config = configparser.ConfigParser()
+            if os.path.isfile(self.configuration_filename):
+                self.parsed_config.read(self.configuration_filename)
+        return self.parsed_config
 
     def get_token(self, **kwargs):
         """Return stored authorization token, if it exists."""
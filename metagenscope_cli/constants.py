@@ -1,3 +1,21 @@
 """Constants for MetaGenScope CLI tool."""
 
 DEFAULT_HOST = 'https://www.metagenscope.com'
+
+# Number of parsed samples allowed to wait for upload
+DEFAULT_QUEUE_DEPTH = 4
+
+# Concurrent result uploads, and pooled connections to serve them
+DEFAULT_UPLOAD_WORKERS = 5
+
+# Seconds to wait on connecting to, or hearing back from, the server
+DEFAULT_REQUEST_TIMEOUT = 120
+
+# Requests in flight when uploading from an event loop
+DEFAULT_ASYNC_CONCURRENCY = 64
+
+# Megabytes of parsed results kept in the parse cache
+DEFAULT_PARSE_CACHE_SIZE = 1024
+
+# Results encoding to more megabytes are uploaded in chunks of this size
+DEFAULT_CHUNK_SIZE = 8
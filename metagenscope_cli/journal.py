@@ -0,0 +1,119 @@
+"""Local journal of uploaded results, used to resume interrupted uploads."""
+from __future__ import absolute_import
+
+import os.path
+import sqlite3
+from hashlib import sha256
+from json import dumps
+from threading import Lock
+
+
+JOURNAL_FILENAME = '.metagenscope_journal.sqlite'
+
+UPLOADED = 'uploaded'
+DRYRUN = 'dryrun'
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS sample_uuids (
+        host TEXT, sample_name TEXT, sample_uuid TEXT,
+        PRIMARY KEY (host, sample_name))''',
+    '''CREATE TABLE IF NOT EXISTS uploaded_results (
+        host TEXT, sample_name TEXT, result_type TEXT,
+        content_hash TEXT, outcome TEXT, uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (host, sample_name, result_type))''',
+]
+
+
+def content_hash(data):
+    """Return a stable hash of a result payload."""
+    serialized = dumps(data, sort_keys=True).encode('utf-8')
+    return sha256(serialized).hexdigest()
+
+
+class UploadJournal(object):
+    """
+    Journal of samples created and results uploaded, stored in SQLite.
+
+    Results are keyed by host, sample name and result type and remember
+    the hash of the payload that was sent, so a rerun only sends results
+    that are new or have changed, even when it uploads to a new group:
+    results belong to samples, which the server names uniquely. A journal
+    may be shared by uploader threads.
+    """
+
+    def __init__(self, filename, dirname='~'):
+        """Open journal file, creating it if needed."""
+        expanded_dirname = os.path.expanduser(dirname)
+        self.journal_filename = os.path.join(expanded_dirname, filename)
+        self.lock = Lock()
+        self.connection = sqlite3.connect(self.journal_filename, check_same_thread=False)
+        with self.lock, self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+
+    def close(self):
+        """Close the journal file."""
+        self.connection.close()
+
+    def get_sample_uuid(self, host, sample_name):
+        """Return the UUID of a sample created earlier, or None."""
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT sample_uuid FROM sample_uuids WHERE host = ? AND sample_name = ?',
+                (host, sample_name)
+            ).fetchone()
+        return row[0] if row else None
+
+    def record_sample(self, host, sample_name, sample_uuid):
+        """Record the UUID of a created sample."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO sample_uuids VALUES (?, ?, ?)',
+                (host, sample_name, sample_uuid)
+            )
+
+    def is_uploaded(self, key, digest, dryrun=False):
+        """
+        Return True if the result identified by `key` was sent with this content.
+
+        `key` is a (host, sample_name, result_type) tuple. Results
+        only sent as dry runs count as uploaded for later dry runs only.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT content_hash, outcome FROM uploaded_results '
+                'WHERE host = ? AND sample_name = ? AND result_type = ?',
+                key
+            ).fetchone()
+        if row is None or row[0] != digest:
+            return False
+        return row[1] == UPLOADED or (dryrun and row[1] == DRYRUN)
+
+    def record_result(self, key, digest, dryrun=False):
+        """Record a successful upload of the result identified by `key`."""
+        outcome = DRYRUN if dryrun else UPLOADED
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO uploaded_results '
+                '(host, sample_name, result_type, content_hash, outcome) '
+                'VALUES (?, ?, ?, ?, ?)',
+                tuple(key) + (digest, outcome)
+            )
+
+    def split_results(self, key_prefix, tool_results, dryrun=False):
+        """
+        Split tool results into those to upload and those already uploaded.
+
+        `key_prefix` is a (host, sample_name) tuple. Returns a
+        list of (tool_result, digest) pairs to upload and a list of unchanged
+        tool results.
+        """
+        pending, unchanged = [], []
+        for tool_result in tool_results:
+            digest = content_hash(tool_result['data'])
+            key = tuple(key_prefix) + (tool_result['result_type'],)
+            if self.is_uploaded(key, digest, dryrun=dryrun):
+                unchanged.append(tool_result)
+            else:
+                pending.append((tool_result, digest))
+        return pending, unchanged
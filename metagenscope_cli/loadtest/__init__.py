@@ -0,0 +1,3 @@
+"""Load testing against a local fake MetaGenScope server."""
+
+from .fake_server import FakeMetaGenScope, FAKE_TOKEN
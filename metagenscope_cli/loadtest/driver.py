@@ -0,0 +1,116 @@
+"""Drive result uploads against a MetaGenScope server and measure throughput."""
+
+from threading import Lock
+from time import perf_counter
+
+from metagenscope_cli.constants import DEFAULT_UPLOAD_WORKERS
+from metagenscope_cli.network import Knex, Uploader
+from metagenscope_cli.network.limiter import AdaptiveLimiter
+from metagenscope_cli.network.token_auth import TokenAuth
+from metagenscope_cli.network.uploader import SAMPLE_WORKERS
+from metagenscope_cli.sample_sources import parse_sample
+from metagenscope_cli.tools.synthetic import write_result_files
+
+from .fake_server import FAKE_TOKEN
+
+
+LOAD_TEST_RESULT_TYPES = [
+    'kraken_taxonomy_profiling',
+    'align_to_amr_genes',
+    'humann2_normalize_genes',
+    'microbe_census',
+    'read_stats',
+]
+
+
+def percentile(values, fraction):
+    """Return the value at `fraction` of sorted values, or None if there are none."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class TimedKnex(Knex):
+    """Knex recording the latency of every request, retries included."""
+
+    def __init__(self, *args, **kwargs):
+        """Instantiate TimedKnex with no recorded latencies."""
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+        self.latency_lock = Lock()
+
+    def send(self, method, endpoint, headers=None, body=None, stream=False):
+        """Send a request, recording how long it took."""
+        start = perf_counter()
+        try:
+            return super().send(method, endpoint, headers=headers, body=body, stream=stream)
+        finally:
+            with self.latency_lock:
+                self.latencies.append(perf_counter() - start)
+
+
+def synthetic_samples(dirname, samples, rows, result_types=None):
+    """Write and parse synthetic results, returning (sample_name, tool_results) pairs."""
+    result_types = result_types or LOAD_TEST_RESULT_TYPES
+    parsed = []
+    for index in range(samples):
+        sample_name = f'load_sample_{index}'
+        sample_schema = {
+            result_type: write_result_files(result_type, dirname, rows=rows, seed=index,
+                                            sample_name=sample_name)
+            for result_type in result_types
+        }
+        tool_results, _ = parse_sample(sample_name, sample_schema)
+        parsed.append((sample_name, tool_results))
+    return parsed
+
+
+def load_test_limiter(workers):
+    """Return an AdaptiveLimiter for a load test over `workers` threads."""
+    return AdaptiveLimiter(min(workers, DEFAULT_UPLOAD_WORKERS),
+                           maximum=workers + SAMPLE_WORKERS)
+
+
+def load_test_stats(knex, workers, results, seconds):
+    """Return request, byte and latency statistics for a load test run."""
+    requests_made = len(knex.latencies)
+    sent_bytes = knex.body_stats.summary()['sent_bytes']
+    return {
+        'workers': workers,
+        'results': len(results),
+        'errors': sum(1 for result in results if result['type'] == 'error'),
+        'seconds': seconds,
+        'requests': requests_made,
+        'requests_per_second': requests_made / seconds,
+        'sent_bytes': sent_bytes,
+        'bytes_per_second': sent_bytes / seconds,
+        'p50': percentile(knex.latencies, 0.5),
+        'p90': percentile(knex.latencies, 0.9),
+        'p99': percentile(knex.latencies, 0.99),
+    }
+
+
+def run_load_test(host, samples, workers,  # pylint:disable=too-many-arguments
+                  run_name='load', auth_token=FAKE_TOKEN, compress=False, retries=2,
+                  adaptive=False):
+    """
+    Upload parsed samples into a new group over `workers` threads.
+
+    Sample names are prefixed with `run_name` so repeated runs against one
+    server create fresh samples. The upload is set up as batch_upload sets
+    it up, without the journal or UUID cache so every result is sent.
+    Returns request, byte and latency statistics for the run.
+    """
+    knex = TimedKnex(TokenAuth(jwt_token=auth_token), host=host,
+                     pool_size=workers + SAMPLE_WORKERS, compress=compress,
+                     retries=retries, limiter=load_test_limiter(workers) if adaptive else None)
+    with knex:
+        uploader = Uploader(knex, max_workers=workers)
+        named_samples = [(f'{run_name}_{sample_name}', tool_results)
+                         for sample_name, tool_results in samples]
+
+        start = perf_counter()
+        group_uuid = uploader.create_sample_group(f'{run_name}_group')
+        results = uploader.upload_all_results(group_uuid, named_samples)
+        return load_test_stats(knex, workers, results, perf_counter() - start)
@@ -0,0 +1,433 @@
+"""Local stand-in for the MetaGenScope server endpoints used by the CLI."""
+
+import gzip
+import hashlib
+import json
+import re
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from random import Random
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+from time import monotonic, sleep
+from uuid import uuid4
+
+
+FAKE_TOKEN = 'fake-token'
+
+
+class RequestStats:
+    """Counts of the requests answered by a fake server."""
+
+    def __init__(self):
+        """Start with no requests."""
+        self.lock = Lock()
+        self.requests = 0
+        self.bytes_received = 0
+        self.status_counts = {}
+
+    def record(self, status, body_size):
+        """Record a handled request."""
+        with self.lock:
+            self.requests += 1
+            self.bytes_received += body_size
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    def summary(self):
+        """Return request statistics."""
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'bytes_received': self.bytes_received,
+                'status_counts': dict(self.status_counts),
+            }
+
+
+class FakeState(object):
+    """Samples, groups and request statistics held by a fake server."""
+
+    def __init__(self):
+        """Start with no samples or groups."""
+        self.lock = Lock()
+        self.sample_groups = {}
+        self.samples = {}
+        self.results = {}
+        self.uploads = {}
+        self.middleware = {}
+        self.stats = RequestStats()
+
+    def record(self, status, body_size):
+        """Record a handled request."""
+        self.stats.record(status, body_size)
+
+    def summary(self):
+        """Return request statistics."""
+        summary = self.stats.summary()
+        with self.lock:
+            summary['samples'] = len(self.samples)
+            summary['results'] = len(self.results)
+        return summary
+
+
+ROUTES = []
+
+
+def handles(method, pattern):
+    """Register a handler method for requests matching a path pattern."""
+    def decorator(func):
+        """Add the handler method to ROUTES."""
+        ROUTES.append((method, re.compile(f'^{pattern}$'), func))
+        return func
+    return decorator
+
+
+class SampleRoutesMixin:
+    """Answer requests about sample groups, samples and middleware."""
+
+    @handles('POST', r'/api/v1/sample_groups')
+    def create_sample_group(self, payload):
+        """Create a sample group."""
+        state = self.server.state
+        with state.lock:
+            group_uuid = state.sample_groups.setdefault(payload['name'], str(uuid4()))
+        return 201, {'sample_group': {'uuid': group_uuid, 'name': payload['name']}}, None
+
+    @handles('GET', r'/api/v1/sample_groups/getid/([^/]+)')
+    def get_sample_group_uuid(self, _payload, group_name):
+        """Return the UUID of a sample group."""
+        group_uuid = self.server.state.sample_groups.get(group_name)
+        if group_uuid is None:
+            return 404, {'message': 'Sample group does not exist'}, None
+        return 200, {'sample_group_name': group_name, 'sample_group_uuid': group_uuid}, None
+
+    @handles('POST', r'/api/v1/samples')
+    def create_sample(self, payload):
+        """Create a sample, failing if the name is taken."""
+        state = self.server.state
+        with state.lock:
+            if payload['name'] in state.samples:
+                return 400, {'message': 'Duplicate sample name'}, None
+            sample_uuid = state.samples[payload['name']] = str(uuid4())
+        return 201, {'sample': {'uuid': sample_uuid, 'name': payload['name']}}, None
+
+    @handles('POST', r'/api/v1/samples/bulk')
+    def bulk_create_samples(self, payload):
+        """Create or find many samples, if bulk endpoints are enabled."""
+        if not self.server.options['bulk']:
+            return 404, {'message': 'Not found'}, None
+        state = self.server.state
+        with state.lock:
+            samples = [{'name': entry['name'],
+                        'uuid': state.samples.setdefault(entry['name'], str(uuid4()))}
+                       for entry in payload['samples']]
+        return 200, {'samples': samples}, None
+
+    @handles('GET', r'/api/v1/samples/getid/([^/]+)')
+    def get_sample_uuid(self, _payload, sample_name):
+        """Return the UUID of a sample."""
+        sample_uuid = self.server.state.samples.get(sample_name)
+        if sample_uuid is None:
+            return 404, {'message': 'Sample does not exist'}, None
+        return 200, {'sample_name': sample_name, 'sample_uuid': sample_uuid}, None
+
+    @handles('POST', r'/api/v1/samples/metadata')
+    def sample_metadata(self, payload):
+        """Accept sample metadata."""
+        if payload.get('sample_name') not in self.server.state.samples:
+            return 404, {'message': 'Sample does not exist'}, None
+        return 200, {'sample_name': payload['sample_name']}, None
+
+    @handles('POST', r'/api/v1/samples/metadata/bulk')
+    def bulk_sample_metadata(self, payload):
+        """Accept metadata for many samples, if bulk endpoints are enabled."""
+        if not self.server.options['bulk']:
+            return 404, {'message': 'Not found'}, None
+        samples = self.server.state.samples
+        missing = [entry['sample_name'] for entry in payload['samples']
+                   if entry['sample_name'] not in samples]
+        if missing:
+            return 400, {'message': f'Samples do not exist: {missing}'}, None
+        return 200, {'sample_names': [entry['sample_name'] for entry in payload['samples']]}, None
+
+    @handles('POST', r'/api/v1/(samples|sample_groups)/([^/]+)/middleware')
+    def middleware(self, _payload, kind, uuid):
+        """Accept a middleware request, which completes after the configured duration."""
+        state = self.server.state
+        with state.lock:
+            state.middleware[(kind, uuid)] = monotonic() + self.server.options['middleware_time']
+        return 202, {'uuid': uuid, 'kind': kind}, None
+
+    @handles('GET', r'/api/v1/(samples|sample_groups)/([^/]+)/middleware')
+    def middleware_status(self, _payload, kind, uuid):
+        """Return the status of a middleware request."""
+        done_at = self.server.state.middleware.get((kind, uuid))
+        if done_at is None:
+            return 404, {'message': 'Middleware was not run'}, None
+        status = 'success' if monotonic() >= done_at else 'pending'
+        return 200, {'uuid': uuid, 'kind': kind, 'status': status}, None
+
+
+class ResultRoutesMixin:
+    """Answer requests about tool results, uploaded whole or in chunks."""
+
+    @handles('POST', r'/api/v1/samples/([0-9a-f-]{36})/([a-z0-9_]+)')
+    def sample_result(self, payload, sample_uuid, result_type):
+        """Accept a tool result for a sample."""
+        state = self.server.state
+        with state.lock:
+            if sample_uuid not in state.samples.values():
+                return 404, {'message': 'Sample does not exist'}, None
+            state.results[(sample_uuid, result_type)] = len(payload)
+        return 201, {'sample_uuid': sample_uuid, 'result_type': result_type}, None
+
+    @handles('GET', r'/api/v1/samples/([0-9a-f-]{36})/([a-z0-9_]+)')
+    def get_sample_result(self, _payload, sample_uuid, result_type):
+        """Return a summary of a tool result uploaded for a sample."""
+        keys = self.server.state.results.get((sample_uuid, result_type))
+        if keys is None:
+            return 404, {'message': 'Result does not exist'}, None
+        return 200, {'sample_uuid': sample_uuid, 'result_type': result_type, 'keys': keys}, None
+
+    @handles('GET', r'/api/v1/sample_groups/([0-9a-f-]{36})/([a-z0-9_]+)')
+    def get_sample_group_result(self, _payload, group_uuid, result_type):
+        """Return a group analysis result, available once the group's middleware has run."""
+        if ('sample_groups', group_uuid) not in self.server.state.middleware:
+            return 404, {'message': 'Result does not exist'}, None
+        return 200, {'sample_group_uuid': group_uuid, 'result_type': result_type}, None
+
+    @handles('POST', r'/api/v1/samples/([0-9a-f-]{36})/([a-z0-9_]+)/uploads')
+    def start_chunked_upload(self, _payload, sample_uuid, result_type):
+        """Start a chunked upload of a tool result, if chunked uploads are enabled."""
+        if not self.server.options['chunked']:
+            return 404, {'message': 'Not found'}, None
+        state = self.server.state
+        with state.lock:
+            if sample_uuid not in state.samples.values():
+                return 404, {'message': 'Sample does not exist'}, None
+            upload_id = str(uuid4())
+            state.uploads[upload_id] = {'sample_uuid': sample_uuid,
+                                        'result_type': result_type,
+                                        'chunks': {}}
+        return 201, {'upload_id': upload_id}, None
+
+    @handles('POST', r'/api/v1/uploads/([0-9a-f-]{36})/chunks/([0-9]+)')
+    def upload_chunk(self, payload, upload_id, index):
+        """Store a chunk of a chunked upload."""
+        upload = self.server.state.uploads.get(upload_id)
+        if upload is None:
+            return 404, {'message': 'Upload does not exist'}, None
+        upload['chunks'][int(index)] = payload
+        return 200, {'upload_id': upload_id, 'received': int(index)}, None
+
+    @handles('GET', r'/api/v1/uploads/([0-9a-f-]{36})')
+    def chunked_upload_status(self, _payload, upload_id):
+        """Return the chunks received by a chunked upload."""
+        upload = self.server.state.uploads.get(upload_id)
+        if upload is None:
+            return 404, {'message': 'Upload does not exist'}, None
+        return 200, {'upload_id': upload_id, 'received': sorted(upload['chunks'])}, None
+
+    @handles('POST', r'/api/v1/uploads/([0-9a-f-]{36})/complete')
+    def complete_chunked_upload(self, payload, upload_id):
+        """Assemble the chunks of an upload into a tool result."""
+        state = self.server.state
+        upload = state.uploads.get(upload_id)
+        if upload is None:
+            return 404, {'message': 'Upload does not exist'}, None
+        missing = [index for index in range(payload['chunks']) if index not in upload['chunks']]
+        if missing:
+            return 400, {'message': f'Missing chunks: {missing}'}, None
+        body = b''.join(upload['chunks'][index] for index in range(payload['chunks']))
+        if hashlib.sha256(body).hexdigest() != payload['sha256']:
+            return 400, {'message': 'Checksum mismatch'}, None
+        upload['body'] = body
+        with state.lock:
+            state.results[(upload['sample_uuid'], upload['result_type'])] = \
+                len(json.loads(body.decode('utf-8')))
+        return 201, {'sample_uuid': upload['sample_uuid'],
+                     'result_type': upload['result_type']}, None
+
+
+class FakeRequestHandler(SampleRoutesMixin, ResultRoutesMixin, BaseHTTPRequestHandler):
+    """Answer MetaGenScope API requests from a FakeState."""
+
+    server_version = 'FakeMetaGenScope/1.0'
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, do not let Nagle's algorithm
+    # hold the body back for the client's delayed acknowledgement
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):  # pylint:disable=redefined-builtin
+        """Keep request logs out of benchmark output."""
+
+    def do_GET(self):  # pylint:disable=invalid-name
+        """Handle GET requests."""
+        self.dispatch('GET')
+
+    def do_POST(self):  # pylint:disable=invalid-name
+        """Handle POST requests."""
+        self.dispatch('POST')
+
+    def read_chunked(self):
+        """Read a request body sent with chunked transfer encoding."""
+        body = bytearray()
+        while True:
+            size = int(self.rfile.readline().split(b';')[0], 16)
+            if not size:
+                break
+            body += self.rfile.read(size)
+            self.rfile.readline()
+        # Skip any trailers up to the blank line ending the body
+        while self.rfile.readline().strip():
+            pass
+        return bytes(body)
+
+    def read_body(self):
+        """
+        Read the request body at the configured bandwidth, decoding gzip and JSON.
+
+        Bodies that are not JSON, such as chunks of a chunked upload, are
+        returned as bytes.
+        """
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            body = self.read_chunked()
+        else:
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length) if length else b''
+        bandwidth = self.server.options['bandwidth']
+        if bandwidth:
+            sleep(len(body) / bandwidth)
+        length = len(body)
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        if self.headers.get('Content-Type', 'application/json') != 'application/json':
+            return length, body
+        return length, json.loads(body.decode('utf-8')) if body else {}
+
+    def respond(self, status, data=None, headers=None):
+        """Send a JSON response."""
+        body = json.dumps({'status': 'success' if status < 400 else 'fail',
+                           'data': data or {}}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def dispatch(self, method):
+        """Route a request after applying injected latency and failures."""
+        options = self.server.options
+        state = self.server.state
+        length, payload = self.read_body()
+        path = self.path.split('?')[0]
+
+        rng = self.server.rng
+        with self.server.rng_lock:
+            latency = rng.expovariate(1 / options['latency']) if options['latency'] else 0
+            draw = rng.random()
+        sleep(latency)
+
+        if draw < options['throttle_rate']:
+            status, data, headers = 429, {'message': 'Slow down'}, {'Retry-After': '1'}
+        elif draw < options['throttle_rate'] + options['error_rate']:
+            status, data, headers = 500, {'message': 'Injected error'}, None
+        elif not self.authorized(path):
+            status, data, headers = 401, {'message': 'Unauthorized'}, None
+        else:
+            status, data, headers = self.route(method, path, payload)
+        state.record(status, length)
+        self.respond(status, data, headers)
+
+    def authorized(self, path):
+        """Return True if the request may be answered."""
+        if path.startswith('/api/v1/auth/') and not path.endswith('/status'):
+            return True
+        return self.headers.get('Authorization') == f'Bearer {FAKE_TOKEN}'
+
+    def route(self, method, path, payload):
+        """Call the handler registered for a request."""
+        for route_method, pattern, handler in ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                return handler(self, payload, *match.groups())
+        return 404, {'message': f'No route for {method} {path}'}, None
+
+    @handles('POST', r'/api/v1/auth/(register|login)')
+    def auth(self, _payload, _):
+        """Return a token for any user."""
+        return 200, {'auth_token': FAKE_TOKEN}, None
+
+    @handles('GET', r'/api/v1/auth/status')
+    def auth_status(self, _payload):
+        """Return the status of the authenticated user."""
+        return 200, {'username': 'fake', 'active': True}, None
+
+
+class FakeHTTPServer(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server holding fake MetaGenScope state."""
+
+    daemon_threads = True
+
+
+class FakeMetaGenScope(object):
+    """
+    Local stand-in MetaGenScope server, run on a background thread.
+
+    Every response is delayed by an exponentially distributed `latency`
+    (mean, in seconds). A `throttle_rate` fraction of requests is answered
+    429 with a Retry-After and an `error_rate` fraction 500. Request bodies
+    are read at `bandwidth` bytes per second, if set. Bulk and chunked
+    upload endpoints answer 404, as on servers that lack them, unless
+    `bulk` and `chunked` are set. Middleware completes `middleware_time`
+    seconds after it is run. Accepts `FAKE_TOKEN`.
+    """
+
+    def __init__(self, port=0, latency=0.0,  # pylint:disable=too-many-arguments
+                 error_rate=0.0, throttle_rate=0.0, bandwidth=None, bulk=False,
+                 chunked=False, middleware_time=0.0, seed=0):
+        """Configure a fake server listening on localhost, on a free port by default."""
+        self.server = FakeHTTPServer(('127.0.0.1', port), FakeRequestHandler)
+        self.server.options = {
+            'latency': latency,
+            'error_rate': error_rate,
+            'throttle_rate': throttle_rate,
+            'bandwidth': bandwidth,
+            'bulk': bulk,
+            'chunked': chunked,
+            'middleware_time': middleware_time,
+        }
+        self.server.state = FakeState()
+        self.server.rng = Random(seed)
+        self.server.rng_lock = Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        """Return the URL of the server."""
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def state(self):
+        """Return the server state."""
+        return self.server.state
+
+    def start(self):
+        """Serve requests on a background thread."""
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving requests."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        """Start serving when entering a context."""
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        """Stop serving when leaving a context."""
+        self.stop()
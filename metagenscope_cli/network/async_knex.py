@@ -0,0 +1,114 @@
+"""AsyncKnex wraps MetaGenScope requests requiring authentication on an event loop."""
+
+import asyncio
+from collections import Counter
+from sys import stderr
+
+import aiohttp
+
+from metagenscope_cli.constants import (DEFAULT_HOST, DEFAULT_ASYNC_CONCURRENCY,
+                                        DEFAULT_REQUEST_TIMEOUT)
+
+from .payloads import BodyStats, encode_body
+
+
+class AsyncKnex(object):  # pylint:disable=too-many-instance-attributes
+    """
+    AsyncKnex wraps MetaGenScope requests requiring authentication on an event loop.
+
+    At most `concurrency` requests are in flight at once. AsyncKnex must be
+    entered as an async context manager, inside the running event loop,
+    before making requests. POST bodies are encoded as by Knex, and
+    requests and connections are tallied as by Knex.connection_stats, and
+    time out as by Knex.
+    """
+
+    def __init__(self, token_auth, host=None, headers=None,  # pylint:disable=too-many-arguments
+                 concurrency=DEFAULT_ASYNC_CONCURRENCY, compress=False,
+                 timeout=DEFAULT_REQUEST_TIMEOUT):
+        """Instantiate AsyncKnex instance."""
+        self.auth = token_auth
+
+        self.host = host
+        if self.host is None:
+            self.host = DEFAULT_HOST
+
+        self.headers = headers
+        if self.headers is None:
+            self.headers = {'Accept': 'application/json'}
+
+        self.concurrency = concurrency
+        self.compress = compress
+        self.timeout = timeout
+        self.body_stats = BodyStats()
+        self.stats = Counter()
+        self.session = None
+        self.semaphore = None
+
+    @classmethod
+    def from_knex(cls, knex, concurrency=DEFAULT_ASYNC_CONCURRENCY):
+        """Build an AsyncKnex talking to the same host, and tallying bodies, as a Knex."""
+        async_knex = cls(knex.auth, host=knex.host, headers=knex.headers,
+                         concurrency=concurrency, compress=knex.compress,
+                         timeout=knex.timeout)
+        async_knex.body_stats = knex.body_stats
+        return async_knex
+
+    async def __aenter__(self):
+        """Open the client session."""
+        headers = dict(self.headers)
+        headers['Authorization'] = f'Bearer {self.auth}'
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout,
+                                        sock_read=self.timeout)
+        self.session = aiohttp.ClientSession(headers=headers, connector=connector,
+                                             timeout=timeout,
+                                             trace_configs=[self.trace_config()])
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        """Close the client session."""
+        await self.session.close()
+
+    def trace_config(self):
+        """Return an aiohttp TraceConfig tallying requests and connections in `stats`."""
+        def counter(name):
+            """Return a trace callback counting under a name."""
+            async def count(*_):
+                """Count one event."""
+                self.stats[name] += 1
+            return count
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(counter('requests'))
+        trace_config.on_connection_create_end.append(counter('new_connections'))
+        trace_config.on_connection_reuseconn.append(counter('reused_connections'))
+        return trace_config
+
+    def connection_stats(self):
+        """Return counts of requests made and connections opened, reused or not."""
+        return {name: self.stats[name]
+                for name in ['requests', 'new_connections', 'reused_connections']}
+
+    async def post(self, endpoint, payload):
+        """Perform authenticated POST request."""
+        url = self.host + endpoint
+        headers, body = None, None
+        if payload:
+            body, headers, raw_size = encode_body(payload, compress=self.compress)
+            self.body_stats.record(endpoint, raw_size, len(body))
+        async with self.semaphore:
+            async with self.session.post(url, data=body, headers=headers) as response:
+                if response.status >= 400:
+                    print(await response.read(), file=stderr)
+                response.raise_for_status()
+                return await response.json()
+
+    async def get(self, endpoint):
+        """Perform authenticated GET request."""
+        url = self.host + endpoint
+        async with self.semaphore:
+            async with self.session.get(url) as response:
+                response.raise_for_status()
+                return await response.json()
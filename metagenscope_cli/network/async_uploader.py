@@ -0,0 +1,144 @@
+"""AsyncUploader uploads samples to a server from a single event loop."""
+
+import asyncio
+from datetime import datetime
+from sys import stderr
+
+from aiohttp import ClientResponseError
+
+from metagenscope_cli.constants import DEFAULT_QUEUE_DEPTH
+from metagenscope_cli.uuid_cache import SAMPLE_KIND
+
+from .uploader import UploaderBase, completed, iter_prefetched, pending_result
+
+
+class AsyncUploader(UploaderBase):
+    """
+    AsyncUploader uploads samples to a server from a single event loop.
+
+    It mirrors Uploader, returning the same result records, but drives
+    requests through an AsyncKnex instead of a thread pool.
+    """
+
+    async def create_sample(self, sample_name, group_uuid, metadata=None):
+        """Create Sample on remote server, unless a sample of that name is known."""
+        sample_uuid = self.cached_uuid(SAMPLE_KIND, sample_name)
+        if sample_uuid is not None:
+            return sample_uuid
+        payload = {
+            "name": sample_name,
+            "sample_group_uuid": group_uuid,
+            "metadata": metadata or {},
+        }
+        try:
+            response = await self.knex.post('/api/v1/samples', payload)
+            sample_uuid = response['data']['sample']['uuid']
+        except ClientResponseError:
+            response = await self.knex.get(f'/api/v1/samples/getid/{sample_name}')
+            sample_uuid = response['data']['sample_uuid']
+        self.cache_uuid(SAMPLE_KIND, sample_name, sample_uuid)
+        return sample_uuid
+
+    async def journaled_create_sample(self, sample_name, group_uuid):
+        """Create Sample on remote server unless the journal knows its UUID."""
+        sample_uuid = self.journaled_sample_uuid(sample_name)
+        if sample_uuid is None:
+            sample_uuid = await self.create_sample(sample_name, group_uuid)
+            self.journal_sample(sample_name, sample_uuid)
+        return sample_uuid
+
+    async def upload_sample_result(self, sample_uuid, result_type, data, dryrun=False):
+        """Upload a tool result of specified type to existing sample."""
+        endpoint = f'/api/v1/samples/{sample_uuid}/{result_type}'
+        if dryrun:
+            endpoint += '?dryrun=true'
+        response = await self.knex.post(endpoint, data)
+        return response
+
+    async def try_upload(self, sample_task, result, data, dryrun, digest=None):
+        """Attempt an upload once its sample exists, return the result."""
+        sample_name = result['sample_name']
+        result_type = result['result_type']
+        try:
+            result['sample_uuid'] = await sample_task
+            print(f'[uploader {datetime.now()}] uploading {sample_name} :: {result_type}',
+                  file=stderr)
+            await self.upload_sample_result(result['sample_uuid'], result_type,
+                                            data, dryrun=dryrun)
+            self.journal_result(result, digest, dryrun)
+        except Exception as exception:  # pylint:disable=broad-except
+            result['type'] = 'error'
+            result['exception'] = str(exception)
+        return result
+
+    def sample_future(self, group_uuid, sample_name, sample_uuids):
+        """Return a future of the UUID of a sample, created unless `sample_uuids` has it."""
+        if sample_uuids is not None and sample_name in sample_uuids:
+            return asyncio.wrap_future(completed(sample_uuids[sample_name]))
+        print(f'[uploader {datetime.now()}] creating sample {sample_name}', file=stderr)
+        return asyncio.ensure_future(self.journaled_create_sample(sample_name, group_uuid))
+
+    async def queue_uploads(self, group_uuid,  # pylint:disable=too-many-arguments
+                            sample, dryrun, sample_uuids, backlog):
+        """Return tasks uploading the results of a sample, each started once `backlog` allows."""
+        sample_name, tool_results = sample
+        pending, unchanged = self.split_unchanged(sample_name, tool_results, dryrun)
+        tasks = [asyncio.wrap_future(completed(self.skipped_result(group_uuid, sample_name,
+                                                                   tool_result)))
+                 for tool_result in unchanged]
+        if not pending:
+            return tasks
+
+        sample_task = self.sample_future(group_uuid, sample_name, sample_uuids)
+        for tool_result, digest in pending:
+            await backlog.acquire()
+            task = asyncio.ensure_future(
+                self.try_upload(sample_task, pending_result(group_uuid, sample_name, tool_result),
+                                tool_result['data'], dryrun, digest=digest)
+            )
+            task.add_done_callback(lambda _: backlog.release())
+            tasks.append(task)
+        return tasks
+
+    async def upload_all_results(self, group_uuid,  # pylint:disable=too-many-arguments
+                                 samples, dryrun=True, queue_depth=DEFAULT_QUEUE_DEPTH,
+                                 sample_uuids=None):
+        """
+        Upload all samples and results to group.
+
+        Samples are consumed as in Uploader.upload_all_results, off the event
+        loop so parsing never blocks requests, and only created if missing
+        from `sample_uuids`. Sample creation and result uploads are
+        interleaved freely; at most twice the AsyncKnex concurrency of
+        results are held waiting to be sent.
+        """
+        if hasattr(samples, 'items'):
+            samples = samples.items()
+        if queue_depth:
+            samples = iter_prefetched(samples, depth=queue_depth)
+        samples = iter(samples)
+
+        loop = asyncio.get_running_loop()
+        backlog = asyncio.Semaphore(2 * self.knex.concurrency)
+        tasks = []
+        async with self.knex:
+            while True:
+                sample = await loop.run_in_executor(None, next, samples, None)
+                if sample is None:
+                    break
+                tasks += await self.queue_uploads(group_uuid, sample, dryrun, sample_uuids,
+                                                  backlog)
+            return await asyncio.gather(*tasks)
+
+    def run_all_results(self, group_uuid,  # pylint:disable=too-many-arguments
+                        samples, dryrun=True, queue_depth=DEFAULT_QUEUE_DEPTH,
+                        sample_uuids=None):
+        """Run upload_all_results to completion on a new event loop."""
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(
+                self.upload_all_results(group_uuid, samples, dryrun=dryrun,
+                                        queue_depth=queue_depth, sample_uuids=sample_uuids)
+            )
+        finally:
+            loop.close()
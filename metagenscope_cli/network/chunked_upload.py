@@ -0,0 +1,77 @@
+"""Resumable uploads of large results in chunks."""
+
+from datetime import datetime
+from hashlib import sha256
+from sys import stderr
+
+from requests.exceptions import RequestException
+
+from .exceptions import IncompleteUploadError
+from .payloads import iter_encoded
+
+
+CHUNKED_UPLOAD_ENDPOINT = '/api/v1/uploads'
+# Rounds of resending the chunks a server is missing before giving up
+CHUNK_RESUMES = 3
+
+
+class ChunkedUpload:
+    """A chunked upload of one result, resumed until the server has every chunk."""
+
+    def __init__(self, knex, upload_id, data, chunk_size):
+        """Upload `data`, encoded in chunks of `chunk_size` bytes, as upload `upload_id`."""
+        self.knex = knex
+        self.endpoint = f'{CHUNKED_UPLOAD_ENDPOINT}/{upload_id}'
+        self.data = data
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def start(cls, knex, endpoint, data, chunk_size):
+        """Start a chunked upload of a result to the uploads `endpoint` of its sample."""
+        response = knex.post(endpoint, {})
+        return cls(knex, response['data']['upload_id'], data, chunk_size)
+
+    def send(self, chunks):
+        """
+        Upload the encoded chunks of the result then complete the upload.
+
+        Chunks that fail to upload, even after the Knex retries, are sent
+        again, regenerated from the data, once the server lists the chunks
+        it is missing. Raises IncompleteUploadError, without completing
+        the upload, if some are still missing after CHUNK_RESUMES rounds.
+        """
+        digest = sha256()
+        count = 0
+        complete = True
+        for index, chunk in enumerate(chunks):
+            digest.update(chunk)
+            count += 1
+            complete &= self.send_chunk(index, chunk)
+        for _ in range(CHUNK_RESUMES):
+            if complete:
+                break
+            complete = self.resend_missing()
+        if not complete:
+            raise IncompleteUploadError(f'{self.endpoint} is missing chunks after '
+                                        f'{CHUNK_RESUMES} resumes')
+        payload = {'chunks': count, 'sha256': digest.hexdigest()}
+        return self.knex.post(f'{self.endpoint}/complete', payload)
+
+    def resend_missing(self):
+        """Send the chunks the server is missing, returning False if any failed again."""
+        received = set(self.knex.get(self.endpoint)['data']['received'])
+        complete = True
+        for index, chunk in enumerate(iter_encoded(self.data, self.chunk_size)):
+            if index not in received:
+                complete &= self.send_chunk(index, chunk)
+        return complete
+
+    def send_chunk(self, index, chunk):
+        """Upload one chunk, returning False if it failed."""
+        try:
+            self.knex.post_data(f'{self.endpoint}/chunks/{index}', chunk)
+        except RequestException as error:
+            print(f'[uploader {datetime.now()}] chunk {index} of {self.endpoint} failed: {error}',
+                  file=stderr)
+            return False
+        return True
@@ -5,3 +5,7 @@ class ServerAuthenticationError(Exception):
     """Exception raised by bad authentication."""
 
     pass
+
+
+class IncompleteUploadError(Exception):
+    """Exception raised when a server is still missing chunks of an upload."""
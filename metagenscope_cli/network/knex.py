@@ -1,14 +1,75 @@
 """Knex wraps MetaGenScope requests requiring authentication."""
 
+import os
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
 from sys import stderr
+from time import monotonic, sleep
 import requests
-from metagenscope_cli.constants import DEFAULT_HOST
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+from metagenscope_cli.constants import (DEFAULT_HOST, DEFAULT_REQUEST_TIMEOUT,
+                                        DEFAULT_UPLOAD_WORKERS)
+from metagenscope_cli.tracing import span
 
+from .limiter import latency_key
+from .payloads import (BodyStats, JSON_CONTENT_TYPE, OCTET_STREAM_CONTENT_TYPE, encode_body,
+                       iter_counted, iter_encoded, iter_gzipped, prepare_body)
 
-class Knex(object):
-    """Knex wraps MetaGenScope requests requiring authentication."""
 
-    def __init__(self, token_auth, host=None, headers=None):
+OVERLOADED_STATUS_CODES = (429, 503)
+
+# Size of the pieces a downloaded response is written to disk in
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+def parse_retry_after(value):
+    """Return the pause in seconds asked for by a Retry-After header, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def checked_json(response):
+    """Return the JSON of a response, raising HTTPError for failures."""
+    if response.status_code >= 400:
+        print(response.content, file=stderr)
+    response.raise_for_status()
+    return response.json()
+
+
+class Knex(object):  # pylint:disable=too-many-instance-attributes
+    """
+    Knex wraps MetaGenScope requests requiring authentication.
+
+    Requests share one keep-alive session whose connection pool holds up to
+    `pool_size` connections, so it should match the number of threads making
+    requests concurrently. The session is safe to share between those threads.
+
+    POST bodies are serialized once, gzipped if `compress` is set, and the
+    same bytes are resent on up to `retries` connection failures, timeouts
+    or overloaded (429, 503) responses. Their sizes are tallied in
+    `body_stats`. Streamed bodies are encoded while they are sent, and
+    encoded again for every retry. A request times out when connecting, or
+    waiting on the server, takes longer than `timeout` seconds.
+
+    With an AdaptiveLimiter as `limiter`, requests wait for its permission
+    and report their latency and any overload back to it.
+    """
+
+    def __init__(self, token_auth, host=None, headers=None,  # pylint:disable=too-many-arguments
+                 pool_size=DEFAULT_UPLOAD_WORKERS, compress=False, retries=0, limiter=None,
+                 timeout=DEFAULT_REQUEST_TIMEOUT):
         """Instantiate Knex instance."""
         self.auth = token_auth
 
@@ -20,26 +81,172 @@ class Knex(object):
         if self.headers is None:
             self.headers = {'Accept': 'application/json'}
 
+        self.compress = compress
+        self.retries = retries
+        self.limiter = limiter
+        self.timeout = timeout
+        self.body_stats = BodyStats()
+
+        self.pool_size = None
+        self.adapter = None
+        self.session = requests.Session()
+        self.resize_pool(pool_size)
+
+    def resize_pool(self, pool_size):
+        """Serve requests from a new connection pool of `pool_size` connections."""
+        if self.adapter is not None:
+            self.adapter.close()
+        self.pool_size = pool_size
+        # Block rather than open throwaway connections once the pool is busy
+        self.adapter = HTTPAdapter(pool_connections=1,
+                                   pool_maxsize=pool_size,
+                                   pool_block=True)
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+    def __enter__(self):
+        """Return self as a context manager."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the session when leaving a context."""
+        self.close()
+
+    def close(self):
+        """Close pooled connections."""
+        self.session.close()
+
+    def connection_stats(self):
+        """Return counts of requests made and connections opened, reused or not."""
+        requests_made = 0
+        new_connections = 0
+        pools = self.adapter.poolmanager.pools
+        for pool_key in pools.keys():
+            pool = pools[pool_key]
+            requests_made += pool.num_requests
+            new_connections += pool.num_connections
+        return {
+            'requests': requests_made,
+            'new_connections': new_connections,
+            'reused_connections': requests_made - new_connections,
+        }
+
+    def send(self, method, endpoint,  # pylint:disable=too-many-arguments
+             headers=None, body=None, stream=False):
+        """
+        Send a request, retrying failures and overload, and return the response.
+
+        `body` may be bytes or a function returning an iterator of bytes,
+        which is called for every attempt and sent with chunked transfer
+        encoding. With `stream` the response body is left to be read, and
+        the response to be closed, by the caller.
+        """
+        url = self.host + endpoint
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            if self.limiter is not None:
+                self.limiter.acquire()
+            start = monotonic()
+            try:
+                with span(method, 'http', endpoint=endpoint, attempt=attempt) as span_args:
+                    response = self.session.request(method, url,
+                                                    headers=headers or self.headers,
+                                                    auth=self.auth,
+                                                    data=body() if callable(body) else body,
+                                                    stream=stream,
+                                                    timeout=self.timeout)
+                    span_args['status'] = response.status_code
+            except (RequestsConnectionError, Timeout) as error:
+                self.report_to_limiter(overloaded=isinstance(error, Timeout))
+                if last_attempt:
+                    raise
+                continue
+            except BaseException:
+                # Other failures are not retried, but must still give up their slot
+                self.report_to_limiter()
+                raise
+
+            if response.status_code in OVERLOADED_STATUS_CODES:
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                self.report_to_limiter(overloaded=True, retry_after=retry_after)
+                if not last_attempt:
+                    # Release the connection of a streamed response back to the pool
+                    response.close()
+                    if self.limiter is None and retry_after:
+                        sleep(retry_after)
+                    continue
+            else:
+                self.report_to_limiter(latency=monotonic() - start,
+                                       key=latency_key(method, endpoint))
+            return response
+
+    def report_to_limiter(self, **outcome):
+        """Release a request from the limiter, if there is one."""
+        if self.limiter is not None:
+            self.limiter.release(**outcome)
+
     def post(self, endpoint, payload):
         """Perform authenticated POST request."""
-        url = self.host + endpoint
+        headers = self.headers
+        body = None
         if payload:
-            response = requests.post(url,
-                                     headers=self.headers,
-                                     auth=self.auth,
-                                     json=payload)
-        else:
-            response = requests.post(url, headers=self.headers, auth=self.auth)
-        if response.status_code >= 400:
-            print(response.content, file=stderr)
-        response.raise_for_status()
-        return response.json()
+            body, body_headers, raw_size = encode_body(payload, compress=self.compress)
+            headers = dict(self.headers, **body_headers)
+            self.body_stats.record(endpoint, raw_size, len(body))
+
+        return checked_json(self.send('POST', endpoint, headers=headers, body=body))
+
+    def post_data(self, endpoint, data, content_type=OCTET_STREAM_CONTENT_TYPE):
+        """Perform authenticated POST request of encoded data, such as a chunk of a body."""
+        body, body_headers = prepare_body(data, content_type, compress=self.compress)
+        headers = dict(self.headers, **body_headers)
+        self.body_stats.record(endpoint, len(data), len(body))
+        return checked_json(self.send('POST', endpoint, headers=headers, body=body))
+
+    def post_stream(self, endpoint, payload):
+        """Perform authenticated POST request of a payload encoded as it is sent."""
+        headers = dict(self.headers, **{'Content-Type': JSON_CONTENT_TYPE})
+        if self.compress:
+            headers['Content-Encoding'] = 'gzip'
+        sizes = {}
+
+        def body():
+            """Return an iterator over the encoded, and maybe gzipped, payload."""
+            chunks = iter_counted(iter_encoded(payload), sizes, 'raw')
+            if self.compress:
+                chunks = iter_gzipped(chunks)
+            return iter_counted(chunks, sizes, 'sent')
+
+        response = self.send('POST', endpoint, headers=headers, body=body)
+        self.body_stats.record(endpoint, sizes.get('raw', 0), sizes.get('sent', 0))
+        return checked_json(response)
 
     def get(self, endpoint):
         """Perform authenticated GET request."""
-        url = self.host + endpoint
-        response = requests.get(url,
-                                headers=self.headers,
-                                auth=self.auth)
+        response = self.send('GET', endpoint)
         response.raise_for_status()
         return response.json()
+
+    def download(self, endpoint, filename):
+        """
+        Perform authenticated GET request, streaming the response body to a file.
+
+        The body is written to `filename` with a .part suffix then renamed,
+        so `filename` only ever holds a complete download, and the .part
+        file is removed if the download fails. Returns its size.
+        """
+        partial_filename = f'{filename}.part'
+        try:
+            with self.send('GET', endpoint, stream=True) as response:
+                response.raise_for_status()
+                size = 0
+                with open(partial_filename, 'wb') as download_file:
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+                        download_file.write(chunk)
+                        size += len(chunk)
+            os.replace(partial_filename, filename)
+        except BaseException:
+            if os.path.exists(partial_filename):
+                os.remove(partial_filename)
+            raise
+        return size
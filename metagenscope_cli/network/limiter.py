@@ -0,0 +1,101 @@
+"""Adaptive limit on the number of requests in flight."""
+
+import re
+from collections import deque
+from threading import Condition
+from time import monotonic
+
+
+LATENCY_WINDOW = 1000
+# Latency this many times the best recent latency of alike requests counts as congestion
+LATENCY_TOLERANCE = 2.0
+LATENCY_BACKOFF = 0.9
+OVERLOAD_BACKOFF = 0.5
+
+# Path segments naming a single record, such as a UUID or a chunk index
+RECORD_ID = re.compile(r'[0-9a-fA-F-]{16,}|[0-9]+')
+
+
+def latency_key(method, endpoint):
+    """Return the kind of a request, its method and path without record ids or query."""
+    path = endpoint.split('?', 1)[0]
+    segments = ['*' if RECORD_ID.fullmatch(segment) else segment for segment in path.split('/')]
+    return f'{method} {"/".join(segments)}'
+
+
+class AdaptiveLimiter(object):
+    """
+    Additive-increase, multiplicative-decrease limit on requests in flight.
+
+    The limit grows by about one request per round trip while latency stays
+    within LATENCY_TOLERANCE of the best recent latency of the same kind of
+    request, shrinks gently when latency climbs and halves when the server
+    reports overload (429, 503 or a timeout). Kinds are compared apart, as
+    a result upload is slower than a sample lookup however idle the server.
+    A Retry-After from the server pauses all new requests. The limiter may
+    be shared by any number of threads.
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None):
+        """Start with `initial` requests in flight, never leaving [minimum, maximum]."""
+        self.condition = Condition()
+        self.minimum = minimum
+        self.maximum = maximum if maximum is not None else initial
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.in_flight = 0
+        self.resume_at = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.latencies_by_key = {}
+
+    def acquire(self):
+        """Block until another request may be sent."""
+        with self.condition:
+            while True:
+                pause = self.resume_at - monotonic()
+                if pause > 0:
+                    self.condition.wait(pause)
+                elif self.in_flight >= int(self.limit):
+                    self.condition.wait()
+                else:
+                    break
+            self.in_flight += 1
+
+    def release(self, latency=None, overloaded=False, retry_after=None, key=None):
+        """
+        Record the outcome of a request and adjust the limit.
+
+        `latency` is the duration of a completed request in seconds, `key`
+        the kind of request, such as from latency_key, and `retry_after` the
+        pause, in seconds, asked for by an overloaded server.
+        """
+        with self.condition:
+            self.in_flight -= 1
+            if overloaded:
+                self.limit = max(self.minimum, self.limit * OVERLOAD_BACKOFF)
+                if retry_after:
+                    self.resume_at = max(self.resume_at, monotonic() + retry_after)
+            elif latency is not None:
+                self.adjust_for_latency(latency, key=key)
+            self.condition.notify_all()
+
+    def adjust_for_latency(self, latency, key=None):
+        """Grow the limit while latency is stable for a kind of request, back off when it climbs."""
+        self.latencies.append(latency)
+        latencies = self.latencies_by_key.setdefault(key, deque(maxlen=LATENCY_WINDOW))
+        latencies.append(latency)
+        if latency > LATENCY_TOLERANCE * min(latencies):
+            self.limit = max(self.minimum, self.limit * LATENCY_BACKOFF)
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def summary(self):
+        """Return the current limit and recent latency percentiles, in seconds."""
+        with self.condition:
+            latencies = sorted(self.latencies)
+            summary = {'limit': int(self.limit)}
+        for name, fraction in [('p50', 0.5), ('p90', 0.9), ('p99', 0.99)]:
+            if latencies:
+                summary[name] = latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+            else:
+                summary[name] = None
+        return summary
@@ -0,0 +1,78 @@
+"""Running and polling middleware on the server."""
+
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+
+
+# Middleware statuses after which a sample or group is not polled again
+MIDDLEWARE_DONE_STATUSES = ('success', 'error')
+
+
+def is_middleware_done(status):
+    """Return True if a middleware status, or the exception fetching it, is final."""
+    return isinstance(status, Exception) or status in MIDDLEWARE_DONE_STATUSES
+
+
+class MiddlewareMixin:
+    """
+    Middleware requests of an Uploader.
+
+    Uses the Uploader's Knex, worker threads and sample UUID lookups.
+    """
+
+    def run_group_middleware(self, group_uuid):
+        """Run middleware for a sample group."""
+        return self.knex.post(f'/api/v1/sample_groups/{group_uuid}/middleware', {})
+
+    def run_samples_middleware(self, sample_names):
+        """
+        Run middleware for many samples over the worker threads.
+
+        Each worker resolves a sample's UUID then runs its middleware.
+        Returns a result, of type 'success' or 'error', per sample in order.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self.run_sample_middleware, sample_names))
+
+    def run_sample_middleware(self, sample_name):
+        """Run middleware for one sample, returning its result."""
+        result = {'type': 'success', 'sample_name': sample_name, 'sample_uuid': None}
+        try:
+            result['sample_uuid'] = self.get_sample_uuid(sample_name)
+            self.knex.post(f'/api/v1/samples/{result["sample_uuid"]}/middleware', {})
+        except Exception as exception:  # pylint:disable=broad-except
+            result['type'] = 'error'
+            result['exception'] = str(exception)
+        return result
+
+    def poll_samples_middleware(self, sample_uuids,  # pylint:disable=too-many-arguments
+                                interval=5, timeout=None, progress=None):
+        """
+        Poll the middleware status of samples until every one is done or `timeout` passes.
+
+        Statuses of samples not yet done are fetched over the worker threads
+        every `interval` seconds, and their {sample_uuid: status} passed to
+        `progress`, if given, after each round. Returns the last status of
+        every sample, or the exception raised fetching it, after which the
+        sample is not polled again.
+        """
+        statuses = {sample_uuid: None for sample_uuid in sample_uuids}
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            pending = [sample_uuid for sample_uuid, status in statuses.items()
+                       if not is_middleware_done(status)]
+            fetched = self.map_concurrently(self.get_sample_middleware_status, pending)
+            statuses.update(zip(pending, fetched))
+            if progress is not None:
+                progress(statuses)
+            if all(is_middleware_done(status) for status in statuses.values()):
+                break
+            if deadline is not None and monotonic() + interval > deadline:
+                break
+            sleep(interval)
+        return statuses
+
+    def get_sample_middleware_status(self, sample_uuid):
+        """Return the middleware status of a sample."""
+        response = self.knex.get(f'/api/v1/samples/{sample_uuid}/middleware')
+        return response['data']['status']
@@ -0,0 +1,209 @@
+"""Encoding of request payloads into request bodies."""
+
+import gzip
+import json
+import zlib
+from collections import deque
+from itertools import islice
+from math import isfinite
+from threading import Lock
+
+from metagenscope_cli.tracing import span
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the standard library
+    orjson = None  # pylint: disable=invalid-name
+
+
+JSON_CONTENT_TYPE = 'application/json'
+OCTET_STREAM_CONTENT_TYPE = 'application/octet-stream'
+GZIP_LEVEL = 6
+
+# Size of the pieces a streamed body is sent in
+STREAM_CHUNK_BYTES = 64 * 1024
+# Members of an object or array encoded in one go when streaming it
+STREAM_BATCH_ITEMS = 1024
+# Containers up to this size are streamed checking every member, larger
+# ones are taken to hold members alike to their first one
+STREAM_MIXED_ITEMS = 64
+
+
+def encode_payload(payload):
+    """
+    Serialize a payload to compact JSON bytes, using orjson when it is installed.
+
+    Either way the same payloads are accepted and decode to the same value:
+    keys that are not strings are written as the standard library writes
+    them, NaN and infinities as null, and strings unescaped as UTF-8.
+    Integers too large for orjson are written by the standard library.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    try:
+        return dump_json(payload)
+    except ValueError:
+        return dump_json(nulled_non_finite(payload))
+
+
+def dump_json(payload):
+    """Serialize a payload to compact JSON bytes with the standard library, rejecting NaN."""
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False,
+                      allow_nan=False).encode('utf-8')
+
+
+def nulled_non_finite(value):
+    """Return a copy of JSON data with NaN and infinities replaced by None, as orjson has it."""
+    if isinstance(value, float) and not isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {key: nulled_non_finite(member) for key, member in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [nulled_non_finite(member) for member in value]
+    return value
+
+
+def encode_key(key):
+    """Return the JSON encoding of an object key and its colon, as encode_payload writes it."""
+    return encode_payload({key: 0})[1:-2]
+
+
+def encode_body(payload, compress=False):
+    """
+    Return a request body, its headers and its size before compression.
+
+    The body is serialized once so it can be resent unchanged on retry, and
+    gzipped, with a matching Content-Encoding, if `compress` is set.
+    """
+    with span('encode_body', 'encode', compress=compress):
+        body = encode_payload(payload)
+        raw_size = len(body)
+        body, headers = prepare_body(body, JSON_CONTENT_TYPE, compress=compress)
+    return body, headers, raw_size
+
+
+def prepare_body(body, content_type, compress=False):
+    """Return a body, gzipped if `compress` is set, and its headers."""
+    headers = {'Content-Type': content_type}
+    if compress:
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        headers['Content-Encoding'] = 'gzip'
+    return body, headers
+
+
+def is_container(value):
+    """Return True for JSON objects and arrays."""
+    return isinstance(value, (dict, list))
+
+
+def first_member(container):
+    """Return the first value in a JSON object or array, or None if it is empty."""
+    return next(iter(container.values() if isinstance(container, dict) else container), None)
+
+
+def is_streamed(value):
+    """Return True if a value is too large or too deeply nested to encode in one go."""
+    if not is_container(value):
+        return False
+    return len(value) > STREAM_BATCH_ITEMS or is_container(first_member(value))
+
+
+def iter_json(value):
+    """
+    Yield the JSON encoding of a value piece by piece, as encode_payload writes it.
+
+    Large or nested containers are streamed member by member, or in batches
+    of members for large containers of alike members, such as the rows of
+    a table. Anything else is encoded in one go.
+    """
+    if not is_streamed(value):
+        yield encode_payload(value)
+        return
+    is_object = isinstance(value, dict)
+    items = value.items() if is_object else value
+    yield b'{' if is_object else b'['
+    separator = b''
+    if len(value) > STREAM_MIXED_ITEMS and not is_streamed(first_member(value)):
+        items = iter(items)
+        batch = list(islice(items, STREAM_BATCH_ITEMS))
+        while batch:
+            yield separator + encode_payload(dict(batch) if is_object else batch)[1:-1]
+            separator = b','
+            batch = list(islice(items, STREAM_BATCH_ITEMS))
+    else:
+        for item in items:
+            member = item[1] if is_object else item
+            yield separator + (encode_key(item[0]) if is_object else b'')
+            separator = b','
+            yield from iter_json(member)
+    yield b'}' if is_object else b']'
+
+
+def iter_encoded(payload, chunk_size=STREAM_CHUNK_BYTES):
+    """
+    Yield the JSON encoding of a payload in chunks of `chunk_size` bytes.
+
+    Only the last chunk may be shorter. At most about one chunk of the
+    encoding is held in memory at once, and chunks are the same on every
+    call, so any one of them can be generated again.
+    """
+    buffer = bytearray()
+    for piece in iter_json(payload):
+        buffer += piece
+        while len(buffer) >= chunk_size:
+            yield bytes(buffer[:chunk_size])
+            del buffer[:chunk_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+def iter_gzipped(chunks):
+    """Yield a gzip stream of chunks of bytes, compressed as they arrive."""
+    compressor = zlib.compressobj(GZIP_LEVEL, wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def iter_counted(chunks, sizes, key):
+    """Yield chunks of bytes, adding up their size in `sizes[key]`."""
+    sizes[key] = 0
+    for chunk in chunks:
+        sizes[key] += len(chunk)
+        yield chunk
+
+
+class BodyStats(object):
+    """Thread-safe tally of request body sizes before and after compression."""
+
+    def __init__(self, history=1000):
+        """Keep totals and the sizes of the latest `history` bodies."""
+        self.lock = Lock()
+        self.requests = 0
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+        self.recent = deque(maxlen=history)
+
+    def record(self, endpoint, raw_bytes, sent_bytes):
+        """Record the size of a request body."""
+        with self.lock:
+            self.requests += 1
+            self.raw_bytes += raw_bytes
+            self.sent_bytes += sent_bytes
+            self.recent.append((endpoint, raw_bytes, sent_bytes))
+
+    def summary(self):
+        """Return total bytes before and after compression."""
+        with self.lock:
+            ratio = self.sent_bytes / self.raw_bytes if self.raw_bytes else 1.0
+            return {
+                'requests': self.requests,
+                'raw_bytes': self.raw_bytes,
+                'sent_bytes': self.sent_bytes,
+                'ratio': ratio,
+            }
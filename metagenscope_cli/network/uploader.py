@@ -1,92 +1,547 @@
 """Uploader class handles uploading samples to a server."""
 
+import os.path
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import chain, islice
+from queue import Queue
 from sys import stderr
+from threading import BoundedSemaphore, Thread
 
-from requests.exceptions import HTTPError
+from requests.exceptions import HTTPError, RequestException
 
+from metagenscope_cli.constants import DEFAULT_CHUNK_SIZE, DEFAULT_QUEUE_DEPTH
+from metagenscope_cli.journal import content_hash
+from metagenscope_cli.tracing import span
+from metagenscope_cli.uuid_cache import SAMPLE_KIND, SAMPLE_GROUP_KIND
+
+from .chunked_upload import CHUNKED_UPLOAD_ENDPOINT, ChunkedUpload
+from .middleware import MiddlewareMixin
+from .payloads import JSON_CONTENT_TYPE, iter_encoded
+
+
+_END_OF_QUEUE = object()
+
+# Threads creating samples ahead of the result uploads
+SAMPLE_WORKERS = 2
+
+BULK_METADATA_ENDPOINT = '/api/v1/samples/metadata/bulk'
+BULK_SAMPLES_ENDPOINT = '/api/v1/samples/bulk'
+# Samples created or found by one bulk request
+BULK_SAMPLES_BATCH = 500
+# Responses from servers that do not offer a bulk endpoint
+BULK_UNSUPPORTED_STATUS_CODES = (404, 405)
+
+CHUNK_BYTES = DEFAULT_CHUNK_SIZE * 1024 * 1024
+
+
+def iter_batches(items, size):
+    """Yield lists of up to `size` items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def is_bulk_unsupported(error):
+    """Return True if an HTTPError shows the server lacks a bulk endpoint."""
+    response = error.response
+    return response is not None and response.status_code in BULK_UNSUPPORTED_STATUS_CODES
+
+
+def is_plain_filename(name):
+    """Return True if a name can only ever name a file in the current directory."""
+    separators = [sep for sep in (os.sep, os.altsep) if sep]
+    return name not in ('', '.', '..') and not any(sep in name for sep in separators)
+
+
+def pending_result(group_uuid, sample_name, tool_result):
+    """Return the result of an upload, successful until it fails."""
+    return {
+        'type': 'success',
+        'sample_uuid': None,
+        'sample_name': sample_name,
+        'result_type': tool_result['result_type'],
+        'group_uuid': group_uuid,
+    }
+
+
+def completed(value):
+    """Return a Future already resolved to a value."""
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def iter_prefetched(items, depth=DEFAULT_QUEUE_DEPTH):
+    """
+    Yield items produced on a background thread.
+
+    The producer runs at most `depth` items ahead of the consumer so that
+    building items (ie. parsing samples) overlaps with consuming them
+    (ie. uploading) while memory stays bounded by the queue depth.
+    """
+    queue = Queue(maxsize=depth)
+
+    def produce():
+        """Drain items into the queue, forwarding any exception."""
+        try:
+            for item in items:
+                queue.put((item, None))
+        except Exception as exception:  # pylint:disable=broad-except
+            queue.put((None, exception))
+        queue.put((_END_OF_QUEUE, None))
+
+    producer = Thread(target=produce, daemon=True)
+    producer.start()
+    while True:
+        item, exception = queue.get()
+        if exception is not None:
+            raise exception
+        if item is _END_OF_QUEUE:
+            break
+        yield item
 
-class Uploader:
-    """Uploader class handles uploading samples to a server."""
 
-    def __init__(self, knex):
-        """Initialize Uploader instance."""
+class UploaderBase:
+    """
+    Journal and UUID cache bookkeeping shared by Uploader and AsyncUploader.
+
+    Lookups are local and quick, so they are made directly from either the
+    worker threads or the event loop.
+    """
+
+    def __init__(self, knex, journal=None, force=False, uuid_cache=None):
+        """Initialize with a Knex or AsyncKnex, and an optional UploadJournal and UuidCache."""
         self.knex = knex
+        self.journal = journal
+        self.force = force
+        self.uuid_cache = uuid_cache
+
+    def cached_uuid(self, kind, name):
+        """Return a UUID from the UUID cache, if there is one."""
+        if self.uuid_cache is None:
+            return None
+        return self.uuid_cache.get(self.knex.host, kind, name)
+
+    def cache_uuid(self, kind, name, uuid):
+        """Store a UUID in the UUID cache, if there is one."""
+        if self.uuid_cache is not None:
+            self.uuid_cache.put(self.knex.host, kind, name, uuid)
+
+    def journaled_sample_uuid(self, sample_name):
+        """Return the UUID the journal recorded for a sample, unless forced or unknown."""
+        if self.journal is None or self.force:
+            return None
+        return self.journal.get_sample_uuid(self.knex.host, sample_name)
+
+    def journal_sample(self, sample_name, sample_uuid):
+        """Record a sample's UUID in the journal, if there is one."""
+        if self.journal is not None:
+            self.journal.record_sample(self.knex.host, sample_name, sample_uuid)
+
+    def journal_result(self, result, digest, dryrun):
+        """Record an uploaded result in the journal, if there is one."""
+        if self.journal is not None:
+            key = (self.knex.host, result['sample_name'], result['result_type'])
+            self.journal.record_result(key, digest, dryrun=dryrun)
+
+    def split_unchanged(self, sample_name, tool_results, dryrun):
+        """Split results into (result, hash) pairs to upload and results to skip."""
+        if self.journal is None:
+            return [(tool_result, None) for tool_result in tool_results], []
+        if self.force:
+            pending = [(tool_result, content_hash(tool_result['data']))
+                       for tool_result in tool_results]
+            return pending, []
+        key_prefix = (self.knex.host, sample_name)
+        return self.journal.split_results(key_prefix, tool_results, dryrun=dryrun)
+
+    def skipped_result(self, group_uuid, sample_name, tool_result):
+        """Return the result of an upload the journal has already seen."""
+        return {
+            'type': 'skipped',
+            'sample_uuid': self.journal.get_sample_uuid(self.knex.host, sample_name),
+            'sample_name': sample_name,
+            'result_type': tool_result['result_type'],
+            'group_uuid': group_uuid,
+        }
+
+
+class Uploader(UploaderBase, MiddlewareMixin):  # pylint:disable=too-many-instance-attributes
+    """Uploader class handles uploading samples to a server."""
+
+    def __init__(self, knex, max_workers=None,  # pylint:disable=too-many-arguments
+                 max_in_flight=None, journal=None, force=False, uuid_cache=None,
+                 chunk_size=CHUNK_BYTES):
+        """
+        Initialize Uploader instance.
+
+        Uploads run on `max_workers` threads, by default one per connection
+        in the Knex connection pool. At most `max_in_flight` results, by
+        default twice the number of workers, wait in memory to be uploaded.
+
+        With an UploadJournal, samples and results recorded by earlier runs
+        are not sent again unless `force` is set. With a UuidCache, sample
+        and sample group names are resolved locally when possible.
+
+        Results encoding to more than `chunk_size` bytes are uploaded in
+        chunks of that size.
+        """
+        super().__init__(knex, journal=journal, force=force, uuid_cache=uuid_cache)
+        self.max_workers = max_workers
+        if self.max_workers is None:
+            self.max_workers = knex.pool_size
+        self.max_in_flight = max_in_flight
+        if self.max_in_flight is None:
+            self.max_in_flight = 2 * self.max_workers
+        self.chunk_size = chunk_size
+        # Whether the server offers each bulk or chunked endpoint, once known
+        self.bulk_endpoints = {}
+
+    def set_workers(self, max_workers, max_in_flight=None, extra_connections=0):
+        """
+        Run on `max_workers` threads, resizing the Knex connection pool to match.
+
+        The pool holds `extra_connections` more, for threads making requests
+        alongside the workers. At most `max_in_flight` results, by default
+        twice the number of workers, wait in memory to be uploaded.
+        """
+        self.knex.resize_pool(max_workers + extra_connections)
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight
+        if self.max_in_flight is None:
+            self.max_in_flight = 2 * self.max_workers
 
     def create_sample_group(self, group_name):
         """Create Sample Group on remote server."""
         payload = {'name': group_name}
         response = self.knex.post('/api/v1/sample_groups', payload)
         group_uuid = response['data']['sample_group']['uuid']
+        self.cache_uuid(SAMPLE_GROUP_KIND, group_name, group_uuid)
         return group_uuid
 
     def create_sample(self, sample_name, group_uuid, metadata={}):  # pylint: disable=dangerous-default-value
-        """Create Sample on remote server."""
+        """Create Sample on remote server, unless a sample of that name is known."""
+        sample_uuid = self.cached_uuid(SAMPLE_KIND, sample_name)
+        if sample_uuid is not None:
+            return sample_uuid
         payload = {
             "name": sample_name,
             "sample_group_uuid": group_uuid,
             "metadata": metadata,
         }
-        try:
-            response = self.knex.post('/api/v1/samples', payload)
-            sample_uuid = response['data']['sample']['uuid']
-        except HTTPError:
+        with span('create_sample', 'create_sample', sample_name=sample_name):
+            try:
+                response = self.knex.post('/api/v1/samples', payload)
+                sample_uuid = response['data']['sample']['uuid']
+                self.cache_uuid(SAMPLE_KIND, sample_name, sample_uuid)
+            except HTTPError:
+                sample_uuid = self.get_sample_uuid(sample_name)
+        return sample_uuid
+
+    def create_samples(self, sample_names, group_uuid, batch_size=BULK_SAMPLES_BATCH):
+        """
+        Create or find many samples, returning a {sample_name: sample_uuid} map.
+
+        Samples known to the journal or the UUID cache are resolved locally.
+        The others are created, or found if they exist, `batch_size` at a
+        time through the bulk samples endpoint or, if the server lacks it,
+        sample by sample over the worker threads. Samples that could not be
+        created are reported and left out of the map.
+        """
+        sample_uuids = {}
+        pending = []
+        for sample_name in sample_names:
+            sample_uuid = self.journaled_sample_uuid(sample_name)
+            if sample_uuid is None:
+                sample_uuid = self.cached_uuid(SAMPLE_KIND, sample_name)
+            if sample_uuid is None:
+                pending.append(sample_name)
+            else:
+                sample_uuids[sample_name] = sample_uuid
+
+        for batch in iter_batches(pending, batch_size):
+            with span('create_samples', 'create_sample', samples=len(batch)):
+                created = self.create_sample_batch(batch, group_uuid)
+            for sample_name, sample_uuid in created.items():
+                self.cache_uuid(SAMPLE_KIND, sample_name, sample_uuid)
+                self.journal_sample(sample_name, sample_uuid)
+            sample_uuids.update(created)
+        return sample_uuids
+
+    def create_sample_batch(self, sample_names, group_uuid):
+        """Create or find a batch of samples, falling back to a request per sample."""
+        if self.bulk_endpoints.get(BULK_SAMPLES_ENDPOINT, True):
+            payload = {
+                'sample_group_uuid': group_uuid,
+                'samples': [{'name': sample_name, 'metadata': {}} for sample_name in sample_names],
+            }
+            try:
+                response = self.knex.post(BULK_SAMPLES_ENDPOINT, payload)
+                self.bulk_endpoints[BULK_SAMPLES_ENDPOINT] = True
+                return {sample['name']: sample['uuid'] for sample in response['data']['samples']}
+            except RequestException as error:
+                # Samples of a batch that failed for any reason are created one by one
+                if isinstance(error, HTTPError) and is_bulk_unsupported(error):
+                    self.bulk_endpoints[BULK_SAMPLES_ENDPOINT] = False
+
+        sample_uuids = self.map_concurrently(
+            lambda sample_name: self.create_sample(sample_name, group_uuid), sample_names)
+        created = {}
+        for sample_name, sample_uuid in zip(sample_names, sample_uuids):
+            if isinstance(sample_uuid, Exception):
+                print(f'[uploader {datetime.now()}] could not create sample {sample_name}: '
+                      f'{sample_uuid}', file=stderr)
+            else:
+                created[sample_name] = sample_uuid
+        return created
+
+    def get_sample_uuid(self, sample_name):
+        """Return the UUID of an existing sample."""
+        sample_uuid = self.cached_uuid(SAMPLE_KIND, sample_name)
+        if sample_uuid is None:
             response = self.knex.get(f'/api/v1/samples/getid/{sample_name}')
             sample_uuid = response['data']['sample_uuid']
+            self.cache_uuid(SAMPLE_KIND, sample_name, sample_uuid)
+        return sample_uuid
+
+    def get_sample_group_uuid(self, group_name):
+        """Return the UUID of an existing sample group."""
+        group_uuid = self.cached_uuid(SAMPLE_GROUP_KIND, group_name)
+        if group_uuid is None:
+            response = self.knex.get(f'/api/v1/sample_groups/getid/{group_name}')
+            group_uuid = response['data']['sample_group_uuid']
+            self.cache_uuid(SAMPLE_GROUP_KIND, group_name, group_uuid)
+        return group_uuid
+
+    def get_sample_uuids(self, sample_names):
+        """Return sample UUIDs, or exceptions for failed lookups, in the order of names."""
+        return self.map_concurrently(self.get_sample_uuid, sample_names)
+
+    def get_sample_group_uuids(self, group_names):
+        """Return sample group UUIDs, or exceptions for failed lookups, in the order of names."""
+        return self.map_concurrently(self.get_sample_group_uuid, group_names)
+
+    def map_concurrently(self, func, items):
+        """Call func on items over worker threads, returning results or exceptions in order."""
+        def call(item):
+            """Call func, returning any exception it raises."""
+            try:
+                return func(item)
+            except Exception as exception:  # pylint:disable=broad-except
+                return exception
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(call, items))
+
+    def journaled_create_sample(self, sample_name, group_uuid):
+        """Create Sample on remote server unless the journal knows its UUID."""
+        sample_uuid = self.journaled_sample_uuid(sample_name)
+        if sample_uuid is None:
+            sample_uuid = self.create_sample(sample_name, group_uuid)
+            self.journal_sample(sample_name, sample_uuid)
         return sample_uuid
 
     def upload_sample_result(self, sample_uuid, result_type, data, dryrun=False):
-        """Upload a tool result of specified type to existing sample."""
+        """
+        Upload a tool result of specified type to existing sample.
+
+        The result is encoded a chunk at a time. Results that fit in one
+        chunk are sent in one request. Larger ones are uploaded in resumable
+        chunks or, if the server does not accept chunked uploads, streamed
+        in one request, so their whole encoding is never held in memory.
+        """
         endpoint = f'/api/v1/samples/{sample_uuid}/{result_type}'
-        if dryrun:
-            endpoint += '?dryrun=true'
-        response = self.knex.post(endpoint, data)
-        return response
-
-    def get_try_upload(self, sample_uuid, sample_name,  # pylint:disable=too-many-arguments
-                       result_type, result, data, dryrun):
-        """Return a function that will attempt an upload when called."""
+        query = '?dryrun=true' if dryrun else ''
+        with span('upload_sample_result', 'upload', result_type=result_type):
+            chunks = iter_encoded(data, self.chunk_size)
+            with span('encode_result', 'encode', result_type=result_type):
+                first_chunks = list(islice(chunks, 2))
+            if len(first_chunks) < 2:
+                return self.knex.post_data(endpoint + query, b''.join(first_chunks),
+                                           content_type=JSON_CONTENT_TYPE)
+            if self.bulk_endpoints.get(CHUNKED_UPLOAD_ENDPOINT, True):
+                try:
+                    upload = ChunkedUpload.start(self.knex, endpoint + '/uploads' + query,
+                                                 data, self.chunk_size)
+                except HTTPError as error:
+                    if not is_bulk_unsupported(error):
+                        raise
+                    self.bulk_endpoints[CHUNKED_UPLOAD_ENDPOINT] = False
+                else:
+                    self.bulk_endpoints[CHUNKED_UPLOAD_ENDPOINT] = True
+                    return upload.send(chain(first_chunks, chunks))
+            return self.knex.post_stream(endpoint + query, data)
+
+    def get_try_upload(self, sample_future, result, data, dryrun, digest=None):
+        """Return a function that will attempt an upload, once its sample exists, when called."""
+        sample_name = result['sample_name']
+        result_type = result['result_type']
+
         def try_upload():
             """Attempt an upload, return the result."""
-            date_now = datetime.now()
             try:
+                result['sample_uuid'] = sample_future.result()
+                date_now = datetime.now()
                 print(f'[uploader {date_now}] uploading {sample_name} :: {result_type}',
                       file=stderr)
-                self.upload_sample_result(sample_uuid, result_type, data, dryrun=dryrun)
+                self.upload_sample_result(result['sample_uuid'], result_type, data, dryrun=dryrun)
+                self.journal_result(result, digest, dryrun)
             except Exception as exception:  # pylint:disable=broad-except
                 result['type'] = 'error'
                 result['exception'] = str(exception)
             return result
         return try_upload
 
-    def upload_all_results(self, group_uuid, samples, dryrun=True):
-        """Upload all samples and results to group."""
-        executor = ThreadPoolExecutor(max_workers=5)
-        results = []
-        for sample_name, tool_results in samples.items():
-            print(f'[uploader {datetime.now()}] creating sample {sample_name}', file=stderr)
-            sample_uuid = self.create_sample(sample_name, group_uuid)
-            futures = []
-            for tool_result in tool_results:
-                result = {
-                    'type': 'success',
-                    'sample_uuid': sample_uuid,
-                    'sample_name': sample_name,
-                    'result_type': tool_result['result_type'],
-                }
-                try_upload = self.get_try_upload(
-                    sample_uuid,
-                    sample_name,
-                    tool_result['result_type'],
-                    result,
-                    tool_result['data'],
-                    dryrun
-                )
-                futures.append(executor.submit(try_upload))
-
-            for future in futures:
-                result = future.result()
-                results.append(result)
-
-        return results
+    def upload_all_results(self, group_uuid,  # pylint:disable=too-many-arguments,too-many-locals
+                           samples, dryrun=True, queue_depth=DEFAULT_QUEUE_DEPTH,
+                           sample_uuids=None):
+        """
+        Upload all samples and results to group.
+
+        `samples` may be a dict of sample payloads or an iterable of
+        (sample_name, tool_results) pairs, such as the generator returned by
+        SampleSource.iter_sample_payloads. Pairs are pulled through a queue of
+        at most `queue_depth` samples so parsing overlaps with uploading; a
+        `queue_depth` of zero consumes `samples` on the calling thread.
+
+        Samples are created on their own threads so the next sample is
+        created while results of the previous one are still uploading,
+        unless `sample_uuids`, such as the map returned by create_samples,
+        has their UUID. At most `max_in_flight` results are submitted but
+        not yet uploaded.
+        """
+        if hasattr(samples, 'items'):
+            samples = samples.items()
+        if queue_depth:
+            samples = iter_prefetched(samples, depth=queue_depth)
+
+        in_flight = BoundedSemaphore(self.max_in_flight)
+        futures = []
+        with ThreadPoolExecutor(max_workers=SAMPLE_WORKERS) as sample_executor, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for sample_name, tool_results in samples:
+                pending, unchanged = self.split_unchanged(sample_name, tool_results, dryrun)
+                for tool_result in unchanged:
+                    futures.append(completed(self.skipped_result(group_uuid, sample_name,
+                                                                 tool_result)))
+                if not pending:
+                    continue
+
+                if sample_uuids is not None and sample_name in sample_uuids:
+                    sample_future = completed(sample_uuids[sample_name])
+                else:
+                    print(f'[uploader {datetime.now()}] creating sample {sample_name}',
+                          file=stderr)
+                    sample_future = sample_executor.submit(self.journaled_create_sample,
+                                                           sample_name, group_uuid)
+                for tool_result, digest in pending:
+                    result = pending_result(group_uuid, sample_name, tool_result)
+                    try_upload = self.get_try_upload(sample_future, result, tool_result['data'],
+                                                     dryrun, digest=digest)
+                    in_flight.acquire()
+                    future = executor.submit(try_upload)
+                    future.add_done_callback(lambda _: in_flight.release())
+                    futures.append(future)
+
+        return [future.result() for future in futures]
+
+    def upload_metadata(self, sample_metadata, batch_size=1):
+        """
+        Upload metadata for many samples over the worker threads.
+
+        `sample_metadata` is an iterable of (sample_name, metadata) pairs,
+        consumed lazily so at most `max_in_flight` batches are in memory.
+        Batches of more than one sample are sent in one request if the
+        server offers a bulk metadata endpoint, otherwise sample by sample.
+
+        Returns a result, of type 'success' or 'error', per sample.
+        """
+        in_flight = BoundedSemaphore(self.max_in_flight)
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for batch in iter_batches(sample_metadata, batch_size):
+                in_flight.acquire()
+                future = executor.submit(self.upload_metadata_batch, batch)
+                future.add_done_callback(lambda _: in_flight.release())
+                futures.append(future)
+        return [result for future in futures for result in future.result()]
+
+    def upload_metadata_batch(self, batch):
+        """Upload a batch of metadata, falling back to a request per sample."""
+        if len(batch) > 1 and self.bulk_endpoints.get(BULK_METADATA_ENDPOINT, True):
+            payload = {'samples': [{'sample_name': str(sample_name), 'metadata': metadata}
+                                   for sample_name, metadata in batch]}
+            try:
+                self.knex.post(BULK_METADATA_ENDPOINT, payload)
+                self.bulk_endpoints[BULK_METADATA_ENDPOINT] = True
+                return [{'type': 'success', 'sample_name': str(sample_name)}
+                        for sample_name, _ in batch]
+            except RequestException as error:
+                # Samples of a batch that failed for any reason are sent one by one
+                if isinstance(error, HTTPError) and is_bulk_unsupported(error):
+                    self.bulk_endpoints[BULK_METADATA_ENDPOINT] = False
+        return [self.upload_sample_metadata(sample_name, metadata)
+                for sample_name, metadata in batch]
+
+    def upload_sample_metadata(self, sample_name, metadata):
+        """Upload metadata for one sample, returning its result."""
+        result = {'type': 'success', 'sample_name': str(sample_name)}
+        payload = {
+            'sample_name': str(sample_name),
+            'metadata': metadata,
+        }
+        try:
+            self.knex.post('/api/v1/samples/metadata', payload)
+        except Exception as exception:  # pylint:disable=broad-except
+            result['type'] = 'error'
+            result['exception'] = str(exception)
+        return result
+
+    def download_results(self, kind, uuids, result_types, dirname):
+        """
+        Download results of samples or sample groups to files over the worker threads.
+
+        `kind` is 'samples' or 'sample_groups' and `uuids` a {name: uuid}
+        map. Each result is written to <dirname>/<name>.<result_type>.json.
+        Files already present are skipped, so an interrupted download
+        resumes where it stopped. Returns a result, of type 'success',
+        'skipped' or 'error', per file.
+        """
+        downloads = [(name, uuid, result_type)
+                     for name, uuid in uuids.items() for result_type in result_types]
+
+        def download(item):
+            """Download one result."""
+            return self.download_result(kind, *item, dirname)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(download, downloads))
+
+    def download_result(self, kind, name,  # pylint:disable=too-many-arguments
+                        uuid, result_type, dirname):
+        """Download one result of a sample or sample group to a file, returning its result."""
+        filename = os.path.join(dirname, f'{name}.{result_type}.json')
+        result = {'type': 'success', 'name': name, 'result_type': result_type,
+                  'filename': filename}
+        # Names could otherwise point the file outside of dirname
+        if not (is_plain_filename(str(name)) and is_plain_filename(result_type)):
+            result['type'] = 'error'
+            result['exception'] = 'name or result type is not a plain file name'
+            return result
+        if os.path.exists(filename):
+            result['type'] = 'skipped'
+            return result
+        try:
+            with span('download_result', 'download', result_type=result_type):
+                result['size'] = self.knex.download(f'/api/v1/{kind}/{uuid}/{result_type}',
+                                                    filename)
+        except Exception as exception:  # pylint:disable=broad-except
+            result['type'] = 'error'
+            result['exception'] = str(exception)
+        return result
@@ -1,7 +1,118 @@
 """Sources for sample data."""
 
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from json import loads
 from sys import stderr
 from metagenscope_cli.tools.parsers import parse, UnparsableError
+from metagenscope_cli.tools.validators import ValidationError, check_size, validate
+from metagenscope_cli.tracing import span
+
+
+def parse_sample(sample_name, sample_schema):
+    """
+    Parse and validate every result of a single sample.
+
+    Returns a list of result payloads and a list of error reports for
+    results that could not be parsed or that the server would reject.
+    """
+    sample_payloads = []
+    errors = []
+    for result_type, files_dict in sample_schema.items():
+        try:
+            data = parse(result_type, files_dict)
+            validate(result_type, data)
+        except UnparsableError:
+            errors.append(f'[parse-error] could not parse {result_type}')
+            continue
+        except KeyError:
+            errors.append(f'[key-error] {sample_name} :: {result_type}')
+            continue
+        except ValidationError as error:
+            errors.append(f'[validation-error] {sample_name} :: {result_type} :: {error}')
+            continue
+
+        result_payload = {
+            'result_type': result_type,
+            'data': data,
+        }
+        sample_payloads.append(result_payload)
+    return sample_payloads, errors
+
+
+def keep_storable(sample_name, results, size, errors):
+    """
+    Return the (result_type, value) pairs whose `size(value)` the server can store.
+
+    Results too large are left out and reported in `errors` instead.
+    """
+    storable = []
+    for result_type, value in results:
+        try:
+            check_size(size(value))
+        except ValidationError as error:
+            errors.append(f'[validation-error] {sample_name} :: {result_type} :: {error}')
+            continue
+        storable.append((result_type, value))
+    return storable
+
+
+def encoded_size(data):
+    """Return the size of the JSON encoding of result data, a chunk at a time."""
+    from metagenscope_cli.network.payloads import iter_encoded
+
+    return sum(len(chunk) for chunk in iter_encoded(data))
+
+
+def encode_data(data):
+    """Return the JSON encoding of result data, as uploaded."""
+    from metagenscope_cli.network.payloads import encode_payload
+
+    return encode_payload(data)
+
+
+def serialize_payloads(sample_name, sample_payloads, errors):
+    """
+    Serialize the data of result payloads to JSON bytes.
+
+    Returns (result_type, serialized) pairs, leaving out results too large
+    for the server, which are reported in `errors` instead.
+    """
+    serialized = [(payload['result_type'], encode_data(payload['data']))
+                  for payload in sample_payloads]
+    return keep_storable(sample_name, serialized, len, errors)
+
+
+def parse_sample_to_json(sample_name, sample_schema):
+    """
+    Parse a single sample in a worker process.
+
+    Each result's data is returned as serialized JSON bytes, which are far
+    cheaper to send back to the parent process than pickled nested
+    dictionaries.
+    """
+    sample_payloads, errors = parse_sample(sample_name, sample_schema)
+    return serialize_payloads(sample_name, sample_payloads, errors), errors
+
+
+def report_errors(errors):
+    """Print parsing error reports."""
+    for error in errors:
+        print(error, file=stderr)
+
+
+def lookup_cached(sample_schema, parse_cache):
+    """Split a sample schema into cached data by result type and the schema left to parse."""
+    if parse_cache is None:
+        return {}, sample_schema
+    return parse_cache.lookup(sample_schema)
+
+
+def order_payloads(sample_schema, data_by_type):
+    """Return result payloads in the order of the sample schema."""
+    return [{'result_type': result_type, 'data': data_by_type[result_type]}
+            for result_type in sample_schema if result_type in data_by_type]
 
 
 class SampleSource(object):
@@ -15,7 +126,54 @@ class SampleSource(object):
         """
         raise NotImplementedError()
 
-    def get_sample_payloads(self):
+    def iter_cataloged_files(self):
+        """
+        Yield (<sample_name>, {<result_type>: {<file_type>: <file_path>}}) pairs.
+
+        Sources that can catalog samples one at a time override this to
+        yield them lazily; by default the whole catalog is built first.
+        """
+        with span('get_cataloged_files', 'catalog'):
+            cataloged_files = self.get_cataloged_files()
+        yield from cataloged_files.items()
+
+    def iter_sample_payloads(self, parse_workers=1, parse_cache=None, report=report_errors):
+        """
+        Yield sample payloads one sample at a time, parsing lazily.
+
+        With more than one `parse_workers` samples are parsed, and
+        validated, concurrently in a process pool; samples are still yielded
+        in catalog order. Results found in `parse_cache`, a ParseCache, are
+        not parsed again and newly parsed results are added to it. Results
+        that fail to parse or validate are left out, and the list of their
+        error reports passed to `report` for each sample.
+
+        yields (<sample_name>, [{
+            'result_type': string,
+            'data': dict (payload),
+        }])
+        """
+        cataloged_files = self.iter_cataloged_files()
+        if parse_workers > 1:
+            yield from iter_parsed_in_pool(cataloged_files, parse_workers, parse_cache,
+                                           report=report)
+            return
+
+        for sample_name, sample_schema in cataloged_files:
+            data_by_type, misses = lookup_cached(sample_schema, parse_cache)
+            sample_payloads, errors = parse_sample(sample_name, misses)
+            # Results are only serialized whole for the cache, uploads stream them
+            parsed = keep_storable(sample_name, [(payload['result_type'], payload['data'])
+                                                 for payload in sample_payloads],
+                                   encoded_size, errors)
+            report(errors)
+            for result_type, data in parsed:
+                data_by_type[result_type] = data
+                if parse_cache is not None:
+                    parse_cache.put(result_type, misses[result_type], encode_data(data))
+            yield sample_name, order_payloads(sample_schema, data_by_type)
+
+    def get_sample_payloads(self, parse_workers=1, parse_cache=None):
         """
         Return list of sample payload components (name, endpoint, and body JSON).
 
@@ -26,24 +184,66 @@ class SampleSource(object):
             }]
         }
         """
-        cataloged_files = self.get_cataloged_files()
-
-        results = {}
-        for sample_name, sample_schema in cataloged_files.items():
-            results[sample_name] = []
-            for result_type, files_dict in sample_schema.items():
-                try:
-                    data = parse(result_type, files_dict)
-                except UnparsableError:
-                    print(f'[parse-error] could not parse {result_type}', file=stderr)
-                    continue
-                except KeyError:
-                    print(f'[key-error] {sample_name} :: {result_type}', file=stderr)
-
-                result_payload = {
-                    'result_type': result_type,
-                    'data': data,
-                }
-                results[sample_name].append(result_payload)
-
-        return results
+        return dict(self.iter_sample_payloads(parse_workers=parse_workers,
+                                              parse_cache=parse_cache))
+
+
+class CatalogSource(SampleSource):
+    """Samples from a catalog built beforehand, such as one listed to create samples in bulk."""
+
+    def __init__(self, cataloged_files):
+        """Initialize CatalogSource from a list of (sample_name, sample_schema) pairs."""
+        self.cataloged_files = cataloged_files
+
+    def get_cataloged_files(self):
+        """Return dictionary of files cataloged by sample and type."""
+        return dict(self.cataloged_files)
+
+    def iter_cataloged_files(self):
+        """Yield the cataloged samples and their files, in catalog order."""
+        yield from self.cataloged_files
+
+
+def pool_context():
+    """
+    Return a multiprocessing context whose workers are not forked from this process.
+
+    Pools may be started from threads, such as the prefetching producer, and
+    forking a multithreaded process can copy a held lock, like the tracer's,
+    into a worker that then deadlocks on it.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def iter_parsed_in_pool(cataloged_files, parse_workers, parse_cache=None,
+                        report=report_errors):
+    """
+    Parse cataloged (sample_name, sample_schema) pairs over a process pool, in order.
+
+    At most two samples per worker are in flight so memory use does not
+    grow with the size of the catalog.
+    """
+    with ProcessPoolExecutor(max_workers=parse_workers, mp_context=pool_context()) as executor:
+        pending = deque()
+        for sample_name, sample_schema in cataloged_files:
+            data_by_type, misses = lookup_cached(sample_schema, parse_cache)
+            future = executor.submit(parse_sample_to_json, sample_name, misses)
+            pending.append((sample_name, sample_schema, data_by_type, future))
+            if len(pending) >= 2 * parse_workers:
+                yield collect_parsed_sample(*pending.popleft(), parse_cache, report)
+        while pending:
+            yield collect_parsed_sample(*pending.popleft(), parse_cache, report)
+
+
+def collect_parsed_sample(sample_name,  # pylint:disable=too-many-arguments
+                          sample_schema, data_by_type, future, parse_cache, report):
+    """Wait for a sample parsed in the pool, report its errors, then decode and cache it."""
+    serialized_results, errors = future.result()
+    report(errors)
+    for result_type, serialized in serialized_results:
+        data_by_type[result_type] = loads(serialized.decode('utf-8'))
+        if parse_cache is not None:
+            parse_cache.put(result_type, sample_schema[result_type], serialized)
+    return sample_name, order_payloads(sample_schema, data_by_type)
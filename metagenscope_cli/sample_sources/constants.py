@@ -11,3 +11,6 @@ UNSUPPORTED_RESULT_TYPES = [
     'bracken_abundance_estimation',
     'raw_short_read_dna',
 ]
+
+# Threads walking result and file records of DataSuper samples ahead of parsing
+RESOLVE_WORKERS = 4
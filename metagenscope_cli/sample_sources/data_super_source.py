@@ -1,35 +1,108 @@
 """Samples from a DataSuper repository."""
 
+import os.path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from sys import stderr
+
 import datasuper as ds
 
 from metagenscope_cli.sample_sources import SampleSource
+from metagenscope_cli.tracing import span
 
-from .constants import UNSUPPORTED_RESULT_TYPES
+from .constants import RESOLVE_WORKERS, UNSUPPORTED_RESULT_TYPES
 
 
 class DataSuperSource(SampleSource):
     """Samples from a DataSuper repository."""
 
-    def __init__(self, all_samples=True):
-        """Initialize a DataSuperSource instance."""
-        self.all_samples = all_samples
+    def __init__(self, sample_names=None, result_types=None, modified_since=None,
+                 resolve_workers=RESOLVE_WORKERS):
+        """
+        Initialize a DataSuperSource instance.
 
-    def get_cataloged_files(self):
-        """Return dictionary of files cataloged by sample and type."""
-        repo = ds.Repo.loadRepo()
-        samples = repo.sampleTable.getAll()
+        Only samples named in `sample_names` and results of `result_types`
+        are cataloged, if given, and only results with a file modified at
+        or after `modified_since`, a datetime, if given. File paths of
+        upcoming samples are resolved over `resolve_workers` threads.
+        """
+        self.sample_names = sample_names
+        self.result_types = None if result_types is None else set(result_types)
+        self.modified_since = modified_since
+        self.resolve_workers = resolve_workers
 
-        catalog = {}
-        for sample in samples:
-            catalog[sample.name] = {}
+    def iter_samples(self, repo):
+        """Yield the sample records to catalog."""
+        if self.sample_names is None:
+            # Records are built one at a time, so cataloging starts straight away.
+            # Loaders read the generator's current row, so each is called before advancing it
+            for _, load_sample in repo.sampleTable.getAllLazily():
+                yield load_sample()
+            return
+        for sample_name in self.sample_names:
+            try:
+                yield repo.sampleTable.get(sample_name)
+            except KeyError:
+                print(f'[catalog-error] no sample {sample_name}', file=stderr)
+
+    def is_modified(self, files_dict):
+        """Return True if any file of a result was modified since `modified_since`."""
+        if self.modified_since is None:
+            return True
+        since = self.modified_since.timestamp()
+        for file_path in files_dict.values():
+            try:
+                if os.path.getmtime(file_path) >= since:
+                    return True
+            except OSError:
+                # Leave missing files for parsing to report
+                return True
+        return False
+
+    def catalog_sample(self, sample):
+        """Return the files of a sample's wanted results, by result type."""
+        with span('catalog_sample', 'catalog', sample_name=sample.name):
+            sample_schema = {}
             for result in sample.results():
                 result_type = result.resultType()
                 if result_type in UNSUPPORTED_RESULT_TYPES:
                     continue
+                if self.result_types is not None and result_type not in self.result_types:
+                    continue
 
-                catalog[sample.name][result_type] = {
+                files_dict = {
                     file_type: file_record.filepath()
                     for file_type, file_record in result.files()
                 }
+                if self.is_modified(files_dict):
+                    sample_schema[result_type] = files_dict
+            return sample_schema
+
+    def iter_cataloged_files(self):
+        """
+        Yield samples and their files one sample at a time.
+
+        Samples are cataloged on worker threads, at most two per worker
+        ahead of the consumer, and yielded in repository order. Samples left
+        with no results after filtering are skipped.
+        """
+        repo = ds.Repo.loadRepo()
+        with ThreadPoolExecutor(max_workers=self.resolve_workers) as executor:
+            pending = deque()
+            for sample in self.iter_samples(repo):
+                pending.append((sample.name, executor.submit(self.catalog_sample, sample)))
+                if len(pending) >= 2 * self.resolve_workers:
+                    yield from non_empty(*pending.popleft())
+            while pending:
+                yield from non_empty(*pending.popleft())
+
+    def get_cataloged_files(self):
+        """Return dictionary of files cataloged by sample and type."""
+        return dict(self.iter_cataloged_files())
+
 
-        return catalog
+def non_empty(sample_name, future):
+    """Yield a cataloged sample once resolved, unless it has no results."""
+    sample_schema = future.result()
+    if sample_schema:
+        yield sample_name, sample_schema
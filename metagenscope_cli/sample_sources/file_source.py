@@ -1,42 +1,143 @@
-"""Samples from a list of files."""
+"""Samples from a list of files, directories or a manifest."""
+
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from fnmatch import translate
+from sys import stderr
 
 from metagenscope_cli.sample_sources import SampleSource
+from metagenscope_cli.tools.parsers import JSON_TOOLS, SIMPLE_PARSE
 
 from .constants import UNSUPPORTED_RESULT_TYPES
 
 
+# Result types with a parser, files of other types are not results
+PARSED_RESULT_TYPES = set(JSON_TOOLS) | set(SIMPLE_PARSE)
+
+
 def parse_file_path(file_path):
     """Extract file metadata from its path."""
-    file_name = file_path.split('/')[-1]
-    name_components = file_name.split('.')
+    file_name = file_path.rsplit('/', 1)[-1]
+    sample_name, result_type, file_type = file_name.split('.', 3)[:3]
+    return sample_name, result_type, file_type
 
-    sample_name = name_components[0]
-    result_type = name_components[1]
-    file_type = name_components[2]
 
-    return sample_name, result_type, file_type
+def is_exactly_named(file_path):
+    """Return True if a file is named <sample_name>.<result_type>.<file_type>, no more."""
+    return file_path.rsplit('/', 1)[-1].count('.') == 2
+
+
+def pick_file(key, kept, found):
+    """Report two files naming the same result file, returning the one to catalog."""
+    # Prefer the exact name, such as s1.kraken.mpa over s1.kraken.mpa.bak,
+    # then the first path, so the choice does not depend on scanning order
+    chosen = min(kept, found, key=lambda path: (not is_exactly_named(path), path))
+    print(f'[catalog-error] {key[0]} :: {key[1]} :: {key[2]} is named by both {kept} '
+          f'and {found}, using {chosen}', file=stderr)
+    return chosen
+
+
+def scan_directory(dirname):
+    """Return the files and the subdirectories directly inside a directory."""
+    file_paths = []
+    subdirectories = []
+    with os.scandir(dirname) as entries:
+        for entry in entries:
+            # Do not follow links to directories, which may loop
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file():
+                file_paths.append(entry.path)
+    return file_paths, subdirectories
+
+
+def walk_files(top, scan_workers=1):
+    """
+    Yield paths of every file under a directory.
+
+    With more than one `scan_workers` subdirectories are scanned
+    concurrently, and files are yielded in no particular order.
+    """
+    if scan_workers <= 1:
+        directories = [top]
+        while directories:
+            file_paths, subdirectories = scan_directory(directories.pop())
+            yield from file_paths
+            directories.extend(subdirectories)
+        return
+
+    with ThreadPoolExecutor(max_workers=scan_workers) as executor:
+        pending = {executor.submit(scan_directory, top)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_paths, subdirectories = future.result()
+                pending |= {executor.submit(scan_directory, subdirectory)
+                            for subdirectory in subdirectories}
+                yield from file_paths
+
+
+def read_manifest(manifest):
+    """Yield the paths listed one per line in an open manifest file, such as stdin."""
+    for line in manifest:
+        path = line.strip()
+        if path:
+            yield path
 
 
 class FileSource(SampleSource):
-    """Samples from a list of files."""
+    """Samples from a list of files, directories or a manifest."""
+
+    def __init__(self, files, pattern=None, regex=None, scan_workers=1):
+        """
+        Initialize FileSource from an iterable of files and directories.
 
-    def __init__(self, files):
-        """Initialize FileSource from list of files."""
+        Directories are scanned for files, over `scan_workers` threads.
+        Files are named <sample_name>.<result_type>.<file_type>; only those
+        whose name matches the glob `pattern` and the regular expression
+        `regex`, if given, are cataloged.
+        """
         self.files = files
+        self.scan_workers = scan_workers
+        self.matchers = []
+        if pattern is not None:
+            self.matchers.append(re.compile(translate(pattern)).match)
+        if regex is not None:
+            self.matchers.append(re.compile(regex).search)
+
+    def iter_files(self):
+        """Yield the path of every file given or found in a given directory."""
+        for path in self.files:
+            if os.path.isdir(path):
+                yield from walk_files(path, scan_workers=self.scan_workers)
+            else:
+                yield path
+
+    def is_result_file(self, file_path):
+        """Return True if a file is named like a result and matches every filter."""
+        file_name = file_path.rsplit('/', 1)[-1]
+        # Hidden files, such as the local stores, are never results
+        if file_name.startswith('.') or file_name.count('.') < 2:
+            return False
+        return all(matcher(file_name) for matcher in self.matchers)
 
     def get_cataloged_files(self):
-        """Return dictionary of files cataloged by sample and type."""
+        """
+        Return dictionary of files cataloged by sample and type.
+
+        Files of result types without a parser are skipped. Files naming
+        the same result file are reported, and only one of them cataloged.
+        """
         catalog = {}
-        for file in self.files:
-            sample_name, result_type, file_type = parse_file_path(file)
-            if result_type in UNSUPPORTED_RESULT_TYPES:
+        for file in self.iter_files():
+            if not self.is_result_file(file):
                 continue
-
-            try:
-                try:
-                    catalog[sample_name][result_type][file_type] = file
-                except KeyError:
-                    catalog[sample_name][result_type] = {file_type: file}
-            except KeyError:
-                catalog[sample_name] = {result_type: {file_type: file}}
+            key = sample_name, result_type, file_type = parse_file_path(file)
+            if result_type in UNSUPPORTED_RESULT_TYPES or result_type not in PARSED_RESULT_TYPES:
+                continue
+            files_dict = catalog.setdefault(sample_name, {}).setdefault(result_type, {})
+            if file_type in files_dict:
+                file = pick_file(key, files_dict[file_type], file)
+            files_dict[file_type] = file
         return catalog
@@ -0,0 +1,48 @@
+"""Measure parsing throughput and peak memory."""
+
+import tracemalloc
+from time import perf_counter
+
+from .parsers import parse
+
+
+def count_rows(files_dict):
+    """Return the total number of lines in a result's files."""
+    rows = 0
+    for file_path in files_dict.values():
+        with open(file_path, 'rb') as file:
+            rows += sum(1 for _ in file)
+    return rows
+
+
+def benchmark_parse(result_type, files_dict, repeat=1):
+    """
+    Parse a tool result `repeat` times, measuring the fastest run.
+
+    Returns a dictionary of the rows parsed, the best time in seconds, the
+    rows parsed per second and the peak memory, in bytes, allocated by a
+    parse.
+    """
+    rows = count_rows(files_dict)
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        parse(result_type, files_dict)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # Tracing allocations slows parsing down, so measure memory separately
+    tracemalloc.start()
+    try:
+        parse(result_type, files_dict)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'result_type': result_type,
+        'rows': rows,
+        'seconds': best,
+        'rows_per_second': rows / best if best else float('inf'),
+        'peak_memory': peak_memory,
+    }
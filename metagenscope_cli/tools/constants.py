@@ -26,6 +26,10 @@ ANCESTRY = 'human_ancestry'
 
 
 # Other
+# Bump whenever parsers change their output, invalidating cached payloads;
+# version 2 only caches results that pass validation
+PARSER_VERSION = '2'
+
 TAXON_KEY = 'taxon'
 ABUNDANCE_KEY = 'abundance'
 
@@ -0,0 +1,134 @@
+"""Persistent cache of parsed tool results."""
+
+import os.path
+import sqlite3
+import zlib
+from hashlib import sha256
+from json import loads
+from threading import Lock
+from time import time
+
+from metagenscope_cli.constants import DEFAULT_PARSE_CACHE_SIZE
+
+from .constants import PARSER_VERSION
+
+
+PARSE_CACHE_FILENAME = '.metagenscope_parse_cache.sqlite'
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS parsed_results (
+    fingerprint TEXT PRIMARY KEY, payload BLOB, size INTEGER, last_used REAL)'''
+
+
+def fingerprint(result_type, files_dict):
+    """
+    Return a fingerprint of the files behind a tool result.
+
+    The fingerprint covers the parser version, the result type and the
+    path, size and modification time of every file, so it changes whenever
+    parsing could give a different payload. Returns None if a file is
+    missing.
+    """
+    parts = [PARSER_VERSION, result_type]
+    for file_type in sorted(files_dict):
+        file_path = os.path.abspath(files_dict[file_type])
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        parts.append(f'{file_type}:{file_path}:{stat.st_size}:{stat.st_mtime_ns}')
+    return sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+class ParseCache(object):
+    """
+    Cache of parsed tool results, stored compressed in SQLite.
+
+    Entries are keyed by file fingerprint. Once the compressed payloads
+    exceed `max_size` megabytes the least recently used ones are evicted.
+    A cache may be shared between threads.
+    """
+
+    def __init__(self, filename, dirname='~', max_size=DEFAULT_PARSE_CACHE_SIZE):
+        """Open cache file, creating it if needed."""
+        expanded_dirname = os.path.expanduser(dirname)
+        self.cache_filename = os.path.join(expanded_dirname, filename)
+        self.max_bytes = max_size * 1024 * 1024
+        self.lock = Lock()
+        self.connection = sqlite3.connect(self.cache_filename, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(SCHEMA)
+            total = self.connection.execute('SELECT SUM(size) FROM parsed_results').fetchone()
+        self.total_bytes = total[0] or 0
+
+    def close(self):
+        """Close the cache file."""
+        self.connection.close()
+
+    def get(self, result_type, files_dict):
+        """Return the cached payload for a tool result, or None."""
+        key = fingerprint(result_type, files_dict)
+        if key is None:
+            return None
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                'SELECT payload FROM parsed_results WHERE fingerprint = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute(
+                'UPDATE parsed_results SET last_used = ? WHERE fingerprint = ?', (time(), key)
+            )
+        return loads(zlib.decompress(row[0]).decode('utf-8'))
+
+    def put(self, result_type, files_dict, serialized):
+        """Store the JSON serialized payload of a tool result."""
+        key = fingerprint(result_type, files_dict)
+        if key is None:
+            return
+        payload = zlib.compress(serialized)
+        if len(payload) > self.max_bytes:
+            return
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO parsed_results VALUES (?, ?, ?, ?)',
+                (key, payload, len(payload), time())
+            )
+            self.evict()
+
+    def evict(self):
+        """
+        Drop least recently used entries until the cache fits, holding the lock.
+
+        The size of the cache is summed from the table, which other
+        processes sharing the cache file may have grown since it was opened.
+        """
+        total = self.connection.execute('SELECT SUM(size) FROM parsed_results').fetchone()
+        self.total_bytes = total[0] or 0
+        if self.total_bytes <= self.max_bytes:
+            return
+        rows = self.connection.execute(
+            'SELECT fingerprint, size FROM parsed_results ORDER BY last_used'
+        )
+        evicted = []
+        for key, size in rows:
+            if self.total_bytes <= self.max_bytes:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+        self.connection.executemany('DELETE FROM parsed_results WHERE fingerprint = ?', evicted)
+
+    def lookup(self, sample_schema):
+        """
+        Split a sample schema into cached payloads and results left to parse.
+
+        Returns a dictionary of cached data by result type and the schema of
+        results that were not cached.
+        """
+        cached, misses = {}, {}
+        for result_type, files_dict in sample_schema.items():
+            data = self.get(result_type, files_dict)
+            if data is None:
+                misses[result_type] = files_dict
+            else:
+                cached[result_type] = data
+        return cached, misses
@@ -1,18 +1,90 @@
 """Parser for Sample metadata."""
 
-import pandas as pd
+import csv
+import gzip
 
 NA_TOKEN = 'n/a'
 
+# Values read as missing, the default NA values of pandas.read_csv
+NA_VALUES = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+    '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+])
+
+
+def open_metadata(filename):
+    """Open a metadata file as text, decompressing it if it is gzipped."""
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rt', newline='')
+    return open(filename, newline='')
+
+
+def column_names(header):
+    """Name unnamed and deduplicate repeated columns as pandas does."""
+    names = []
+    seen = {}
+    for index, name in enumerate(header):
+        if not name:
+            name = f'Unnamed: {index}'
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        seen.setdefault(name, 0)
+        names.append(name)
+    return names
+
+
+def na_filled(value):
+    """Return a value, or NA_TOKEN if it is missing."""
+    return NA_TOKEN if value in NA_VALUES else value
+
+
+def iter_metadata(filename, sample_names=None,  # pylint:disable=too-many-locals
+                  columns=None, delimiter=','):
+    """
+    Yield (sample_name, metadata) pairs from a delimited metadata file, row by row.
+
+    The first column names samples and the header names metadata fields.
+    Missing values are NA_TOKEN. Only rows for `sample_names`, if given, are
+    read into memory, followed by NA_TOKEN metadata for requested samples
+    the file lacks. `columns`, if given, selects the metadata fields kept.
+
+    Every row is checked, so a sample named twice anywhere in the file
+    raises ValueError, as it did when the file was read into a DataFrame,
+    whether or not it was requested.
+    """
+    wanted = None if sample_names is None else set(sample_names)
+    seen = set()
+    with open_metadata(filename) as metadata_file:
+        reader = csv.reader(metadata_file, delimiter=delimiter)
+        names = column_names(next(reader, []))[1:]
+        if columns is None:
+            columns = names
+        unknown = [column for column in columns if column not in names]
+        if unknown:
+            raise ValueError(f'{filename} has no columns {", ".join(unknown)}')
+        indices = [names.index(column) + 1 for column in columns]
+
+        for row in reader:
+            if not row:
+                continue
+            if len(row) > len(names) + 1:
+                raise ValueError(f'{filename} row {reader.line_num} has too many fields')
+            sample_name = na_filled(row[0])
+            if sample_name in seen:
+                raise ValueError(f'{filename} repeats sample {sample_name}')
+            seen.add(sample_name)
+            if wanted is not None and sample_name not in wanted:
+                continue
+            yield sample_name, {column: na_filled(row[index]) if index < len(row) else NA_TOKEN
+                                for column, index in zip(columns, indices)}
+
+    for sample_name in sample_names or []:
+        if sample_name not in seen:
+            seen.add(sample_name)
+            yield sample_name, {column: NA_TOKEN for column in columns}
+
 
 def parse_metadata_from_csv(csv_filename, sample_names):
     """Parse sample metadata from a .csv file."""
-    metadata_df = pd.read_csv(csv_filename, index_col=None, dtype=str).fillna(NA_TOKEN)
-    colnames = list(metadata_df.columns.values)
-    metadata_df = metadata_df.set_index(colnames[0])
-    tbl = metadata_df.to_dict(orient='index')
-    for sample_name in sample_names:
-        if sample_name not in tbl:
-            tbl[sample_name] = {colname: NA_TOKEN for colname in colnames}
-    metadata_df = pd.DataFrame.from_dict(tbl, orient='index').fillna(NA_TOKEN)
-    return metadata_df.to_dict(orient='index')
+    return dict(iter_metadata(csv_filename, sample_names=sample_names or None))
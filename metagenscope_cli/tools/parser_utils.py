@@ -1,9 +1,14 @@
 """Parsing utilities."""
 
+from collections import Counter
+from functools import partial
+from heapq import heapify, heappush, heapreplace, nsmallest
 from json import loads
 
+from . import vectorized
 from .constants import (RPK_KEY, RPKM_KEY, RPKMG_KEY, TOP_N_FILTER, ABUNDANCE_KEY,
                         COVERAGE_KEY, GENOME_EQUIVALENTS_KEY, AGS_KEY, TOTAL_BASES_KEY)
+from .vectorized import IrregularFileError
 
 
 def jloads(fname):
@@ -16,28 +21,152 @@ def scrub_keys(key):
     return '_'.join(key.split('.'))
 
 
+def tokenize_lines(lines, sep='\t', skipchar='#'):
+    """Tokenize lines of a tabular file."""
+    for line in lines:
+        stripped = line.strip()
+        if stripped[0] == skipchar:
+            continue
+        tkns = stripped.split(sep)
+        if len(tkns) >= 2:
+            yield tkns
+
+
 def tokenize(file_name, skip=0, sep='\t', skipchar='#'):
     """Tokenize a tabular file."""
     with open(file_name) as file:
         for _ in range(skip):
             file.readline()
-        for line in file:
-            stripped = line.strip()
-            if stripped[0] == skipchar:
-                continue
-            tkns = stripped.split(sep)
-            if len(tkns) >= 2:
-                yield tkns
+        yield from tokenize_lines(file, sep=sep, skipchar=skipchar)
+
+
+def key_val_pairs(tokens, kind=float, key_column=0, val_column=1):
+    """Yield (key, value) pairs from tokenized lines."""
+    for token in tokens:
+        yield scrub_keys(token[key_column]), kind(token[val_column])
+
+
+def iter_key_val_file(filename,                                 # pylint:disable=too-many-arguments
+                      skip=0, skipchar='#', sep='\t',
+                      kind=float, key_column=0, val_column=1):
+    """Yield (key, value) pairs from a key-value-type file."""
+    tokens = tokenize(filename, skip=skip, sep=sep, skipchar=skipchar)
+    return key_val_pairs(tokens, kind=kind, key_column=key_column, val_column=val_column)
 
 
 def parse_key_val_file(filename,                                # pylint:disable=too-many-arguments
                        skip=0, skipchar='#', sep='\t',
                        kind=float, key_column=0, val_column=1):
     """Parse a key-value-type file."""
-    tokens = tokenize(filename, skip=skip, sep=sep, skipchar=skipchar)
-    out = {scrub_keys(token[key_column]): kind(token[val_column])
-           for token in tokens}
-    return out
+    pairs = iter_key_val_file(filename, skip=skip, skipchar=skipchar, sep=sep,
+                              kind=kind, key_column=key_column, val_column=val_column)
+    return dict(pairs)
+
+
+def top_n(pairs, rank=lambda pair: pair[1], limit=TOP_N_FILTER):
+    """
+    Return the `limit` highest ranked (key, value) pairs, highest first.
+
+    As when the pairs are read into a dictionary, a repeated key keeps its
+    last value at the position it first appeared. The result is identical
+    to a stable descending sort of that dictionary truncated to `limit`,
+    so ties keep their order of appearance.
+    """
+    return nsmallest(limit, dict(pairs).items(), key=lambda pair: -rank(pair))
+
+
+def select_top(pairs, rank, limit):
+    """
+    Return the `limit` highest ranked pairs and the keys tied with the lowest of them.
+
+    Selection is a single pass over `pairs` holding at most `limit` of them
+    in a heap, ties keeping their order of appearance. A key repeated while
+    held in the heap keeps its last value at the position it first appeared,
+    as in top_n; if that lowers it below a pair already left out, the exact
+    selection needs every pair again and None is returned in place of it.
+    The keys of pairs left out with the same rank as the lowest selected are
+    also returned.
+    """
+    heap, held = [], {}
+    best_left_out = None
+    tied_rank, tied_keys = None, set()
+    for index, pair in enumerate(pairs):
+        entry = (rank(pair), -index, pair)
+        key = pair[0]
+        if key in held:
+            old = held[key]
+            entry = held[key] = (entry[0], old[1], pair)
+            if best_left_out is not None and entry[0] < old[0] and entry[0] <= best_left_out:
+                return None, set()
+            heap[heap.index(old)] = entry
+            heapify(heap)
+            continue
+        if len(heap) < limit:
+            heappush(heap, entry)
+            held[key] = entry
+            continue
+        if entry > heap[0]:
+            held[key] = entry
+            entry = heapreplace(heap, entry)
+            del held[entry[2][0]]
+        if best_left_out is None or entry[0] > best_left_out:
+            best_left_out = entry[0]
+        if entry[0] == heap[0][0]:
+            if entry[0] != tied_rank:
+                tied_rank, tied_keys = entry[0], set()
+            tied_keys.add(entry[2][0])
+    if not heap or tied_rank != heap[0][0]:
+        tied_keys = set()
+    return [pair for _, _, pair in sorted(heap, reverse=True)], tied_keys
+
+
+def repeats_any(pairs, keys):
+    """Return True if any of `keys` appears more than once among (key, value) pairs."""
+    seen = set()
+    for key, _ in pairs:
+        if key in keys:
+            if key in seen:
+                return True
+            seen.add(key)
+    return False
+
+
+def tied_keys_of(top, tied_keys, rank):
+    """Return the keys of `top` sharing their rank with another pair, with `tied_keys`."""
+    ranks = Counter(rank(pair) for pair in top)
+    if tied_keys:
+        ranks[rank(top[-1])] += 1
+    return {pair[0] for pair in top if ranks[rank(pair)] > 1} | tied_keys
+
+
+def top_n_bounded(candidates, repeated, read_pairs,  # pylint:disable=too-many-arguments
+                  rank=lambda pair: pair[1], limit=TOP_N_FILTER):
+    """
+    Return what top_n returns for the pairs of a file, in bounded memory.
+
+    `candidates` is a pair of the pairs of the file that may rank in the
+    top, in order, and whether those are every pair of the file. Repeats of
+    keys held by select_top are merged as it goes, so over every pair only
+    a key left out and seen again can misplace a tie: `repeated` is called
+    with the tied keys, and when it finds one repeated in the file, or over
+    a filtered subset of the pairs with any selected key, the pairs from
+    `read_pairs()` are ranked by top_n, which holds every key in memory.
+    """
+    pairs, complete = candidates
+    top, tied_keys = select_top(pairs, rank, limit)
+    if top is None:
+        return top_n(read_pairs(), rank=rank, limit=limit)
+    keys = tied_keys_of(top, tied_keys, rank) if complete else {key for key, _ in top}
+    if keys and repeated(keys):
+        return top_n(read_pairs(), rank=rank, limit=limit)
+    return top
+
+
+def top_key_val_pairs(filename):
+    """Return the top ranked (key, value) pairs of a key-value-type file."""
+    return top_n_bounded((iter_key_val_file(filename), True),
+                         lambda keys: repeats_any(iter_key_val_file(filename), keys),
+                         partial(iter_key_val_file, filename))
 
 
 def parse_resistome_tables(gene_table, group_table,
@@ -63,11 +192,12 @@ def parse_resistome_tables(gene_table, group_table,
 
 def parse_humann2_tables(rpkm_file, rpkmg_file):
     """Ingest Humann2 table file."""
-    rpkms = parse_key_val_file(rpkm_file)
-    rpkmgs = parse_key_val_file(rpkmg_file)
+    rpkms = top_key_val_pairs(rpkm_file)
+    # Only keep RPKMG values for the genes that survived the top N filter
+    top_genes = {gene for gene, _ in rpkms}
+    rpkmgs = {gene: rpkmg for gene, rpkmg in iter_key_val_file(rpkmg_file)
+              if gene in top_genes}
     data = {}
-    rpkms = [(gene, rpkm) for gene, rpkm in rpkms.items()]
-    rpkms = sorted(rpkms, key=lambda x: -x[1])[:TOP_N_FILTER]
     for gene, rpkm in rpkms:
         row = {
             RPK_KEY: rpkm,  # hack since rpk does not matter
@@ -93,30 +223,64 @@ def parse_humann2_pathways(path_abunds, path_covs):
     return data
 
 
-def parse_gene_table(gene_table):
-    """Return a parsed gene quantification table."""
-    data = {}
+def gene_table_rows(lines):
+    """Yield (gene_name, row) pairs from lines of a gene quantification table."""
+    for line in lines:
+        tkns = line.strip().split(',')
+        gene_name = tkns[0]
+        row = {
+            RPK_KEY: float(tkns[1]),
+            RPKM_KEY: float(tkns[2]),
+            RPKMG_KEY: float(tkns[3]),
+        }
+        yield scrub_keys(gene_name), row
+
+
+def iter_gene_table(gene_table):
+    """Yield (gene_name, row) pairs from a gene quantification table."""
     with open(gene_table) as gfile:
         gfile.readline()
-        for line in gfile:
-            tkns = line.strip().split(',')
-            gene_name = tkns[0]
-            row = {
-                RPK_KEY: float(tkns[1]),
-                RPKM_KEY: float(tkns[2]),
-                RPKMG_KEY: float(tkns[3]),
-            }
-            data[scrub_keys(gene_name)] = row
-    data = [(key, val) for key, val in data.items()]
-    data = sorted(data, key=lambda x: -x[1][RPKM_KEY])[:TOP_N_FILTER]
-    data = {key: val for key, val in data}
-    return data
+        yield from gene_table_rows(gfile)
+
+
+def iter_top_gene_candidates(gene_table):
+    """
+    Return (gene_name, row) pairs from a gene table for select_top, and whether all.
+
+    Large tables give only the rows that may be among the top ranked.
+    """
+    if vectorized.prefer_vectorized(gene_table):
+        try:
+            lines = vectorized.top_candidate_lines(gene_table, 2, sep=',', skip=1,
+                                                   limit=TOP_N_FILTER)
+            return gene_table_rows(lines), False
+        except IrregularFileError:
+            pass
+    return iter_gene_table(gene_table), True
+
+
+def gene_keys_repeated(gene_table, keys):
+    """Return True if any of `keys` names more than one row of a gene table."""
+    if vectorized.prefer_vectorized(gene_table):
+        try:
+            return vectorized.keys_repeated(gene_table, 0, keys, sep=',', skip=1)
+        except IrregularFileError:
+            pass
+    return repeats_any(iter_gene_table(gene_table), keys)
+
+
+def parse_gene_table(gene_table):
+    """Return a parsed gene quantification table."""
+    data = top_n_bounded(iter_top_gene_candidates(gene_table),
+                         partial(gene_keys_repeated, gene_table),
+                         partial(iter_gene_table, gene_table),
+                         rank=lambda pair: pair[1][RPKM_KEY])
+    return {key: val for key, val in data}
 
 
 def parse_mpa(mpa_file):
     """Ingest MPA results file."""
-    data = [(taxa, val) for taxa, val in parse_key_val_file(mpa_file).items()]
-    data = sorted(data, key=lambda x: -x[1])[:TOP_N_FILTER]
+    data = top_key_val_pairs(mpa_file)
     return {key: val for key, val in data}
 
 
@@ -1,5 +1,7 @@
 """Parsers for different Tool Result types."""
 
+from metagenscope_cli.tracing import span
+
 from . import parser_utils as utils, constants as const
 
 
@@ -39,11 +41,12 @@ SIMPLE_PARSE = {
 
 def parse(tool_type, schema):
     """Parse schema as tool_type."""
-    if tool_type in JSON_TOOLS:
-        key = JSON_TOOLS[tool_type]
-        return utils.jloads(schema[key])
-    elif tool_type in SIMPLE_PARSE:
-        func = SIMPLE_PARSE[tool_type][0]
-        fnames = [schema[key] for key in SIMPLE_PARSE[tool_type][1:]]
-        return func(*fnames)
+    with span('parse', 'parse', result_type=tool_type):
+        if tool_type in JSON_TOOLS:
+            key = JSON_TOOLS[tool_type]
+            return utils.jloads(schema[key])
+        elif tool_type in SIMPLE_PARSE:
+            func = SIMPLE_PARSE[tool_type][0]
+            fnames = [schema[key] for key in SIMPLE_PARSE[tool_type][1:]]
+            return func(*fnames)
     raise UnparsableError(f'{tool_type}, {schema}')
@@ -0,0 +1,111 @@
+"""Deterministic synthetic tool result files, for benchmarks and tests."""
+
+import json
+import os.path
+from random import Random
+
+from . import constants as const
+from .parsers import JSON_TOOLS, SIMPLE_PARSE
+
+
+RANKS = ['k', 'p', 'c', 'o', 'f', 'g', 's']
+
+
+def taxon_name(index):
+    """Return an MPA style taxon name, deeper for higher indices."""
+    depth = 1 + index % len(RANKS)
+    return '|'.join(f'{rank}__taxon_{index}_{rank}' for rank in RANKS[:depth])
+
+
+def write_key_val(path, rows, rng, header='#header\tvalue', kind=float):
+    """Write a tab separated key-value file of `rows` rows."""
+    with open(path, 'w') as file:
+        file.write(header + '\n')
+        for index in range(rows):
+            value = rng.randint(0, 10 ** 6) if kind is int else rng.random() * 100
+            file.write(f'{taxon_name(index)}\t{value}\n')
+
+
+def write_mpa(path, rows, rng):
+    """Write an MPA (Kraken, MetaPhlAn2 or KrakenHLL report) file."""
+    write_key_val(path, rows, rng, header='#SampleID\tMetaphlan2_Analysis')
+
+
+def write_gene_table(path, rows, rng):
+    """Write a comma separated gene quantification table."""
+    with open(path, 'w') as file:
+        file.write('gene,rpk,rpkm,rpkmg\n')
+        for index in range(rows):
+            rpkm = rng.random() * 1000
+            file.write(f'gene.{index},{rpkm * 2},{rpkm},{rpkm / 3}\n')
+
+
+def write_genes(path, rows, rng):
+    """Write a HUMAnN2 normalized gene family file."""
+    with open(path, 'w') as file:
+        file.write('# Gene Family\tAbundance\n')
+        for index in range(rows):
+            file.write(f'UniRef90_{index}\t{rng.random() * 100}\n')
+
+
+def write_resistome(path, rows, rng):
+    """Write a resistome table, keys in the second column and counts in the third."""
+    with open(path, 'w') as file:
+        file.write('Sample\tName\tHits\n')
+        for index in range(rows):
+            file.write(f'sample\tclass_{index}\t{rng.randint(0, 10 ** 4)}\n')
+
+
+def write_microbe_census(path, rows, rng):  # pylint:disable=unused-argument
+    """Write a MicrobeCensus stats file, which is always a few lines long."""
+    with open(path, 'w') as file:
+        file.write('Results\n')
+        file.write(f'{const.AGS_KEY}:\t{rng.random() * 10 ** 6}\n')
+        file.write(f'{const.TOTAL_BASES_KEY}:\t{rng.randint(10 ** 8, 10 ** 9)}\n')
+        file.write(f'{const.GENOME_EQUIVALENTS_KEY}:\t{rng.random() * 100}\n')
+
+
+def write_json(path, rows, rng):
+    """Write a JSON object of `rows` numeric entries."""
+    data = {f'key_{index}': rng.random() for index in range(rows)}
+    with open(path, 'w') as file:
+        json.dump(data, file)
+
+
+WRITERS = {
+    const.MICROBE_CENSUS: write_microbe_census,
+    const.KRAKEN: write_mpa,
+    const.METAPHLAN2: write_mpa,
+    const.KRAKENHLL: write_mpa,
+    const.METHYLS: write_gene_table,
+    const.VFDB: write_gene_table,
+    const.AMR_GENES: write_gene_table,
+    const.ANCESTRY: write_key_val,
+    const.RESISTOME_AMRS: write_resistome,
+    const.HUMANN2: write_key_val,
+    const.HUMANN2_NORMALIZED: write_genes,
+}
+
+
+def file_types(result_type):
+    """Return the file types parsed for a result type."""
+    if result_type in JSON_TOOLS:
+        return [JSON_TOOLS[result_type]]
+    return list(SIMPLE_PARSE[result_type][1:])
+
+
+def write_result_files(result_type, dirname, rows=1000, seed=0, sample_name='synthetic'):
+    """
+    Write synthetic files for a result type.
+
+    Files are named <sample_name>.<result_type>.<file_type> in `dirname`.
+    Returns the {<file_type>: <file_path>} schema to parse them with.
+    """
+    rng = Random(seed)
+    writer = WRITERS.get(result_type, write_json)
+    files_dict = {}
+    for file_type in file_types(result_type):
+        path = os.path.join(dirname, f'{sample_name}.{result_type}.{file_type}')
+        writer(path, rows, rng)
+        files_dict[file_type] = path
+    return files_dict
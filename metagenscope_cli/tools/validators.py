@@ -0,0 +1,146 @@
+"""Local validation of parsed tool results before they are uploaded."""
+
+from math import isfinite
+
+from . import constants as const
+
+
+# Largest result uploaded, in chunks above Uploader.chunk_size
+MAX_RESULT_BYTES = 1024 * 1024 * 1024
+
+GENE_COLUMNS = [const.RPK_KEY, const.RPKM_KEY, const.RPKMG_KEY]
+
+
+class ValidationError(Exception):
+    """Custom exception signaling a result the server would reject."""
+
+    pass
+
+
+def check_key(key, path):
+    """Require a key MongoDB accepts: a string without periods or a leading $."""
+    if not isinstance(key, str):
+        raise ValidationError(f'{path} has non-string key {key!r}')
+    if '.' in key or key.startswith('$'):
+        raise ValidationError(f'{path} has unscrubbed key {key!r}')
+
+
+def check_number(value, path):
+    """Require a finite int or float, which excludes booleans."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValidationError(f'{path} is not a number: {value!r}')
+    if not isfinite(value):
+        raise ValidationError(f'{path} is not finite: {value!r}')
+
+
+def check_integer(value, path):
+    """Require an int, which excludes booleans."""
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValidationError(f'{path} is not an integer: {value!r}')
+
+
+def check_object(value, path, max_keys=None):
+    """Require a dictionary with valid keys and, if given, at most `max_keys` of them."""
+    if not isinstance(value, dict):
+        raise ValidationError(f'{path} is not an object')
+    if max_keys is not None and len(value) > max_keys:
+        raise ValidationError(f'{path} has {len(value)} entries, over the limit of {max_keys}')
+    for key in value:
+        check_key(key, path)
+
+
+def check_json(value, path):
+    """Require JSON data with valid keys and finite numbers, at any depth."""
+    if isinstance(value, dict):
+        check_object(value, path)
+        for key, item in value.items():
+            check_json(item, f'{path}[{key!r}]')
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            check_json(item, f'{path}[{index}]')
+    elif isinstance(value, float):
+        check_number(value, path)
+    elif value is not None and not isinstance(value, (str, int)):
+        raise ValidationError(f'{path} is not JSON: {value!r}')
+
+
+def json_object(value, path):
+    """Require a JSON object, such as a result read from a JSON file."""
+    check_object(value, path)
+    check_json(value, path)
+
+
+def record(fields):
+    """Return a validator requiring exactly the keys of `fields`, each checked by its value."""
+    def validator(value, path):
+        """Require every field, and no other."""
+        check_object(value, path)
+        missing = [key for key in fields if key not in value]
+        if missing:
+            raise ValidationError(f'{path} is missing {", ".join(missing)}')
+        unknown = [key for key in value if key not in fields]
+        if unknown:
+            raise ValidationError(f'{path} has unknown {", ".join(unknown)}')
+        for key, check in fields.items():
+            check(value[key], f'{path}[{key!r}]')
+    return validator
+
+
+def table(check_row, max_rows=None):
+    """Return a validator requiring a dictionary of rows, each checked by `check_row`."""
+    def validator(value, path):
+        """Require at most `max_rows` valid rows."""
+        check_object(value, path, max_keys=max_rows)
+        for key, row in value.items():
+            check_row(row, f'{path}[{key!r}]')
+    return validator
+
+
+def columns(names):
+    """Return a validator requiring a row of numbers named `names`."""
+    return record({name: check_number for name in names})
+
+
+VALIDATORS = {
+    const.ALPHA_DIVERSITY:    json_object,
+    const.MICROBE_DIRECTORY:  json_object,
+    const.READ_STATS:         json_object,
+    const.READ_CLASS_PROPS:   json_object,
+    const.HMP_SITES:          json_object,
+    const.BETA_DIVERSITY:     json_object,
+    const.MACROBES:           json_object,
+    const.MICROBE_CENSUS:     record({
+        const.AGS_KEY: check_number,
+        const.TOTAL_BASES_KEY: check_integer,
+        const.GENOME_EQUIVALENTS_KEY: check_number,
+    }),
+    const.KRAKEN:             table(check_number, max_rows=const.TOP_N_FILTER),
+    const.METAPHLAN2:         table(check_number, max_rows=const.TOP_N_FILTER),
+    const.KRAKENHLL:          table(check_number, max_rows=const.TOP_N_FILTER),
+    const.METHYLS:            table(columns(GENE_COLUMNS), max_rows=const.TOP_N_FILTER),
+    const.VFDB:               table(columns(GENE_COLUMNS), max_rows=const.TOP_N_FILTER),
+    const.AMR_GENES:          table(columns(GENE_COLUMNS), max_rows=const.TOP_N_FILTER),
+    const.ANCESTRY:           table(check_number),
+    const.RESISTOME_AMRS:     record({
+        'genes': table(check_integer),
+        'groups': table(check_integer),
+        'classus': table(check_integer),
+        'mechanism': table(check_integer),
+    }),
+    const.HUMANN2:            table(columns([const.ABUNDANCE_KEY, const.COVERAGE_KEY])),
+    const.HUMANN2_NORMALIZED: table(columns(GENE_COLUMNS), max_rows=const.TOP_N_FILTER),
+}
+
+
+def validate(result_type, data):
+    """Raise ValidationError if the server would reject parsed data of a result type."""
+    if result_type not in VALIDATORS:
+        raise ValidationError(f'no validator for {result_type}')
+    VALIDATORS[result_type](data, 'data')
+
+
+def check_size(size):
+    """Raise ValidationError if result data serialized to `size` bytes is too large to store."""
+    if size > MAX_RESULT_BYTES:
+        raise ValidationError(f'data is {size} bytes, '
+                              f'over the limit of {MAX_RESULT_BYTES}')
@@ -0,0 +1,199 @@
+"""Vectorised selection of top ranked rows in large tabular result files."""
+
+import io
+import os.path
+import sys
+from itertools import compress
+
+
+# Smaller files parse faster line by line than it takes to set up a DataFrame
+VECTORIZED_MIN_BYTES = 4 * 1024 * 1024
+
+# Ranks read by the fast C converter may differ from float() in the last
+# bit, keep every row this close to the cutoff for exact re-parsing
+RANK_TOLERANCE = 1e-9
+
+# Bytes of a large file read at a time
+BLOCK_BYTES = 16 * 1024 * 1024
+
+# csv.QUOTE_NONE, quote characters are ordinary characters in result files
+QUOTE_NONE = 3
+
+
+class IrregularFileError(Exception):
+    """A file the vectorised reader leaves to the line by line parsers."""
+
+    pass
+
+
+def prefer_vectorized(filename):
+    """Return True if a file is large enough to read vectorised and pandas is installed."""
+    try:
+        if os.path.getsize(filename) < VECTORIZED_MIN_BYTES:
+            return False
+    except OSError:
+        return False
+    try:
+        import pandas  # pylint: disable=unused-import
+    except ImportError:
+        return False
+    return True
+
+
+def line_bounds(data):
+    """Return NumPy arrays of the start and end offsets of every line in a buffer."""
+    import numpy
+
+    buffer = numpy.frombuffer(data, dtype=numpy.uint8)
+    ends = numpy.flatnonzero(buffer == ord('\n'))
+    starts = numpy.concatenate([[0], ends + 1])
+    if data.endswith(b'\n'):
+        starts = starts[:-1]
+    else:
+        ends = numpy.append(ends, len(data))
+    return starts, ends
+
+
+def iter_blocks(file, block_bytes):
+    """Yield blocks of about `block_bytes` bytes of whole lines read from a binary file."""
+    rest = b''
+    while True:
+        block = file.read(block_bytes)
+        if not block:
+            break
+        block = rest + block
+        end = block.rfind(b'\n') + 1
+        rest = block[end:]
+        if end:
+            yield block[:end]
+    if rest:
+        yield rest
+
+
+def iter_line_blocks(filename, skip=0, skipchar=None):
+    """
+    Yield blocks of the data lines of a file, with the offsets of each line.
+
+    The first `skip` lines, and every line starting with `skipchar`, are
+    left out, as the line parsers leave them out. Only one block of
+    BLOCK_BYTES is held in memory at a time.
+
+    Raises IrregularFileError for lines starting with whitespace, which the
+    line parsers strip before splitting, shifting their columns.
+    """
+    import numpy
+
+    with open(filename, 'rb') as file:
+        for _ in range(skip):
+            file.readline()
+        for block in iter_blocks(file, BLOCK_BYTES):
+            if block[:1].isspace() or b'\n\t' in block or b'\n ' in block:
+                raise IrregularFileError('Lines starting with whitespace')
+            starts, ends = line_bounds(block)
+            if skipchar is not None:
+                buffer = numpy.frombuffer(block, dtype=numpy.uint8)
+                comments = buffer[starts] == ord(skipchar)
+                if comments.any():
+                    block = b''.join(block[start:end + 1] for start, end
+                                     in zip(starts[~comments], ends[~comments]))
+                    if not block:
+                        continue
+                    starts, ends = line_bounds(block)
+            yield block, starts, ends
+
+
+def read_column(data, sep, column, dtype=None):
+    """Read one column of a buffer of lines with the pandas C parser."""
+    import pandas
+
+    try:
+        frame = pandas.read_csv(io.BytesIO(data), sep=sep, header=None,
+                                usecols=[column], dtype=dtype,
+                                na_filter=False, quoting=QUOTE_NONE,
+                                skip_blank_lines=False, engine='c')
+    except ValueError as error:
+        raise IrregularFileError(str(error)) from error
+    return frame[column]
+
+
+def read_ranks(data, sep, rank_column):
+    """Read one numeric column, approximately, with the pandas C parser."""
+    import numpy
+
+    ranks = read_column(data, sep, rank_column).to_numpy()
+    # Text, such as a line missing the column, makes the column non-numeric
+    if ranks.dtype.kind not in 'fi':
+        raise IrregularFileError('Non-numeric ranks')
+    ranks = ranks.astype(float)
+    if numpy.isnan(ranks).any():
+        raise IrregularFileError('Missing or NaN ranks')
+    return ranks
+
+
+def near_top(ranks, limit):
+    """Return a mask of the ranks within RANK_TOLERANCE of the `limit` highest, or above."""
+    import numpy
+
+    cutoff = numpy.partition(ranks, len(ranks) - limit)[len(ranks) - limit]
+    margin = abs(cutoff) * RANK_TOLERANCE + sys.float_info.min
+    return ranks >= cutoff - margin
+
+
+def top_candidate_lines(filename, rank_column,  # pylint:disable=too-many-arguments
+                        sep='\t', skip=0, skipchar=None, limit=None):
+    """
+    Return the lines of a file that may hold its `limit` highest ranks, in order.
+
+    Ranks in `rank_column` are read by the pandas C parser, which may
+    round differently to float(), so every line within RANK_TOLERANCE of
+    the cutoff is returned: the line parser run over these lines selects
+    exactly the rows it selects over the whole file. The first `skip`
+    lines, and any lines starting with `skipchar`, are skipped.
+
+    The file is read a block at a time, keeping only the lines at or above
+    the cutoff of the blocks read so far, so memory is bounded by the
+    block size and the candidates rather than the file.
+
+    Raises IrregularFileError for files whose columns the C parser could
+    split differently to the line parsers.
+    """
+    import numpy
+
+    lines, ranks = [], numpy.empty(0)
+    for block, starts, ends in iter_line_blocks(filename, skip=skip, skipchar=skipchar):
+        keep = numpy.ones(len(lines) + len(starts), dtype=bool)
+        if limit is not None:
+            block_ranks = read_ranks(block, sep, rank_column)
+            if len(block_ranks) != len(starts):
+                raise IrregularFileError('Rows do not match lines')
+            ranks = numpy.concatenate([ranks, block_ranks])
+            if len(ranks) > limit:
+                keep = near_top(ranks, limit)
+                ranks = ranks[keep]
+        # Only the candidates of a block are copied out of it
+        lines = list(compress(lines, keep[:len(lines)])) + \
+            [block[starts[line]:ends[line]] for line in numpy.flatnonzero(keep[len(lines):])]
+    return [line.decode('utf-8') for line in lines]
+
+
+def keys_repeated(filename, key_column, keys,  # pylint:disable=too-many-arguments
+                  sep='\t', skip=0, skipchar=None):
+    """
+    Return True if any of `keys`, scrubbed of periods, names more than one line of a file.
+
+    Keys are read a block at a time by the pandas C parser, skipping lines
+    as top_candidate_lines does. Lines the line parsers would drop for
+    lacking columns are still counted, which can only report a repeat that
+    is not there.
+    """
+    seen = set()
+    for block, starts, _ in iter_line_blocks(filename, skip=skip, skipchar=skipchar):
+        names = read_column(block, sep, key_column, dtype=str)
+        if len(names) != len(starts):
+            raise IrregularFileError('Rows do not match lines')
+        names = names.str.replace('.', '_', regex=False)
+        names = names[names.isin(keys)]
+        if names.duplicated().any() or not seen.isdisjoint(names):
+            return True
+        seen.update(names)
+    return False
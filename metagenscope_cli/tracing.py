@@ -0,0 +1,126 @@
+"""Lightweight span tracing of upload runs, exportable as a Chrome trace."""
+
+import json
+import os
+from contextlib import contextmanager
+from threading import Lock, current_thread, get_ident
+from time import perf_counter
+
+
+class Tracer(object):
+    """
+    Record timed spans from any number of threads.
+
+    Each span has a name, a stage (the category it is summarized under) and
+    optional arguments, such as the result type it worked on. Spans are
+    written in the Chrome trace event format, which chrome://tracing and
+    Perfetto both load.
+    """
+
+    def __init__(self):
+        """Start a trace with no spans."""
+        self.lock = Lock()
+        self.origin = perf_counter()
+        self.events = []
+        self.thread_names = {}
+
+    @contextmanager
+    def span(self, name, stage, **args):
+        """Record the time spent inside the context as a span."""
+        start = perf_counter()
+        try:
+            yield args
+        finally:
+            end = perf_counter()
+            event = {
+                'name': name,
+                'cat': stage,
+                'ph': 'X',
+                'ts': (start - self.origin) * 1e6,
+                'dur': (end - start) * 1e6,
+                'pid': os.getpid(),
+                'tid': get_ident(),
+                'args': args,
+            }
+            with self.lock:
+                self.events.append(event)
+                self.thread_names[event['tid']] = current_thread().name
+
+    def trace_events(self):
+        """Return recorded spans, and thread names, as Chrome trace events."""
+        with self.lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+        pid = os.getpid()
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                     'args': {'name': thread_name}}
+                    for tid, thread_name in thread_names.items()]
+        return metadata + events
+
+    def write(self, filename):
+        """Write the trace to a Chrome trace JSON file."""
+        with open(filename, 'w') as trace_file:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'},
+                      trace_file)
+
+    def summary(self):
+        """
+        Return the number of spans and seconds spent per stage and per result type.
+
+        returns {
+            'stages': {<stage>: {'count': int, 'seconds': float}},
+            'result_types': {<result_type>: {'count': int, 'seconds': float}},
+        }
+        """
+        stages = {}
+        result_types = {}
+        with self.lock:
+            events = list(self.events)
+        for event in events:
+            seconds = event['dur'] / 1e6
+            tally(stages, event['cat'], seconds)
+            result_type = event['args'].get('result_type')
+            if result_type is not None:
+                tally(result_types, result_type, seconds)
+        return {'stages': stages, 'result_types': result_types}
+
+
+def tally(totals, key, seconds):
+    """Add a span to the count and seconds for a key."""
+    total = totals.setdefault(key, {'count': 0, 'seconds': 0.0})
+    total['count'] += 1
+    total['seconds'] += seconds
+
+
+# Spans are only recorded while a run is being traced
+_TRACER = None  # pylint: disable=invalid-name
+
+
+def start_tracing():
+    """Record spans from now on, returning the Tracer recording them."""
+    global _TRACER  # pylint: disable=global-statement,invalid-name
+    _TRACER = Tracer()
+    return _TRACER
+
+
+def stop_tracing():
+    """Stop recording spans."""
+    global _TRACER  # pylint: disable=global-statement,invalid-name
+    _TRACER = None
+
+
+@contextmanager
+def span(name, stage, **args):
+    """
+    Record the time spent inside the context, if tracing.
+
+    Yields a dictionary of the span's arguments, which the caller may add
+    to, eg. with the status of a response. Spans recorded in parse worker
+    processes are not collected.
+    """
+    tracer = _TRACER
+    if tracer is None:
+        yield args
+        return
+    with tracer.span(name, stage, **args) as span_args:
+        yield span_args
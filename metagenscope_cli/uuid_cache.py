@@ -0,0 +1,59 @@
+"""Local cache of sample and sample group UUIDs by name."""
+from __future__ import absolute_import
+
+import os.path
+import sqlite3
+from threading import Lock
+from time import time
+
+
+UUID_CACHE_FILENAME = '.metagenscope_uuids.sqlite'
+DEFAULT_UUID_TTL = 24 * 60 * 60  # seconds
+
+SAMPLE_KIND = 'sample'
+SAMPLE_GROUP_KIND = 'sample_group'
+
+SCHEMA = '''CREATE TABLE IF NOT EXISTS uuids (
+    host TEXT, kind TEXT, name TEXT, uuid TEXT, stored_at REAL,
+    PRIMARY KEY (host, kind, name))'''
+
+
+class UuidCache(object):
+    """
+    Cache of UUIDs by host, kind (sample or sample group) and name.
+
+    Entries older than `ttl` seconds are ignored. A cache may be shared by
+    threads.
+    """
+
+    def __init__(self, filename, dirname='~', ttl=DEFAULT_UUID_TTL):
+        """Open cache file, creating it if needed."""
+        expanded_dirname = os.path.expanduser(dirname)
+        self.cache_filename = os.path.join(expanded_dirname, filename)
+        self.ttl = ttl
+        self.lock = Lock()
+        self.connection = sqlite3.connect(self.cache_filename, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(SCHEMA)
+
+    def close(self):
+        """Close the cache file."""
+        self.connection.close()
+
+    def get(self, host, kind, name):
+        """Return the cached UUID for a name, or None if unknown or expired."""
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT uuid FROM uuids '
+                'WHERE host = ? AND kind = ? AND name = ? AND stored_at > ?',
+                (host, kind, name, time() - self.ttl)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, host, kind, name, uuid):
+        """Cache the UUID for a name."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO uuids VALUES (?, ?, ?, ?, ?)',
+                (host, kind, name, uuid, time())
+            )
@@ -11,6 +11,10 @@ dependencies = [
     'datasuper==0.9.0',
 ]
 
+extras = {
+    'async': ['aiohttp'],
+}
+
 dependency_links = [
     'git+https://github.com/dcdanko/DataSuper.git@develop#egg=datasuper-0.9.0',
 ]
@@ -29,6 +33,7 @@ setup(
     zip_safe=False,
     platforms='any',
     install_requires=dependencies,
+    extras_require=extras,
     dependency_links=dependency_links,
     entry_points={
         'console_scripts': [
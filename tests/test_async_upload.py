@@ -0,0 +1,135 @@
+"""Test suite for uploading from an event loop."""
+import pytest
+from click.testing import CliRunner
+
+from metagenscope_cli.journal import UploadJournal
+from metagenscope_cli.loadtest import FakeMetaGenScope, FAKE_TOKEN
+from metagenscope_cli.network import Knex
+from metagenscope_cli.network.token_auth import TokenAuth
+from metagenscope_cli.tools.synthetic import write_result_files
+from metagenscope_cli.uuid_cache import UuidCache
+
+pytest.importorskip('aiohttp')
+
+from metagenscope_cli.cli.upload_cli import upload  # noqa: E402
+from metagenscope_cli.network.async_knex import AsyncKnex  # noqa: E402
+from metagenscope_cli.network.async_uploader import AsyncUploader  # noqa: E402
+
+
+SAMPLE_NAMES = [f'sample_{index}' for index in range(5)]
+RESULT_TYPES = ['read_stats', 'microbe_census']
+
+
+def samples(value=1):
+    """Return (sample_name, tool_results) pairs of every sample."""
+    return [(sample_name, [{'result_type': result_type, 'data': {'value': value}}
+                           for result_type in RESULT_TYPES])
+            for sample_name in SAMPLE_NAMES]
+
+
+def run_upload(server, group_uuid, journal=None, uuid_cache=None):
+    """Upload every sample from an event loop, returning the results and the AsyncKnex."""
+    async_knex = AsyncKnex(TokenAuth(jwt_token=FAKE_TOKEN), host=server.url, concurrency=4)
+    uploader = AsyncUploader(async_knex, journal=journal, uuid_cache=uuid_cache)
+    return uploader.run_all_results(group_uuid, samples(), dryrun=False), async_knex
+
+
+def test_async_upload_results():
+    """Ensure every sample is created and every result uploaded."""
+    with FakeMetaGenScope() as server:
+        results, async_knex = run_upload(server, 'group-uuid')
+        assert set(server.state.samples) == set(SAMPLE_NAMES)
+        assert server.state.summary()['results'] == len(SAMPLE_NAMES) * len(RESULT_TYPES)
+    assert [result['type'] for result in results] == ['success'] * 10
+    assert all(result['sample_uuid'] == server.state.samples[result['sample_name']]
+               for result in results)
+    stats = async_knex.connection_stats()
+    assert stats['requests'] == len(SAMPLE_NAMES) * (1 + len(RESULT_TYPES))
+    assert stats['new_connections'] <= 4
+    assert stats['new_connections'] + stats['reused_connections'] == stats['requests']
+
+
+def test_async_upload_reports_failures():
+    """Ensure failed uploads are returned as errors rather than raised."""
+    with FakeMetaGenScope(error_rate=1.0) as server:
+        results, _ = run_upload(server, 'group-uuid')
+    assert [result['type'] for result in results] == ['error'] * 10
+
+
+def test_async_upload_shares_journal_and_cache(tmpdir):
+    """Ensure a rerun skips journaled results and the cache resolves sample names."""
+    journal = UploadJournal('journal.sqlite', dirname=str(tmpdir))
+    uuid_cache = UuidCache('uuids.sqlite', dirname=str(tmpdir))
+    with FakeMetaGenScope() as server:
+        run_upload(server, 'group-uuid', journal=journal, uuid_cache=uuid_cache)
+        requests = server.state.summary()['requests']
+        results, _ = run_upload(server, 'group-uuid', journal=journal, uuid_cache=uuid_cache)
+        assert server.state.summary()['requests'] == requests
+    assert [result['type'] for result in results] == ['skipped'] * 10
+    assert uuid_cache.get(server.url, 'sample', 'sample_0') == server.state.samples['sample_0']
+    journal.close()
+    uuid_cache.close()
+
+
+def test_async_upload_reuses_host_of_knex():
+    """Ensure an AsyncKnex built from a Knex talks to the same host and tallies its bodies."""
+    with Knex(TokenAuth(jwt_token=FAKE_TOKEN), host='http://example.test') as knex:
+        async_knex = AsyncKnex.from_knex(knex, concurrency=3)
+    assert async_knex.host == 'http://example.test'
+    assert async_knex.body_stats is knex.body_stats
+    assert async_knex.concurrency == 3
+
+
+def test_upload_files_async(tmpdir, monkeypatch):
+    """Ensure `upload files --async-upload` uploads and reports event loop connections."""
+    monkeypatch.setenv('HOME', str(tmpdir))
+    results_dir = tmpdir.mkdir('results')
+    for sample_name in SAMPLE_NAMES:
+        write_result_files('kraken_taxonomy_profiling', str(results_dir), rows=10,
+                           sample_name=sample_name)
+
+    with FakeMetaGenScope() as server:
+        outcome = CliRunner().invoke(upload, [
+            'files', '-h', server.url, '-a', FAKE_TOKEN, '--async-upload', '--concurrency', '4',
+            '--no-parse-cache', str(results_dir),
+        ])
+        assert outcome.exit_code == 0, outcome.output
+        assert server.state.summary()['results'] == len(SAMPLE_NAMES)
+    assert f'connections: <requests: {2 * len(SAMPLE_NAMES)} ' in outcome.output
+
+
+def test_upload_files_async_bulk_create(tmpdir, monkeypatch):
+    """Ensure samples created with --bulk-create are not created again from the event loop."""
+    monkeypatch.setenv('HOME', str(tmpdir))
+    results_dir = tmpdir.mkdir('results')
+    for sample_name in SAMPLE_NAMES:
+        write_result_files('kraken_taxonomy_profiling', str(results_dir), rows=10,
+                           sample_name=sample_name)
+
+    with FakeMetaGenScope(bulk=True) as server:
+        outcome = CliRunner().invoke(upload, [
+            'files', '-h', server.url, '-a', FAKE_TOKEN, '--async-upload', '--bulk-create',
+            '--no-parse-cache', str(results_dir),
+        ])
+        assert outcome.exit_code == 0, outcome.output
+        assert server.state.summary()['results'] == len(SAMPLE_NAMES)
+    # Only the results go through the event loop
+    assert f'connections: <requests: {len(SAMPLE_NAMES)} ' in outcome.output
+
+
+@pytest.mark.parametrize('option', [['--retries', '3'], ['--adaptive'], ['--chunk-size', '8']])
+def test_upload_files_async_rejects_unsupported_options(tmpdir, monkeypatch, option):
+    """Ensure options the event loop would ignore are refused alongside --async-upload."""
+    monkeypatch.setenv('HOME', str(tmpdir))
+    results_dir = tmpdir.mkdir('results')
+    write_result_files('kraken_taxonomy_profiling', str(results_dir), rows=10,
+                       sample_name=SAMPLE_NAMES[0])
+
+    with FakeMetaGenScope() as server:
+        outcome = CliRunner().invoke(upload, [
+            'files', '-h', server.url, '-a', FAKE_TOKEN, '--async-upload', *option,
+            '--no-parse-cache', str(results_dir),
+        ])
+        assert server.state.summary()['requests'] == 0
+    assert outcome.exit_code == 2
+    assert f'--async-upload does not support {option[0]}' in outcome.output
@@ -0,0 +1,99 @@
+"""Test suite for chunked and streamed uploads of large results."""
+import json
+
+import pytest
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+from metagenscope_cli.loadtest import FakeMetaGenScope, FAKE_TOKEN
+from metagenscope_cli.network import Knex, Uploader
+from metagenscope_cli.network.chunked_upload import CHUNK_RESUMES
+from metagenscope_cli.network.exceptions import IncompleteUploadError
+from metagenscope_cli.network.token_auth import TokenAuth
+from metagenscope_cli.network.uploader import CHUNKED_UPLOAD_ENDPOINT
+
+
+RESULT_TYPE = 'beta_diversity_stats'
+LARGE_RESULT = {f'sample_{i}': {f'sample_{j}': i * j / 7 for j in range(40)} for i in range(40)}
+CHUNK_SIZE = 4096
+
+
+class FlakyKnex(Knex):
+    """Knex failing the first attempts to post each of some chunks."""
+
+    def __init__(self, *args, failing_chunks=(), failures=1, **kwargs):
+        """Fail the given chunk indices `failures` times."""
+        super().__init__(*args, **kwargs)
+        self.failing_chunks = {index: failures for index in failing_chunks}
+
+    def post_data(self, endpoint, data, **kwargs):
+        """Fail a chosen chunk while it has failures left, otherwise post it."""
+        index = int(endpoint.rsplit('/', 1)[-1]) if '/chunks/' in endpoint else None
+        if self.failing_chunks.get(index):
+            self.failing_chunks[index] -= 1
+            raise RequestsConnectionError('Injected failure')
+        return super().post_data(endpoint, data, **kwargs)
+
+
+def upload_result(server, data, compress=False, failing_chunks=(), failures=1):
+    """Upload a result to a new sample on the fake server, returning the uploader."""
+    knex = FlakyKnex(TokenAuth(jwt_token=FAKE_TOKEN), host=server.url, compress=compress,
+                     failing_chunks=failing_chunks, failures=failures)
+    with knex:
+        uploader = Uploader(knex, chunk_size=CHUNK_SIZE)
+        group_uuid = uploader.create_sample_group('group')
+        sample_uuid = uploader.create_sample('sample', group_uuid)
+        uploader.upload_sample_result(sample_uuid, RESULT_TYPE, data)
+    return uploader
+
+
+def uploaded_bodies(server):
+    """Return the assembled bodies of completed chunked uploads."""
+    return [json.loads(upload['body'].decode('utf-8'))
+            for upload in server.state.uploads.values() if 'body' in upload]
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_large_result_is_chunked(compress):
+    """Ensure results larger than a chunk are uploaded in chunks and assembled."""
+    with FakeMetaGenScope(chunked=True) as server:
+        uploader = upload_result(server, LARGE_RESULT, compress=compress)
+        assert uploaded_bodies(server) == [LARGE_RESULT]
+        assert server.state.summary()['results'] == 1
+    assert uploader.bulk_endpoints[CHUNKED_UPLOAD_ENDPOINT] is True
+
+
+def test_failed_chunks_are_resumed():
+    """Ensure chunks that failed are resent once the server lists them missing."""
+    with FakeMetaGenScope(chunked=True) as server:
+        upload_result(server, LARGE_RESULT, failing_chunks=[1, 3])
+        assert uploaded_bodies(server) == [LARGE_RESULT]
+
+
+def test_chunks_still_missing_fail_the_upload():
+    """Ensure an upload missing chunks after every resume is never completed."""
+    with FakeMetaGenScope(chunked=True) as server:
+        with pytest.raises(IncompleteUploadError):
+            upload_result(server, LARGE_RESULT, failing_chunks=[2], failures=CHUNK_RESUMES + 1)
+        assert uploaded_bodies(server) == []
+        assert server.state.summary()['results'] == 0
+
+
+def test_small_result_is_sent_in_one_request():
+    """Ensure results that fit in a chunk skip the chunked upload."""
+    with FakeMetaGenScope(chunked=True) as server:
+        uploader = upload_result(server, {'reads': 10})
+        assert server.state.uploads == {}
+        assert server.state.summary()['results'] == 1
+    assert CHUNKED_UPLOAD_ENDPOINT not in uploader.bulk_endpoints
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_large_result_is_streamed_without_chunked_uploads(compress):
+    """Ensure large results are streamed in one request to servers lacking chunked uploads."""
+    with FakeMetaGenScope() as server:
+        uploader = upload_result(server, LARGE_RESULT, compress=compress)
+        assert server.state.summary()['results'] == 1
+        assert server.state.results[(uploader.get_sample_uuid('sample'), RESULT_TYPE)] == 40
+    assert uploader.bulk_endpoints[CHUNKED_UPLOAD_ENDPOINT] is False
+    stats = uploader.knex.body_stats.summary()
+    assert stats['raw_bytes'] > CHUNK_SIZE
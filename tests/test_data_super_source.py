@@ -0,0 +1,122 @@
+"""Test suite for filtered, lazy DataSuper cataloguing."""
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('datasuper')
+
+from metagenscope_cli.sample_sources import data_super_source  # noqa: E402
+from metagenscope_cli.sample_sources.data_super_source import DataSuperSource  # noqa: E402
+
+
+class FakeFileRecord(object):  # pylint: disable=too-few-public-methods
+    """File record pointing at a path."""
+
+    def __init__(self, path):
+        """Point at a path."""
+        self.path = path
+
+    def filepath(self):
+        """Return the path."""
+        return self.path
+
+
+class FakeResult(object):
+    """Result of one type with one file."""
+
+    def __init__(self, result_type, path):
+        """Hold one file of a result type."""
+        self.result_type = result_type
+        self.path = path
+
+    def resultType(self):  # pylint: disable=invalid-name
+        """Return the result type."""
+        return self.result_type
+
+    def files(self):
+        """Return (file_type, file_record) pairs."""
+        return [('mpa', FakeFileRecord(self.path))]
+
+
+class FakeSample(object):  # pylint: disable=too-few-public-methods
+    """Sample with kraken and metaphlan2 results."""
+
+    def __init__(self, name, tmpdir):
+        """Write a file per result."""
+        self.name = name
+        self.paths = {}
+        for result_type in ['kraken_taxonomy_profiling', 'metaphlan2_taxonomy_profiling']:
+            path = str(tmpdir.join(f'{name}.{result_type}.mpa'))
+            open(path, 'w').close()
+            self.paths[result_type] = path
+
+    def results(self):
+        """Return the sample's results."""
+        return [FakeResult(result_type, path) for result_type, path in self.paths.items()]
+
+
+class FakeSampleTable(object):
+    """Table of samples by name."""
+
+    def __init__(self, samples):
+        """Hold samples."""
+        self.samples = {sample.name: sample for sample in samples}
+        self.loaded = 0
+
+    def get(self, name):
+        """Return a sample by name."""
+        return self.samples[name]
+
+    def load(self, name):
+        """Return a sample by name, counting those loaded."""
+        self.loaded += 1
+        return self.samples[name]
+
+    def getAllLazily(self):  # pylint: disable=invalid-name
+        """Return (name, loader) pairs, each loader reading the current name as datasuper's do."""
+        return ((name, lambda: self.load(name)) for name in self.samples)
+
+
+@pytest.fixture
+def samples(tmpdir, monkeypatch):
+    """Serve three samples from a fake repository."""
+    fake_samples = [FakeSample(f'sample_{index}', tmpdir) for index in range(3)]
+    repo = type('FakeRepo', (), {'sampleTable': FakeSampleTable(fake_samples)})()
+    monkeypatch.setattr(data_super_source.ds.Repo, 'loadRepo', lambda: repo)
+    return fake_samples
+
+
+def test_catalog_all(samples):  # pylint: disable=redefined-outer-name
+    """Ensure every sample is cataloged, in order."""
+    catalog = list(DataSuperSource(resolve_workers=2).iter_cataloged_files())
+    assert [name for name, _ in catalog] == [sample.name for sample in samples]
+    assert len(catalog[0][1]) == 2
+
+
+def test_catalog_all_lazily(samples):  # pylint: disable=redefined-outer-name
+    """Ensure samples are loaded from the repository only as cataloging needs them."""
+    table = data_super_source.ds.Repo.loadRepo().sampleTable
+    catalog = DataSuperSource(resolve_workers=1).iter_cataloged_files()
+    assert next(catalog)[0] == samples[0].name
+    assert table.loaded < len(samples)
+
+
+def test_filter_samples_and_result_types(samples):  # pylint: disable=redefined-outer-name
+    """Ensure only named samples and result types are cataloged."""
+    source = DataSuperSource(sample_names=['sample_2', 'missing'],
+                             result_types=['kraken_taxonomy_profiling'])
+    catalog = source.get_cataloged_files()
+    assert catalog == {'sample_2': {
+        'kraken_taxonomy_profiling': {'mpa': samples[2].paths['kraken_taxonomy_profiling']},
+    }}
+
+
+def test_filter_modified_since(samples):  # pylint: disable=redefined-outer-name
+    """Ensure results with only old files are skipped."""
+    old = (datetime.now() - timedelta(days=2)).timestamp()
+    for sample in samples[:2]:
+        for path in sample.paths.values():
+            os.utime(path, (old, old))
+    source = DataSuperSource(modified_since=datetime.now() - timedelta(days=1))
+    assert list(source.get_cataloged_files()) == ['sample_2']
@@ -0,0 +1,113 @@
+"""Test suite for downloading results to disk."""
+import json
+import os
+
+import pytest
+from click.testing import CliRunner
+from requests import Response
+from requests.exceptions import ChunkedEncodingError
+
+from metagenscope_cli.cli.get_cli import get
+from metagenscope_cli.loadtest import FakeMetaGenScope, FAKE_TOKEN
+from metagenscope_cli.network import Knex, Uploader
+from metagenscope_cli.network.token_auth import TokenAuth
+
+
+SAMPLE_NAMES = ['sample_a', 'sample_b', 'sample_c']
+RESULT_TYPES = ['read_stats', 'microbe_census']
+
+
+def upload_results(server):
+    """Upload a result of every type for every sample, returning the samples' UUIDs."""
+    with Knex(TokenAuth(jwt_token=FAKE_TOKEN), host=server.url) as knex:
+        uploader = Uploader(knex)
+        group_uuid = uploader.create_sample_group('group')
+        sample_uuids = uploader.create_samples(SAMPLE_NAMES, group_uuid)
+        for sample_uuid in sample_uuids.values():
+            for result_type in RESULT_TYPES:
+                uploader.upload_sample_result(sample_uuid, result_type, {'a': 1, 'b': 2})
+        return sample_uuids
+
+
+def test_download_results_resumes(tmpdir):
+    """Ensure every result is written to disk once, skipping files already present."""
+    with FakeMetaGenScope() as server:
+        sample_uuids = upload_results(server)
+        with Knex(TokenAuth(jwt_token=FAKE_TOKEN), host=server.url) as knex:
+            uploader = Uploader(knex, max_workers=4)
+            first = uploader.download_results('samples', sample_uuids,
+                                              RESULT_TYPES + ['unknown'], str(tmpdir))
+            second = uploader.download_results('samples', sample_uuids,
+                                               RESULT_TYPES + ['unknown'], str(tmpdir))
+
+    assert [result['type'] for result in first].count('success') == 6
+    assert [result['type'] for result in first].count('error') == 3
+    assert [result['type'] for result in second].count('skipped') == 6
+    assert sorted(os.listdir(str(tmpdir))) == sorted(
+        f'{name}.{result_type}.json' for name in SAMPLE_NAMES for result_type in RESULT_TYPES)
+    with open(str(tmpdir.join('sample_a.read_stats.json'))) as result_file:
+        data = json.load(result_file)['data']
+    assert data == {'sample_uuid': sample_uuids['sample_a'], 'result_type': 'read_stats',
+                    'keys': 2}
+
+
+def test_get_results_cli(tmpdir, monkeypatch):
+    """Ensure results of samples, read from arguments and a file, and groups are downloaded."""
+    monkeypatch.setenv('HOME', str(tmpdir))
+    names_file = tmpdir.join('names.txt')
+    names_file.write('sample_b\nsample_c\n')
+    out_dir = tmpdir.join('out')
+    with FakeMetaGenScope() as server:
+        upload_results(server)
+        auth = ['-h', server.url, '-a', FAKE_TOKEN]
+        outcome = CliRunner().invoke(get, ['results', 'samples'] + auth + [
+            '-r', 'read_stats', '-f', str(names_file), '-o', str(out_dir), 'sample_a'])
+        assert outcome.exit_code == 0, outcome.output
+        assert 'downloads: <downloaded: 3 skipped: 0 failed: 0>' in outcome.output
+
+        group_uuid = server.state.sample_groups['group']
+        server.state.middleware[('sample_groups', group_uuid)] = 0
+        outcome = CliRunner().invoke(get, ['results', 'groups'] + auth + [
+            '-r', 'taxa_tree', '-o', str(out_dir), 'group', 'unknown_group'])
+        assert outcome.exit_code == 0, outcome.output
+        assert 'downloads: <downloaded: 1 skipped: 0 failed: 0>' in outcome.output
+        assert '[uuid-error] unknown_group' in outcome.output
+    assert sorted(os.listdir(str(out_dir))) == [
+        'group.taxa_tree.json', 'sample_a.read_stats.json', 'sample_b.read_stats.json',
+        'sample_c.read_stats.json']
+
+
+def test_unsafe_names_are_rejected(tmpdir):
+    """Ensure names that could write outside the output directory are not downloaded."""
+    out_dir = tmpdir.mkdir('out')
+    with FakeMetaGenScope() as server:
+        sample_uuids = upload_results(server)
+        requests = server.state.summary()['requests']
+        uuids = {name: sample_uuids['sample_a'] for name in ['../escape', 'nested/name', '..']}
+        with Knex(TokenAuth(jwt_token=FAKE_TOKEN), host=server.url) as knex:
+            results = Uploader(knex).download_results('samples', uuids, ['read_stats'],
+                                                      str(out_dir))
+            results += Uploader(knex).download_results('samples', sample_uuids,
+                                                       ['../read_stats'], str(out_dir))
+        assert server.state.summary()['requests'] == requests
+    assert [result['type'] for result in results] == ['error'] * 6
+    assert os.listdir(str(out_dir)) == []
+    assert sorted(os.listdir(str(tmpdir))) == ['out']
+
+
+def test_failed_download_leaves_no_partial_file(tmpdir, monkeypatch):
+    """Ensure a download failing part way through removes its .part file."""
+    def broken_iter_content(response, chunk_size):
+        """Yield part of the body, then fail as if the connection dropped."""
+        yield response.raw.read(1)
+        raise ChunkedEncodingError('connection broken')
+
+    filename = str(tmpdir.join('sample_a.read_stats.json'))
+    with FakeMetaGenScope() as server:
+        sample_uuids = upload_results(server)
+        monkeypatch.setattr(Response, 'iter_content', broken_iter_content)
+        with Knex(TokenAuth(jwt_token=FAKE_TOKEN), host=server.url) as knex:
+            with pytest.raises(ChunkedEncodingError):
+                knex.download(f'/api/v1/samples/{sample_uuids["sample_a"]}/read_stats',
+                              filename)
+    assert os.listdir(str(tmpdir)) == []
@@ -0,0 +1,83 @@
+"""Test suite for the fake MetaGenScope server and upload load driver."""
+import gzip
+import json
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from metagenscope_cli.loadtest import FakeMetaGenScope, FAKE_TOKEN
+
+
+def call(server, method, endpoint, payload=None, compress=False, token=FAKE_TOKEN):
+    """Send a request to the fake server, returning the status and response data."""
+    headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+    body = None
+    if payload is not None:
+        body = json.dumps(payload).encode('utf-8')
+        if compress:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+    request = Request(server.url + endpoint, data=body, headers=headers, method=method)
+    try:
+        with urlopen(request) as response:
+            return response.status, json.loads(response.read())['data'], response.headers
+    except HTTPError as error:
+        return error.code, json.loads(error.read())['data'], error.headers
+
+
+def test_create_and_get_sample():
+    """Ensure samples are created once and resolved by name."""
+    with FakeMetaGenScope() as server:
+        status, data, _ = call(server, 'POST', '/api/v1/samples', {'name': 'sample_a'})
+        assert status == 201
+        sample_uuid = data['sample']['uuid']
+
+        status, _, _ = call(server, 'POST', '/api/v1/samples', {'name': 'sample_a'})
+        assert status == 400
+
+        status, data, _ = call(server, 'GET', '/api/v1/samples/getid/sample_a')
+        assert status == 200
+        assert data['sample_uuid'] == sample_uuid
+
+
+def test_accepts_gzipped_results():
+    """Ensure gzipped result bodies are decoded and recorded."""
+    with FakeMetaGenScope() as server:
+        _, data, _ = call(server, 'POST', '/api/v1/samples', {'name': 'sample_a'})
+        endpoint = f'/api/v1/samples/{data["sample"]["uuid"]}/read_stats'
+        status, _, _ = call(server, 'POST', endpoint, {'num_reads': 5}, compress=True)
+        assert status == 201
+        assert server.state.summary()['results'] == 1
+
+
+def test_rejects_bad_token():
+    """Ensure requests with the wrong token are unauthorized."""
+    with FakeMetaGenScope() as server:
+        status, _, _ = call(server, 'GET', '/api/v1/auth/status', token='wrong')
+        assert status == 401
+
+
+def test_injects_throttling_and_errors():
+    """Ensure configured fractions of requests are throttled or fail."""
+    with FakeMetaGenScope(throttle_rate=1.0) as server:
+        status, _, headers = call(server, 'GET', '/api/v1/auth/status')
+        assert status == 429
+        assert headers['Retry-After'] == '1'
+    with FakeMetaGenScope(error_rate=1.0) as server:
+        status, _, _ = call(server, 'GET', '/api/v1/auth/status')
+        assert status == 500
+        assert server.state.summary()['status_counts'] == {500: 1}
+
+
+def test_load_test_uploads_every_result(tmpdir):
+    """Ensure the load driver uploads all synthetic results and measures them."""
+    from metagenscope_cli.loadtest.driver import run_load_test, synthetic_samples
+
+    samples = synthetic_samples(str(tmpdir), samples=3, rows=50)
+    with FakeMetaGenScope(throttle_rate=0.1) as server:
+        stats = run_load_test(server.url, samples, workers=4, retries=5)
+        results = server.state.summary()['results']
+    expected = sum(len(tool_results) for _, tool_results in samples)
+    assert stats['results'] == expected
+    assert stats['errors'] == 0
+    assert results == expected
+    assert stats['p99'] >= stats['p50'] > 0
@@ -0,0 +1,108 @@
+from click.testing import CliRunner
+
+from metagenscope_cli.cli.upload_cli import upload
+from metagenscope_cli.journal import UploadJournal, content_hash
+from metagenscope_cli.loadtest import FakeMetaGenScope, FAKE_TOKEN
+from metagenscope_cli.network import Uploader
+from metagenscope_cli.tools.synthetic import write_result_files
+
+
+HOST = 'http://localhost'
+
+
+def tool_result(result_type, value):
+    """Return a tool result payload."""
+    return {'result_type': result_type, 'data': {'value': value}}
+
+
+def test_content_hash_ignores_key_order():
+    """Ensure equal payloads hash equally regardless of key order."""
+    assert content_hash({'a': 1, 'b': 2}) == content_hash({'b': 2, 'a': 1})
+    assert content_hash({'a': 1}) != content_hash({'a': 2})
+
+
+def test_sample_uuids_persist(tmpdir):
+    """Ensure recorded sample UUIDs survive reopening the journal."""
+    journal = UploadJournal('.journal.sqlite', str(tmpdir))
+    assert journal.get_sample_uuid(HOST, 'sample_a') is None
+    journal.record_sample(HOST, 'sample_a', 'sample-uuid')
+    journal.close()
+
+    journal = UploadJournal('.journal.sqlite', str(tmpdir))
+    assert journal.get_sample_uuid(HOST, 'sample_a') == 'sample-uuid'
+    assert journal.get_sample_uuid('http://other-host', 'sample_a') is None
+
+
+def test_split_results_skips_unchanged(tmpdir):
+    """Ensure only new or changed results are left to upload."""
+    journal = UploadJournal('.journal.sqlite', str(tmpdir))
+    key_prefix = (HOST, 'sample_a')
+    unchanged = tool_result('read_stats', 1)
+    changed = tool_result('microbe_census', 2)
+    journal.record_result(key_prefix + ('read_stats',), content_hash(unchanged['data']))
+    journal.record_result(key_prefix + ('microbe_census',), content_hash({'value': 1}))
+
+    new = tool_result('alpha_diversity_stats', 3)
+    pending, skipped = journal.split_results(key_prefix, [unchanged, changed, new])
+    assert skipped == [unchanged]
+    assert [result for result, _ in pending] == [changed, new]
+
+
+def test_dryrun_uploads_do_not_count_as_uploaded(tmpdir):
+    """Ensure dry runs are only skipped by later dry runs."""
+    journal = UploadJournal('.journal.sqlite', str(tmpdir))
+    key = (HOST, 'sample_a', 'read_stats')
+    journal.record_result(key, 'digest', dryrun=True)
+    assert journal.is_uploaded(key, 'digest', dryrun=True)
+    assert not journal.is_uploaded(key, 'digest')
+
+    journal.record_result(key, 'digest')
+    assert journal.is_uploaded(key, 'digest')
+    assert journal.is_uploaded(key, 'digest', dryrun=True)
+
+
+def write_samples(tmpdir, sample_names):
+    """Write a result file per sample, returning their directory."""
+    results_dir = tmpdir.mkdir('results')
+    for sample_name in sample_names:
+        write_result_files('kraken_taxonomy_profiling', str(results_dir), rows=10,
+                           sample_name=sample_name)
+    return results_dir
+
+
+def test_rerun_skips_uploaded_results(tmpdir, monkeypatch):
+    """Ensure a plain rerun, which uploads to a new group, sends no result again."""
+    monkeypatch.setenv('HOME', str(tmpdir))
+    results_dir = write_samples(tmpdir, ['sample_a', 'sample_b'])
+    with FakeMetaGenScope() as server:
+        arguments = ['files', '-h', server.url, '-a', FAKE_TOKEN, '--no-parse-cache',
+                     str(results_dir)]
+        outcome = CliRunner().invoke(upload, arguments)
+        assert outcome.exit_code == 0, outcome.output
+        requests = server.state.summary()['requests']
+
+        outcome = CliRunner().invoke(upload, arguments)
+        assert outcome.exit_code == 0, outcome.output
+        # Only the new group is created
+        assert server.state.summary()['requests'] == requests + 1
+        assert len(server.state.sample_groups) == 2
+    assert outcome.output.count('(unchanged)') == 2
+
+
+def test_journal_is_closed_on_failure(tmpdir, monkeypatch):
+    """Ensure the journal is closed however the upload fails."""
+    monkeypatch.setenv('HOME', str(tmpdir))
+    results_dir = write_samples(tmpdir, ['sample_a'])
+    closed = []
+    monkeypatch.setattr(UploadJournal, 'close', lambda journal: closed.append(journal))
+
+    def fail(*args, **kwargs):
+        """Fail as an unexpected error would."""
+        raise RuntimeError('upload failed')
+
+    monkeypatch.setattr(Uploader, 'upload_all_results', fail)
+    with FakeMetaGenScope() as server:
+        outcome = CliRunner().invoke(upload, ['files', '-h', server.url, '-a', FAKE_TOKEN,
+                                              '--no-parse-cache', str(results_dir)])
+    assert isinstance(outcome.exception, RuntimeError)
+    assert len(closed) == 1
@@ -0,0 +1,133 @@
+import socket
+from threading import Thread
+from time import monotonic
+
+import pytest
+from requests.exceptions import MissingSchema, Timeout
+
+from metagenscope_cli.network import Knex
+from metagenscope_cli.network.limiter import AdaptiveLimiter, latency_key
+
+
+def test_limit_grows_while_latency_is_stable():
+    """Ensure the limit grows additively up to its maximum."""
+    limiter = AdaptiveLimiter(2, maximum=4)
+    for _ in range(50):
+        limiter.acquire()
+        limiter.release(latency=0.1)
+    assert limiter.summary()['limit'] == 4
+
+
+def test_limit_backs_off_on_overload():
+    """Ensure overload halves the limit, bounded by the minimum."""
+    limiter = AdaptiveLimiter(8, maximum=8)
+    limiter.acquire()
+    limiter.release(overloaded=True)
+    assert limiter.summary()['limit'] == 4
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release(overloaded=True)
+    assert limiter.summary()['limit'] == 1
+
+
+def test_limit_backs_off_on_latency_spike():
+    """Ensure latency far above the best recent latency shrinks the limit."""
+    limiter = AdaptiveLimiter(10, maximum=10)
+    limiter.acquire()
+    limiter.release(latency=0.1)
+    limiter.acquire()
+    limiter.release(latency=1.0)
+    assert limiter.summary()['limit'] == 9
+
+
+def test_retry_after_pauses_requests():
+    """Ensure Retry-After delays the next request."""
+    limiter = AdaptiveLimiter(2)
+    limiter.acquire()
+    limiter.release(overloaded=True, retry_after=0.2)
+    start = monotonic()
+    limiter.acquire()
+    assert monotonic() - start >= 0.15
+
+
+def test_acquire_blocks_at_limit():
+    """Ensure no more than the limit of requests are in flight."""
+    limiter = AdaptiveLimiter(1)
+    limiter.acquire()
+    acquired = []
+    thread = Thread(target=lambda: acquired.append(limiter.acquire()))
+    thread.start()
+    thread.join(0.1)
+    assert not acquired
+    limiter.release(latency=0.1)
+    thread.join(1)
+    assert acquired
+
+
+def test_summary_percentiles():
+    """Ensure latency percentiles are reported."""
+    limiter = AdaptiveLimiter(1, maximum=1)
+    assert limiter.summary()['p50'] is None
+    for latency in range(1, 101):
+        limiter.acquire()
+        limiter.release(latency=latency / 100)
+    summary = limiter.summary()
+    assert summary['p50'] == 0.51
+    assert summary['p99'] == 1.0
+
+
+def test_failed_requests_release_the_limiter():
+    """Ensure requests failing for any reason give their slot back to the limiter."""
+    limiter = AdaptiveLimiter(2)
+    with Knex(None, host='not-a-url', limiter=limiter, retries=2) as knex:
+        with pytest.raises(MissingSchema):
+            knex.get('/api/v1/samples')
+
+    def body():
+        """Fail while encoding the body."""
+        raise ValueError('unencodable')
+
+    with Knex(None, host='http://127.0.0.1:1', limiter=limiter) as knex:
+        with pytest.raises(ValueError):
+            knex.send('POST', '/api/v1/samples', body=body)
+    assert limiter.in_flight == 0
+
+
+def test_unanswered_requests_time_out():
+    """Ensure requests to a silent server time out, back off and are retried."""
+    limiter = AdaptiveLimiter(4)
+    with socket.socket() as silent:
+        # Connections are queued by the listening socket but never answered
+        silent.bind(('127.0.0.1', 0))
+        silent.listen(4)
+        host = f'http://127.0.0.1:{silent.getsockname()[1]}'
+        with Knex(None, host=host, limiter=limiter, retries=1, timeout=0.1) as knex:
+            start = monotonic()
+            with pytest.raises(Timeout):
+                knex.get('/api/v1/samples')
+            assert monotonic() - start < 2
+    assert limiter.in_flight == 0
+    assert limiter.summary()['limit'] == 1
+
+
+def test_kinds_of_requests_have_their_own_baseline():
+    """Ensure slower kinds of request on a healthy server do not collapse the limit."""
+    limiter = AdaptiveLimiter(5, maximum=66)
+    create = latency_key('POST', '/api/v1/samples')
+    upload = latency_key('POST', '/api/v1/samples/0c6c7e3e-9f5a-4c1e-8d2f-2a8f1e6b9d01/kraken')
+    for _ in range(1000):
+        for key, latency in [(create, 0.02), (upload, 0.08), (upload, 0.08)]:
+            limiter.acquire()
+            limiter.release(latency=latency, key=key)
+    assert limiter.summary()['limit'] == 66
+
+
+def test_latency_key_ignores_record_ids():
+    """Ensure requests differing only in record ids or query are of one kind."""
+    first = latency_key('POST', '/api/v1/uploads/0c6c7e3e-9f5a-4c1e-8d2f-2a8f1e6b9d01/chunks/1')
+    second = latency_key('POST', '/api/v1/uploads/6e2b1a90-4d3c-4b8e-9a7f-5c1d2e3f4a5b/chunks/12')
+    assert first == second == 'POST /api/v1/uploads/*/chunks/*'
+    assert latency_key('GET', '/api/v1/samples/getid/s1?dryrun=true') == \
+        'GET /api/v1/samples/getid/s1'
+    assert latency_key('POST', '/api/v1/samples/x/kraken') != \
+        latency_key('POST', '/api/v1/samples/x/metaphlan2_taxonomy_profiling')
@@ -0,0 +1,85 @@
+"""Test suite for concurrent and batched metadata uploads."""
+import pytest
+from click.testing import CliRunner
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+from metagenscope_cli.cli.upload_cli import upload
+from metagenscope_cli.loadtest import FakeMetaGenScope, FAKE_TOKEN
+from metagenscope_cli.network import Knex, Uploader
+from metagenscope_cli.network.token_auth import TokenAuth
+from metagenscope_cli.network.uploader import BULK_METADATA_ENDPOINT, iter_batches
+
+
+def upload_metadata(server, sample_names, batch_size):
+    """Create samples on the fake server and upload metadata for them and one unknown."""
+    with Knex(TokenAuth(jwt_token=FAKE_TOKEN), host=server.url) as knex:
+        uploader = Uploader(knex, max_workers=4)
+        group_uuid = uploader.create_sample_group('group')
+        for sample_name in sample_names:
+            uploader.create_sample(sample_name, group_uuid)
+        pairs = [(name, {'city': 'NYC'}) for name in sample_names + ['unknown']]
+        results = uploader.upload_metadata(iter(pairs), batch_size=batch_size)
+        return uploader, results
+
+
+def test_iter_batches():
+    """Ensure items are batched in order."""
+    assert list(iter_batches(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+@pytest.mark.parametrize('bulk', [False, True])
+def test_batched_metadata_upload(bulk):
+    """Ensure batches are sent in bulk when possible and per sample otherwise."""
+    sample_names = [f'sample_{index}' for index in range(7)]
+    with FakeMetaGenScope(bulk=bulk) as server:
+        uploader, results = upload_metadata(server, sample_names, batch_size=3)
+        status_counts = server.state.summary()['status_counts']
+
+    assert [result['sample_name'] for result in results] == sample_names + ['unknown']
+    failed = [result['sample_name'] for result in results if result['type'] == 'error']
+    assert failed == ['unknown']
+    assert uploader.bulk_endpoints[BULK_METADATA_ENDPOINT] is bulk
+    if not bulk:
+        # At most one bulk attempt per batch of three, and the unknown sample
+        assert status_counts[404] <= 3 + 1
+
+
+def test_per_sample_metadata_upload():
+    """Ensure batches of one never try the bulk endpoint."""
+    with FakeMetaGenScope(bulk=True) as server:
+        uploader, results = upload_metadata(server, ['sample_a', 'sample_b'], batch_size=1)
+    assert sum(1 for result in results if result['type'] == 'success') == 2
+    assert BULK_METADATA_ENDPOINT not in uploader.bulk_endpoints
+
+
+def test_bulk_connection_error_falls_back(monkeypatch):
+    """Ensure a batch whose bulk request fails to connect is sent sample by sample."""
+    post = Knex.post
+
+    def failing_bulk_post(knex, endpoint, payload):
+        """Fail bulk metadata requests as if the server dropped the connection."""
+        if endpoint == BULK_METADATA_ENDPOINT:
+            raise RequestsConnectionError('connection reset')
+        return post(knex, endpoint, payload)
+
+    monkeypatch.setattr(Knex, 'post', failing_bulk_post)
+    with FakeMetaGenScope(bulk=True) as server:
+        _, results = upload_metadata(server, ['sample_a', 'sample_b', 'sample_c'], batch_size=2)
+    assert [result['type'] for result in results] == ['success'] * 3 + ['error']
+
+
+@pytest.mark.parametrize('sample_names,exit_code', [(['sample_a'], 0),
+                                                    (['sample_a', 'unknown'], 1)])
+def test_metadata_command_exit_code(tmpdir, monkeypatch, sample_names, exit_code):
+    """Ensure upload metadata exits non-zero when any sample failed to upload."""
+    monkeypatch.setenv('HOME', str(tmpdir))
+    metadata_file = tmpdir.join('metadata.csv')
+    metadata_file.write('sample,city\nsample_a,NYC\nunknown,Boston\n')
+    with FakeMetaGenScope() as server:
+        with Knex(TokenAuth(jwt_token=FAKE_TOKEN), host=server.url) as knex:
+            uploader = Uploader(knex)
+            uploader.create_sample('sample_a', uploader.create_sample_group('group'))
+        outcome = CliRunner().invoke(upload, ['metadata', '-h', server.url, '-a', FAKE_TOKEN,
+                                              '--workers', '2', str(metadata_file)] + sample_names)
+    assert outcome.exit_code == exit_code, outcome.output
+    assert f'failed: {exit_code}>' in outcome.output
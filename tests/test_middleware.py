@@ -0,0 +1,101 @@
+"""Test suite for running middleware on many samples."""
+from contextlib import contextmanager
+
+import pytest
+from click.testing import CliRunner
+
+from metagenscope_cli.cli.run_cli import run
+from metagenscope_cli.cli.upload_cli import upload
+from metagenscope_cli.loadtest import FakeMetaGenScope, FAKE_TOKEN
+from metagenscope_cli.network import Knex, Uploader
+from metagenscope_cli.network.token_auth import TokenAuth
+from metagenscope_cli.tools.synthetic import write_result_files
+
+
+SAMPLE_NAMES = [f'sample_{index}' for index in range(6)]
+
+
+@contextmanager
+def make_uploader(server):
+    """Yield an uploader for the fake server, with samples created."""
+    with Knex(TokenAuth(jwt_token=FAKE_TOKEN), host=server.url) as knex:
+        uploader = Uploader(knex, max_workers=4)
+        group_uuid = uploader.create_sample_group('group')
+        for sample_name in SAMPLE_NAMES:
+            uploader.create_sample(sample_name, group_uuid)
+        yield uploader
+
+
+def test_run_samples_middleware():
+    """Ensure middleware runs for every known sample and fails for unknown ones."""
+    with FakeMetaGenScope() as server, make_uploader(server) as uploader:
+        results = uploader.run_samples_middleware(SAMPLE_NAMES + ['unknown'])
+        triggered = {uuid for kind, uuid in server.state.middleware if kind == 'samples'}
+    assert [result['sample_name'] for result in results] == SAMPLE_NAMES + ['unknown']
+    assert [result['type'] for result in results] == ['success'] * 6 + ['error']
+    assert triggered == {result['sample_uuid'] for result in results[:-1]}
+
+
+def test_poll_samples_middleware():
+    """Ensure polling reports progress until every sample's middleware is done."""
+    with FakeMetaGenScope(middleware_time=0.3) as server, make_uploader(server) as uploader:
+        results = uploader.run_samples_middleware(SAMPLE_NAMES)
+        sample_uuids = [result['sample_uuid'] for result in results]
+        rounds = []
+        statuses = uploader.poll_samples_middleware(
+            sample_uuids, interval=0.1, progress=lambda statuses: rounds.append(dict(statuses)))
+    assert statuses == {sample_uuid: 'success' for sample_uuid in sample_uuids}
+    assert set(rounds[0].values()) == {'pending'}
+    assert 2 <= len(rounds) <= 10
+
+
+def test_poll_samples_middleware_times_out():
+    """Ensure polling stops at the timeout and unknown samples are not polled again."""
+    with FakeMetaGenScope(middleware_time=60) as server, make_uploader(server) as uploader:
+        sample_uuid = uploader.run_samples_middleware(SAMPLE_NAMES[:1])[0]['sample_uuid']
+        statuses = uploader.poll_samples_middleware([sample_uuid, 'never-run'],
+                                                    interval=0.1, timeout=0.3)
+    assert statuses[sample_uuid] == 'pending'
+    assert isinstance(statuses['never-run'], Exception)
+
+
+@pytest.mark.parametrize('unknown_names,exit_code', [([], 0), (['unknown'], 1)])
+def test_run_middleware_samples_cli(tmpdir, monkeypatch, unknown_names, exit_code):
+    """Ensure the CLI reads unique sample names from arguments and a file, and waits for them."""
+    monkeypatch.setenv('HOME', str(tmpdir))
+    names_file = tmpdir.join('names.txt')
+    names_file.write('\n'.join(SAMPLE_NAMES[1:] + unknown_names) + '\n')
+    with FakeMetaGenScope(middleware_time=0.1) as server, make_uploader(server):
+        outcome = CliRunner().invoke(run, [
+            'middleware', 'samples', '-h', server.url, '-a', FAKE_TOKEN,
+            '-f', str(names_file), '--wait', '--poll-interval', '0.1',
+        ] + SAMPLE_NAMES[:2])
+    assert outcome.exit_code == exit_code, outcome.output
+    assert f'middleware: <started: 6 failed: {exit_code}>' in outcome.output
+    assert 'middleware finished: <success: 6 other: 0>' in outcome.output
+
+
+def test_run_middleware_samples_cli_fails_unfinished(tmpdir, monkeypatch):
+    """Ensure the CLI exits non-zero when middleware has not succeeded by the timeout."""
+    monkeypatch.setenv('HOME', str(tmpdir))
+    with FakeMetaGenScope(middleware_time=60) as server, make_uploader(server):
+        outcome = CliRunner().invoke(run, [
+            'middleware', 'samples', '-h', server.url, '-a', FAKE_TOKEN,
+            '--wait', '--poll-interval', '0.1', '--timeout', '0.3',
+        ] + SAMPLE_NAMES)
+    assert outcome.exit_code == 1, outcome.output
+    assert 'middleware finished: <success: 0 other: 6>' in outcome.output
+
+
+def test_upload_runs_group_middleware(tmpdir, monkeypatch):
+    """Ensure --run-middleware runs the group's middleware after uploading."""
+    monkeypatch.setenv('HOME', str(tmpdir))
+    write_result_files('kraken_taxonomy_profiling', str(tmpdir), rows=10, sample_name='sample')
+    with FakeMetaGenScope() as server:
+        outcome = CliRunner().invoke(upload, [
+            'files', '-h', server.url, '-a', FAKE_TOKEN, '--run-middleware', '--no-parse-cache',
+            str(tmpdir),
+        ])
+        group_uuid = server.state.sample_groups[next(iter(server.state.sample_groups))]
+        assert outcome.exit_code == 0, outcome.output
+        assert ('sample_groups', group_uuid) in server.state.middleware
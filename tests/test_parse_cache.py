@@ -0,0 +1,95 @@
+import os
+from json import dumps
+
+from metagenscope_cli import sample_sources
+from metagenscope_cli.sample_sources.file_source import FileSource
+from metagenscope_cli.tools.parse_cache import ParseCache, fingerprint
+
+from .test_sample_sources import make_result_files
+
+
+def write_file(tmpdir, name, contents):
+    """Write a file and return its path."""
+    path = os.path.join(str(tmpdir), name)
+    with open(path, 'w') as file:
+        file.write(contents)
+    return path
+
+
+def test_fingerprint_tracks_file_changes(tmpdir):
+    """Ensure fingerprints change with file contents and result type."""
+    path = write_file(tmpdir, 'sample.read_stats.json', '{}')
+    before = fingerprint('read_stats', {'json': path})
+    assert before == fingerprint('read_stats', {'json': path})
+    assert before != fingerprint('alpha_diversity_stats', {'json': path})
+
+    write_file(tmpdir, 'sample.read_stats.json', '{"a": 1}')
+    assert before != fingerprint('read_stats', {'json': path})
+    assert fingerprint('read_stats', {'json': path + '.missing'}) is None
+
+
+def test_cache_round_trip(tmpdir):
+    """Ensure stored payloads are returned until their files change."""
+    path = write_file(tmpdir, 'sample.read_stats.json', '{}')
+    files_dict = {'json': path}
+    cache = ParseCache('.cache.sqlite', str(tmpdir))
+    assert cache.get('read_stats', files_dict) is None
+
+    cache.put('read_stats', files_dict, dumps({'a': 1.5}).encode('utf-8'))
+    assert cache.get('read_stats', files_dict) == {'a': 1.5}
+    cache.close()
+
+    cache = ParseCache('.cache.sqlite', str(tmpdir))
+    assert cache.get('read_stats', files_dict) == {'a': 1.5}
+    os.utime(path, ns=(0, 0))
+    assert cache.get('read_stats', files_dict) is None
+
+
+def test_cache_evicts_least_recently_used(tmpdir):
+    """Ensure the cache stays under its size cap by evicting old entries."""
+    cache = ParseCache('.cache.sqlite', str(tmpdir), max_size=1)
+    payload = dumps(os.urandom(340 * 1024).hex()).encode('utf-8')
+    paths = [write_file(tmpdir, f'sample_{i}.table', str(i)) for i in range(3)]
+    cache.put('table', {'table': paths[0]}, payload)
+    cache.put('table', {'table': paths[1]}, payload)
+    assert cache.get('table', {'table': paths[0]}) is not None
+
+    cache.put('table', {'table': paths[2]}, payload)
+    assert cache.total_bytes <= 1024 * 1024
+    assert cache.get('table', {'table': paths[1]}) is None
+    assert cache.get('table', {'table': paths[0]}) is not None
+
+
+def test_cache_size_is_shared_between_processes(tmpdir):
+    """Ensure entries stored through another connection count towards the size cap."""
+    first = ParseCache('.cache.sqlite', str(tmpdir), max_size=1)
+    second = ParseCache('.cache.sqlite', str(tmpdir), max_size=1)
+    payload = dumps(os.urandom(340 * 1024).hex()).encode('utf-8')
+    paths = [write_file(tmpdir, f'sample_{i}.table', str(i)) for i in range(4)]
+    first.put('table', {'table': paths[0]}, payload)
+    first.put('table', {'table': paths[1]}, payload)
+    second.put('table', {'table': paths[2]}, payload)
+    second.put('table', {'table': paths[3]}, payload)
+
+    total = second.connection.execute('SELECT SUM(size) FROM parsed_results').fetchone()[0]
+    assert total <= 1024 * 1024
+    assert second.total_bytes == total
+    assert second.get('table', {'table': paths[0]}) is None
+    assert second.get('table', {'table': paths[3]}) is not None
+
+
+def test_sample_source_reuses_cache(tmpdir, monkeypatch):
+    """Ensure cached payloads are returned without parsing again."""
+    source = FileSource(files=make_result_files(tmpdir))
+    cache = ParseCache('.cache.sqlite', str(tmpdir))
+    parsed = list(source.iter_sample_payloads(parse_cache=cache))
+    assert cache.total_bytes > 0
+
+    def parse(*args, **kwargs):
+        """Fail, as cached results must not be parsed."""
+        raise AssertionError('parsed a cached result')
+
+    monkeypatch.setattr(sample_sources, 'parse', parse)
+
+    assert list(source.iter_sample_payloads(parse_cache=cache)) == parsed
+    assert list(source.iter_sample_payloads(parse_workers=2, parse_cache=cache)) == parsed
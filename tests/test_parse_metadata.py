@@ -0,0 +1,71 @@
+"""Test suite for streaming metadata parsing."""
+import gzip
+
+import pytest
+
+from metagenscope_cli.tools.parse_metadata import NA_TOKEN, iter_metadata
+
+
+METADATA = (
+    'sample,city,depth,notes\n'
+    'sample_a,NYC,10,\n'
+    'sample_b,NA,20,"quoted, with comma"\n'
+    '\n'
+    'sample_c,Boston\n'
+)
+
+
+def write_metadata(tmpdir, contents=METADATA, filename='metadata.csv'):
+    """Write a metadata file, gzipped if its name says so."""
+    path = str(tmpdir.join(filename))
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(path, 'wt') as metadata_file:
+        metadata_file.write(contents)
+    return path
+
+
+def test_all_rows(tmpdir):
+    """Ensure every row is read, with missing values filled."""
+    metadata = dict(iter_metadata(write_metadata(tmpdir)))
+    assert list(metadata) == ['sample_a', 'sample_b', 'sample_c']
+    assert metadata['sample_a'] == {'city': 'NYC', 'depth': '10', 'notes': NA_TOKEN}
+    assert metadata['sample_b']['city'] == NA_TOKEN
+    assert metadata['sample_b']['notes'] == 'quoted, with comma'
+    assert metadata['sample_c'] == {'city': 'Boston', 'depth': NA_TOKEN, 'notes': NA_TOKEN}
+
+
+def test_requested_samples_and_columns(tmpdir):
+    """Ensure only requested rows and columns are read, filling missing samples."""
+    pairs = list(iter_metadata(write_metadata(tmpdir), sample_names=['sample_b', 'sample_z'],
+                               columns=['depth']))
+    assert pairs == [('sample_b', {'depth': '20'}), ('sample_z', {'depth': NA_TOKEN})]
+
+
+def test_gzipped_tsv(tmpdir):
+    """Ensure gzipped, tab separated files are read."""
+    path = write_metadata(tmpdir, METADATA.replace(',', '\t'), filename='metadata.tsv.gz')
+    metadata = dict(iter_metadata(path, delimiter='\t'))
+    assert metadata['sample_a']['city'] == 'NYC'
+
+
+def test_unknown_column(tmpdir):
+    """Ensure selecting a missing column is an error."""
+    with pytest.raises(ValueError):
+        list(iter_metadata(write_metadata(tmpdir), columns=['altitude']))
+
+
+@pytest.mark.parametrize('sample_names', [None, ['sample_a'], ['sample_b', 'sample_c']])
+def test_duplicate_samples_anywhere(tmpdir, sample_names):
+    """Ensure a repeated sample is an error, even past every requested sample."""
+    path = write_metadata(tmpdir, METADATA + 'sample_d,Denver\nsample_a,Austin,30,\n')
+    with pytest.raises(ValueError, match='repeats sample sample_a'):
+        list(iter_metadata(path, sample_names=sample_names))
+
+
+def test_matches_pandas(tmpdir):
+    """Ensure rows match those read through a DataFrame."""
+    pandas = pytest.importorskip('pandas')
+    path = write_metadata(tmpdir)
+    frame = pandas.read_csv(path, index_col=None, dtype=str).fillna(NA_TOKEN)
+    expected = frame.set_index(frame.columns[0]).to_dict(orient='index')
+    assert dict(iter_metadata(path)) == expected
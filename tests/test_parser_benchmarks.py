@@ -0,0 +1,134 @@
+"""Parser throughput and memory benchmarks on synthetic files.
+
+Set MGS_BENCH_ROWS to benchmark larger files, eg. MGS_BENCH_ROWS=10000000.
+"""
+import os
+from time import perf_counter
+
+import pytest
+
+from metagenscope_cli.tools import vectorized
+from metagenscope_cli.tools.benchmark import benchmark_parse
+from metagenscope_cli.tools.constants import TOP_N_FILTER
+from metagenscope_cli.tools.parser_utils import jloads
+from metagenscope_cli.tools.parsers import JSON_TOOLS, SIMPLE_PARSE, parse
+from metagenscope_cli.tools.synthetic import write_result_files
+
+
+BENCH_ROWS = int(os.environ.get('MGS_BENCH_ROWS', 5000))
+RESULT_TYPES = sorted(set(JSON_TOOLS) | set(SIMPLE_PARSE))
+RANKED_RESULT_TYPES = [
+    'kraken_taxonomy_profiling',
+    'align_to_amr_genes',
+    'humann2_normalize_genes',
+]
+REPEAT = 5
+
+# Parse time over the time to read and split every line of the same files,
+# recorded on synthetic files of 5000 rows
+RECORDED_SLOWDOWN = {
+    'align_to_amr_genes': 12.5,
+    'align_to_methyltransferases': 12.5,
+    'alpha_diversity_stats': 18,
+    'beta_diversity_stats': 18,
+    'hmp_site_dists': 18,
+    'human_ancestry': 4,
+    'humann2_functional_profiling': 4.5,
+    'humann2_normalize_genes': 6,
+    'kraken_taxonomy_profiling': 6.5,
+    'krakenhll_taxonomy_profiling': 6.5,
+    'metaphlan2_taxonomy_profiling': 6.5,
+    'microbe_census': 1.5,
+    'microbe_directory_annotate': 18,
+    'quantify_macrobial': 18,
+    'read_classification_proportions': 18,
+    'read_stats': 18,
+    'resistome_amrs': 3.5,
+    'vfdb_quantify': 12.5,
+}
+
+# How much slower than its baseline a parser may run before the test fails
+TOLERANCE = 1.5
+
+# How much slower than the line parser the automatically chosen path may run
+AUTO_PATH_TOLERANCE = 1.2
+
+
+def best_seconds(func, repeat=REPEAT):
+    """Return the fastest of `repeat` runs of func, in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def read_lines(files_dict):
+    """Read and split every line of a result's files, the least any parser does."""
+    for file_path in files_dict.values():
+        with open(file_path) as file:
+            for line in file:
+                line.rstrip('\n').split('\t')
+
+
+def test_synthetic_files_are_deterministic(tmpdir):
+    """Ensure generators write the same files for the same seed."""
+    first = write_result_files('align_to_amr_genes', str(tmpdir.mkdir('a')), rows=100)
+    second = write_result_files('align_to_amr_genes', str(tmpdir.mkdir('b')), rows=100)
+    with open(first['table']) as first_file, open(second['table']) as second_file:
+        assert first_file.read() == second_file.read()
+
+
+@pytest.mark.parametrize('result_type', RESULT_TYPES)
+def test_parse_throughput(tmpdir, result_type):
+    """Benchmark parsing every supported result type."""
+    files_dict = write_result_files(result_type, str(tmpdir), rows=BENCH_ROWS)
+    stats = benchmark_parse(result_type, files_dict, repeat=REPEAT)
+    slowdown = stats['seconds'] / best_seconds(lambda: read_lines(files_dict))
+    print(f'{result_type}: {stats["rows_per_second"]:.0f} rows/s, '
+          f'{slowdown:.1f}x reading lines, '
+          f'{stats["peak_memory"] / 1024 / 1024:.1f} MB peak')
+    assert stats['rows'] > 0
+    assert slowdown < TOLERANCE * RECORDED_SLOWDOWN[result_type]
+
+
+@pytest.mark.parametrize('result_type', RANKED_RESULT_TYPES)
+def test_chosen_path_keeps_pace_with_line_parser(tmpdir, monkeypatch, result_type):
+    """Ensure the path chosen for a file large enough to vectorise is not slower than by line."""
+    pytest.importorskip('pandas')
+    rows = max(BENCH_ROWS, 100 * TOP_N_FILTER)
+    files_dict = write_result_files(result_type, str(tmpdir), rows=rows)
+    assert max(os.path.getsize(path) for path in files_dict.values()) > \
+        vectorized.VECTORIZED_MIN_BYTES / 2
+    chosen = best_seconds(lambda: parse(result_type, files_dict), repeat=3)
+    monkeypatch.setattr(vectorized, 'VECTORIZED_MIN_BYTES', float('inf'))
+    by_line = best_seconds(lambda: parse(result_type, files_dict), repeat=3)
+    print(f'{result_type}: {chosen:.3f}s chosen, {by_line:.3f}s by line')
+    assert chosen < AUTO_PATH_TOLERANCE * by_line
+
+
+@pytest.mark.parametrize('result_type', RANKED_RESULT_TYPES)
+def test_ranked_parsers_keep_top_n(tmpdir, result_type):
+    """Ensure ranked parsers keep only the top results however large the file."""
+    rows = max(BENCH_ROWS, 2 * TOP_N_FILTER)
+    files_dict = write_result_files(result_type, str(tmpdir), rows=rows)
+    assert len(parse(result_type, files_dict)) == TOP_N_FILTER
+
+
+def test_ranked_parser_memory_is_bounded(tmpdir):
+    """Ensure ranked parsing memory does not grow with the size of the file."""
+    small = write_result_files('align_to_amr_genes', str(tmpdir.mkdir('small')),
+                               rows=2 * TOP_N_FILTER)
+    large = write_result_files('align_to_amr_genes', str(tmpdir.mkdir('large')),
+                               rows=20 * TOP_N_FILTER)
+    small_peak = benchmark_parse('align_to_amr_genes', small)['peak_memory']
+    large_peak = benchmark_parse('align_to_amr_genes', large)['peak_memory']
+    assert large_peak < 2 * small_peak
+
+
+def test_jloads_throughput(tmpdir):
+    """Benchmark JSON result loading."""
+    files_dict = write_result_files('read_stats', str(tmpdir), rows=BENCH_ROWS)
+    assert len(jloads(files_dict['json'])) == BENCH_ROWS
@@ -0,0 +1,160 @@
+import os
+import random
+
+from metagenscope_cli.tools.constants import RPKM_KEY, RPKMG_KEY, TOP_N_FILTER
+from metagenscope_cli.tools.parser_utils import (
+    parse_gene_table,
+    parse_humann2_tables,
+    parse_key_val_file,
+    parse_mpa,
+    top_n,
+    top_n_bounded,
+)
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def sorted_top(data, rank):
+    """Select top results the way the parsers did before streaming selection."""
+    data = sorted(data.items(), key=lambda x: -rank(x[1]))[:TOP_N_FILTER]
+    return {key: val for key, val in data}
+
+
+def write_key_val_file(path, rows):
+    """Write a tab separated key-value file."""
+    with open(path, 'w') as file:
+        file.write('#header\tvalue\n')
+        for key, val in rows:
+            file.write(f'{key}\t{val}\n')
+
+
+def tied_rows(prefix, count=3 * TOP_N_FILTER):
+    """Return rows with many tied values, including ties at the cutoff."""
+    rng = random.Random(42)
+    return [(f'{prefix}.{i}', rng.randint(0, 50) / 4) for i in range(count)]
+
+
+def test_top_n_is_stable():
+    """Ensure ties keep their order of appearance."""
+    pairs = [('a', 1), ('b', 3), ('c', 1), ('d', 3), ('e', 2)]
+    assert top_n(iter(pairs), limit=3) == [('b', 3), ('d', 3), ('e', 2)]
+    assert top_n(iter(pairs), limit=10) == sorted(pairs, key=lambda x: -x[1])
+
+
+def test_top_n_bounded_reads_once():
+    """Ensure a file without tied keys is ranked without being read again."""
+    def read_again(*_):
+        raise AssertionError('read the file a second time')
+
+    pairs = [(f'k{i}', i) for i in range(50)] + [('k3', 60), ('k45', 44.5)]
+    top = top_n_bounded((iter(pairs), True), read_again, read_again, limit=10)
+    assert top == top_n(iter(pairs), limit=10)
+
+
+def test_top_n_bounded_matches_top_n():
+    """Ensure bounded selection matches top_n over pairs with repeated keys."""
+    rng = random.Random(7)
+    for _ in range(200):
+        pairs = [(f'k{rng.randint(0, 40)}', rng.randint(0, 20)) for _ in range(60)]
+        top = top_n_bounded((iter(pairs), True),
+                            lambda keys, pairs=pairs: any(
+                                [key for key, _ in pairs].count(key) > 1 for key in keys),
+                            lambda pairs=pairs: iter(pairs), limit=10)
+        assert top == top_n(iter(pairs), limit=10)
+
+
+def test_parse_mpa_matches_sort(tmpdir):
+    """Ensure streaming MPA selection matches a full sort."""
+    path = os.path.join(str(tmpdir), 'tied.mpa')
+    write_key_val_file(path, tied_rows('k__Bacteria|s__sp'))
+    parsed = parse_mpa(path)
+
+    expected = sorted_top(parse_key_val_file(path), lambda val: val)
+    assert list(parsed.items()) == list(expected.items())
+
+
+def test_parse_mpa_small_file():
+    """Ensure files smaller than the filter are kept whole and ranked."""
+    path = os.path.join(RESULTS_DIR, 'metaphlan2.tsv')
+    parsed = parse_mpa(path)
+    expected = sorted_top(parse_key_val_file(path), lambda val: val)
+    assert list(parsed.items()) == list(expected.items())
+
+
+def test_parse_gene_table_matches_sort(tmpdir):
+    """Ensure streaming gene table selection matches a full sort."""
+    path = os.path.join(str(tmpdir), 'genes.csv')
+    rows = tied_rows('gene')
+    with open(path, 'w') as file:
+        file.write('gene,rpk,rpkm,rpkmg\n')
+        for gene, val in rows:
+            file.write(f'{gene},{val * 2},{val},{val / 3}\n')
+    parsed = parse_gene_table(path)
+
+    expected = {}
+    for gene, val in rows:
+        expected[gene.replace('.', '_')] = {'rpk': val * 2, 'rpkm': val, 'rpkmg': val / 3}
+    expected = sorted_top(expected, lambda row: row[RPKM_KEY])
+    assert list(parsed.items()) == list(expected.items())
+
+
+def test_parse_humann2_tables_joins_top_genes(tmpdir):
+    """Ensure RPKMG values are joined onto the top ranked genes only."""
+    rpkm_path = os.path.join(str(tmpdir), 'rpkm.tsv')
+    rpkmg_path = os.path.join(str(tmpdir), 'rpkmg.tsv')
+    rows = tied_rows('UniRef90_A')
+    write_key_val_file(rpkm_path, rows)
+    write_key_val_file(rpkmg_path, reversed([(gene, val + 1) for gene, val in rows]))
+    parsed = parse_humann2_tables(rpkm_path, rpkmg_path)
+
+    rpkmgs = parse_key_val_file(rpkmg_path)
+    expected = sorted_top(parse_key_val_file(rpkm_path), lambda val: val)
+    assert list(parsed) == list(expected)
+    for gene, row in parsed.items():
+        assert row[RPKMG_KEY] == rpkmgs[gene]
+
+
+def test_parse_mpa_last_repeated_key_wins(tmpdir):
+    """Ensure a repeated key keeps its last value, at the position it first appeared."""
+    path = os.path.join(str(tmpdir), 'repeated.mpa')
+    rows = [('k__A', 90)] + [(f'k__T{i}', TOP_N_FILTER + 10 - i) for i in range(TOP_N_FILTER)]
+    write_key_val_file(path, rows + [('k__A', 1)])
+    parsed = parse_mpa(path)
+
+    assert 'k__A' not in parsed
+    assert 'k__T0' in parsed
+    expected = sorted_top(parse_key_val_file(path), lambda val: val)
+    assert list(parsed.items()) == list(expected.items())
+
+
+def test_parse_mpa_scrubbed_keys_collide(tmpdir):
+    """Ensure keys equal once scrubbed are merged as when read into a dictionary."""
+    path = os.path.join(str(tmpdir), 'colliding.mpa')
+    rows = [(f'k__T{i}', i) for i in range(2 * TOP_N_FILTER)]
+    write_key_val_file(path, rows[:10] + [('k__Top.1', 5000)] + rows[10:] +
+                       [('k__Top_1', 0.5)])
+    parsed = parse_mpa(path)
+
+    assert 'k__Top_1' not in parsed
+    expected = sorted_top(parse_key_val_file(path), lambda val: val)
+    assert list(parsed.items()) == list(expected.items())
+
+
+def test_parse_gene_table_tied_repeat_keeps_first_position(tmpdir):
+    """Ensure a repeated gene tied at the cutoff ranks where it first appeared."""
+    path = os.path.join(str(tmpdir), 'genes.csv')
+    rows = [('gene_early', 0)] + [(f'gene_{i}', 10 + i % 2) for i in range(TOP_N_FILTER)]
+    rows += [(f'gene_low_{i}', 1) for i in range(10)] + [('gene_early', 10)]
+    with open(path, 'w') as file:
+        file.write('gene,rpk,rpkm,rpkmg\n')
+        for gene, val in rows:
+            file.write(f'{gene},{val},{val},{val}\n')
+    parsed = parse_gene_table(path)
+
+    expected = {}
+    for gene, val in rows:
+        expected[gene] = {'rpk': float(val), 'rpkm': float(val), 'rpkmg': float(val)}
+    expected = sorted_top(expected, lambda row: row[RPKM_KEY])
+    assert 'gene_early' in parsed
+    assert list(parsed.items()) == list(expected.items())
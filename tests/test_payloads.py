@@ -0,0 +1,94 @@
+import gzip
+import json
+
+import pytest
+
+from metagenscope_cli.network import payloads
+from metagenscope_cli.network.payloads import (
+    BodyStats, encode_body, encode_payload, iter_encoded, iter_gzipped)
+
+
+PAYLOAD = {f'gene_{i}': {'rpk': i * 1.5, 'rpkm': i / 3, 'rpkmg': i / 7} for i in range(1000)}
+
+
+def test_encode_body_uncompressed():
+    """Ensure bodies decode back to the payload."""
+    body, headers, raw_size = encode_body(PAYLOAD)
+    assert json.loads(body.decode('utf-8')) == PAYLOAD
+    assert raw_size == len(body)
+    assert 'Content-Encoding' not in headers
+
+
+def test_encode_body_compressed():
+    """Ensure compressed bodies are gzipped and flagged as such."""
+    body, headers, raw_size = encode_body(PAYLOAD, compress=True)
+    assert headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(body).decode('utf-8')) == PAYLOAD
+    assert len(body) < raw_size
+
+
+def test_body_stats_summary():
+    """Ensure body sizes are tallied."""
+    stats = BodyStats(history=1)
+    stats.record('/a', 100, 25)
+    stats.record('/b', 100, 75)
+    assert stats.summary() == {'requests': 2, 'raw_bytes': 200, 'sent_bytes': 100, 'ratio': 0.5}
+    assert list(stats.recent) == [('/b', 100, 75)]
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def json_backend(request, monkeypatch):
+    """Encode payloads with orjson, if it is installed, then with the standard library."""
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    else:
+        monkeypatch.setattr(payloads, 'orjson', None)
+    return request.param
+
+
+@pytest.mark.parametrize('payload, decoded', [
+    ({'a': [1, 2.5, None, True], 'b': {'c': 'd'}}, None),
+    ({'gène': 'é\u2028', 'emoji': '\U0001f9ec'}, None),
+    ({2: 'two', 1.5: 'one and a half', True: 'yes', None: 'none'},
+     {'2': 'two', '1.5': 'one and a half', 'true': 'yes', 'null': 'none'}),
+    ({'nan': float('nan'), 'values': [float('inf'), -float('inf'), 1.0]},
+     {'nan': None, 'values': [None, None, 1.0]}),
+    ({'large': 2 ** 70, 'small': -2 ** 70}, None),
+])
+def test_backends_agree(json_backend, payload, decoded):
+    """Ensure payloads are accepted and decode alike whichever encoder is used."""
+    body = encode_payload(payload)
+    assert json.loads(body.decode('utf-8')) == (payload if decoded is None else decoded)
+    assert b'\\u' not in body
+
+
+def test_backends_reject_alike(json_backend):
+    """Ensure values that are not JSON are rejected whichever encoder is used."""
+    with pytest.raises(TypeError):
+        encode_payload({'a': {1, 2}})
+    with pytest.raises(TypeError):
+        encode_payload({(1, 2): 'tuple key'})
+
+
+@pytest.mark.parametrize('payload', [
+    PAYLOAD,
+    {'metric': {'tool': {f's{i}': {f's{j}': i * j for j in range(30)} for i in range(30)}}},
+    {'name': 'mixed', 'values': list(range(3000)), 'empty': {}, 'nested': [[], [{}]]},
+    [{'a': 1}] * 2000,
+    {index: [float('nan'), {True: 'é'}] for index in range(100)},
+    {},
+    3.5,
+])
+def test_iter_encoded_matches_encode_payload(json_backend, payload):
+    """Ensure streamed encodings match one-shot encodings, in chunks of the given size."""
+    chunks = list(iter_encoded(payload, chunk_size=100))
+    assert b''.join(chunks) == encode_payload(payload)
+    assert all(len(chunk) == 100 for chunk in chunks[:-1])
+    assert 0 < len(chunks[-1]) <= 100
+    assert list(iter_encoded(payload, chunk_size=100)) == chunks
+
+
+def test_iter_gzipped():
+    """Ensure streamed compression decompresses to the chunks compressed."""
+    chunks = list(iter_encoded(PAYLOAD, chunk_size=1000))
+    assert gzip.decompress(b''.join(iter_gzipped(chunks))) == b''.join(chunks)
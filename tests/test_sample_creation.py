@@ -0,0 +1,89 @@
+"""Test suite for creating samples in bulk."""
+import pytest
+from click.testing import CliRunner
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+from metagenscope_cli.cli.upload_cli import upload
+from metagenscope_cli.loadtest import FakeMetaGenScope, FAKE_TOKEN
+from metagenscope_cli.network import Knex, Uploader
+from metagenscope_cli.network.token_auth import TokenAuth
+from metagenscope_cli.network.uploader import BULK_SAMPLES_ENDPOINT
+from metagenscope_cli.tools.synthetic import write_result_files
+from metagenscope_cli.uuid_cache import UuidCache
+
+
+SAMPLE_NAMES = [f'sample_{index}' for index in range(7)]
+
+
+def create_samples(server, sample_names, batch_size=3):
+    """Create a group and samples on the fake server, returning the uploader and UUIDs."""
+    with Knex(TokenAuth(jwt_token=FAKE_TOKEN), host=server.url) as knex:
+        uploader = Uploader(knex, max_workers=4)
+        group_uuid = uploader.create_sample_group('group')
+        return uploader, uploader.create_samples(sample_names, group_uuid, batch_size=batch_size)
+
+
+@pytest.mark.parametrize('bulk', [False, True])
+def test_create_samples(bulk):
+    """Ensure samples are created in bulk when possible and one by one otherwise."""
+    with FakeMetaGenScope(bulk=bulk) as server:
+        _, existing = create_samples(server, ['sample_0'])
+        uploader, sample_uuids = create_samples(server, SAMPLE_NAMES)
+        assert sample_uuids == server.state.samples
+        assert sample_uuids['sample_0'] == existing['sample_0']
+        requests = server.state.summary()['requests']
+    assert uploader.bulk_endpoints[BULK_SAMPLES_ENDPOINT] is bulk
+    if bulk:
+        # Two groups, then batches of one, three, three and one samples
+        assert requests == 2 + 4
+
+
+def test_create_samples_skips_cached_names(tmpdir):
+    """Ensure samples the UUID cache knows are not requested again."""
+    uuid_cache = UuidCache('uuids.sqlite', dirname=str(tmpdir))
+    with FakeMetaGenScope(bulk=True) as server:
+        with Knex(TokenAuth(jwt_token=FAKE_TOKEN), host=server.url) as knex:
+            uploader = Uploader(knex, uuid_cache=uuid_cache)
+            group_uuid = uploader.create_sample_group('group')
+            first = uploader.create_samples(SAMPLE_NAMES, group_uuid)
+            requests = server.state.summary()['requests']
+            assert uploader.create_samples(SAMPLE_NAMES, group_uuid) == first
+            assert server.state.summary()['requests'] == requests
+    uuid_cache.close()
+
+
+def test_create_samples_connection_error_falls_back(monkeypatch):
+    """Ensure a batch whose bulk request fails to connect is created sample by sample."""
+    post = Knex.post
+
+    def failing_bulk_post(knex, endpoint, payload):
+        """Fail bulk sample requests as if the server dropped the connection."""
+        if endpoint == BULK_SAMPLES_ENDPOINT:
+            raise RequestsConnectionError('connection reset')
+        return post(knex, endpoint, payload)
+
+    monkeypatch.setattr(Knex, 'post', failing_bulk_post)
+    with FakeMetaGenScope(bulk=True) as server:
+        uploader, sample_uuids = create_samples(server, SAMPLE_NAMES)
+        assert sample_uuids == server.state.samples
+    assert uploader.bulk_endpoints.get(BULK_SAMPLES_ENDPOINT) is None
+
+
+@pytest.mark.parametrize('bulk', [False, True])
+def test_upload_files_with_bulk_create(tmpdir, monkeypatch, bulk):
+    """Ensure an upload with --bulk-create creates every sample before uploading."""
+    monkeypatch.setenv('HOME', str(tmpdir))
+    results_dir = tmpdir.mkdir('results')
+    for sample_name in SAMPLE_NAMES:
+        write_result_files('kraken_taxonomy_profiling', str(results_dir), rows=10,
+                           sample_name=sample_name)
+
+    with FakeMetaGenScope(bulk=bulk) as server:
+        outcome = CliRunner().invoke(upload, [
+            'files', '-h', server.url, '-a', FAKE_TOKEN, '--bulk-create', '--no-parse-cache',
+            str(results_dir),
+        ])
+        assert outcome.exit_code == 0, outcome.output
+        assert set(server.state.samples) == set(SAMPLE_NAMES)
+        assert server.state.summary()['results'] == len(SAMPLE_NAMES)
+        assert server.state.summary()['status_counts'].get(400, 0) == 0
@@ -0,0 +1,146 @@
+import io
+import os
+import shutil
+from types import GeneratorType
+
+import pytest
+
+import metagenscope_cli.sample_sources as sample_sources
+from metagenscope_cli.sample_sources import file_source, pool_context
+from metagenscope_cli.sample_sources.file_source import FileSource, read_manifest
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def make_result_files(tmpdir):
+    """Copy test results into files named <sample>.<result_type>.<file_type>."""
+    result_files = []
+    for sample_name in ['sample_a', 'sample_b']:
+        for result_type, file_type, source in [
+                ('kraken_taxonomy_profiling', 'mpa', 'kraken.tsv'),
+                ('metaphlan2_taxonomy_profiling', 'mpa', 'metaphlan2.tsv'),
+                ('microbe_census', 'stats', 'mic_census')]:
+            file_path = os.path.join(str(tmpdir), f'{sample_name}.{result_type}.{file_type}')
+            shutil.copy(os.path.join(RESULTS_DIR, source), file_path)
+            result_files.append(file_path)
+    return result_files
+
+
+def test_iter_sample_payloads_is_lazy(tmpdir):
+    """Ensure payloads are yielded per sample by a generator."""
+    source = FileSource(files=make_result_files(tmpdir))
+    payloads = source.iter_sample_payloads()
+    assert isinstance(payloads, GeneratorType)
+
+    sample_name, tool_results = next(payloads)
+    assert sample_name == 'sample_a'
+    assert len(tool_results) == 3
+
+
+def test_get_sample_payloads_matches_stream(tmpdir):
+    """Ensure the materialised payloads match the streamed ones."""
+    source = FileSource(files=make_result_files(tmpdir))
+    assert source.get_sample_payloads() == dict(source.iter_sample_payloads())
+
+
+def test_unparsable_results_are_skipped(tmpdir):
+    """Ensure results that fail to parse are reported and skipped."""
+    result_files = make_result_files(tmpdir)
+    missing_file = os.path.join(str(tmpdir), 'sample_a.humann2_functional_profiling.path_abunds')
+    shutil.copy(os.path.join(RESULTS_DIR, 'kraken.tsv'), missing_file)
+    source = FileSource(files=result_files + [missing_file])
+
+    payloads = source.get_sample_payloads()
+    result_types = [result['result_type'] for result in payloads['sample_a']]
+    assert 'humann2_functional_profiling' not in result_types
+    assert len(payloads['sample_a']) == 3
+
+
+def test_serial_parse_does_not_serialize_results(tmpdir, monkeypatch):
+    """Ensure results are sized a chunk at a time, and only serialized whole for the cache."""
+    def encode_data(_data):
+        raise AssertionError('serialized a whole result')
+
+    monkeypatch.setattr(sample_sources, 'encode_data', encode_data)
+    monkeypatch.setattr('metagenscope_cli.tools.validators.MAX_RESULT_BYTES', 150)
+    errors = []
+    payloads = dict(FileSource(files=make_result_files(tmpdir))
+                    .iter_sample_payloads(report=errors.extend))
+    assert [result['result_type'] for result in payloads['sample_a']] == ['microbe_census']
+    assert len(errors) == 4 and all('bytes, over the limit' in error for error in errors)
+
+
+def test_parse_workers_match_serial_parse(tmpdir):
+    """Ensure parsing in a process pool gives the same ordered payloads."""
+    source = FileSource(files=make_result_files(tmpdir))
+    serial = list(source.iter_sample_payloads())
+    parallel = list(source.iter_sample_payloads(parse_workers=2))
+    assert parallel == serial
+
+
+def test_parse_workers_are_not_forked():
+    """Ensure pool workers never fork the possibly multithreaded parent process."""
+    assert pool_context().get_start_method() in ('forkserver', 'spawn')
+
+
+def make_result_tree(tmpdir):
+    """Spread test results over nested directories, alongside unrelated files."""
+    result_files = make_result_files(tmpdir.mkdir('flat'))
+    for index, result_file in enumerate(result_files):
+        nested = tmpdir.join('tree', f'run_{index % 3}', 'output')
+        nested.ensure(dir=True)
+        shutil.copy(result_file, str(nested))
+    tmpdir.join('tree', 'README').write('not a result')
+    return str(tmpdir.join('tree')), result_files
+
+
+@pytest.mark.parametrize('scan_workers', [1, 4])
+def test_directories_are_scanned(tmpdir, scan_workers):
+    """Ensure result files found under directories catalog like listed files."""
+    tree, result_files = make_result_tree(tmpdir)
+    scanned = FileSource(files=[tree], scan_workers=scan_workers).get_cataloged_files()
+    listed = FileSource(files=result_files).get_cataloged_files()
+    assert {name: set(schema) for name, schema in scanned.items()} == \
+        {name: set(schema) for name, schema in listed.items()}
+
+
+def test_name_filters(tmpdir):
+    """Ensure glob and regular expression filters select files by name."""
+    tree, _ = make_result_tree(tmpdir)
+    catalog = FileSource(files=[tree], pattern='*.mpa', regex=r'^sample_b\.').get_cataloged_files()
+    assert list(catalog) == ['sample_b']
+    assert set(catalog['sample_b']) == {'kraken_taxonomy_profiling',
+                                        'metaphlan2_taxonomy_profiling'}
+
+
+def test_unknown_and_hidden_files_are_skipped(tmpdir):
+    """Ensure hidden files and result types without a parser are not cataloged."""
+    result_files = make_result_files(tmpdir)
+    tmpdir.join('.metagenscope_parse_cache.sqlite').write('')
+    tmpdir.join('sample_a.unknown_type.mpa').write('')
+    catalog = FileSource(files=[str(tmpdir)]).get_cataloged_files()
+    listed = FileSource(files=result_files).get_cataloged_files()
+    assert catalog == listed
+
+
+def test_files_naming_the_same_result(tmpdir, monkeypatch):
+    """Ensure the exactly named file is cataloged, whatever the order, and the clash reported."""
+    result_files = make_result_files(tmpdir)
+    backup = tmpdir.join('sample_a.kraken_taxonomy_profiling.mpa.bak')
+    backup.write('')
+    for files in [result_files + [str(backup)], [str(backup)] + result_files]:
+        report = io.StringIO()
+        monkeypatch.setattr(file_source, 'stderr', report)
+        catalog = FileSource(files=files).get_cataloged_files()
+        assert catalog['sample_a']['kraken_taxonomy_profiling']['mpa'] == result_files[0]
+        assert report.getvalue().startswith(
+            '[catalog-error] sample_a :: kraken_taxonomy_profiling :: mpa')
+
+
+def test_read_manifest(tmpdir):
+    """Ensure manifests list one path per line, ignoring blank lines."""
+    result_files = make_result_files(tmpdir)
+    manifest = io.StringIO('\n'.join(result_files) + '\n\n')
+    source = FileSource(files=read_manifest(manifest))
+    assert set(source.get_cataloged_files()) == {'sample_a', 'sample_b'}
@@ -0,0 +1,52 @@
+"""Startup time of the CLI, which pipelines invoke thousands of times per run."""
+import json
+import os
+import subprocess
+import sys
+from time import perf_counter
+
+import pytest
+
+pytest.importorskip('click')
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['pandas', 'numpy', 'datasuper', 'aiohttp', 'requests']
+# Seconds the CLI may add to bare interpreter and click startup
+STARTUP_BUDGET = float(os.environ.get('MGS_STARTUP_BUDGET', 0.15))
+
+LOAD_COMMAND = '''
+import json, sys
+import click
+from metagenscope_cli.cli import main
+from metagenscope_cli.config import config
+for name in sys.argv[1:]:
+    main.get_command(click.Context(main), name)
+print(json.dumps({
+    'heavy': [module for module in %r if module in sys.modules],
+    'config_read': config.parsed_config is not None,
+}))
+''' % HEAVY_MODULES
+
+
+def run_python(code, *args):
+    """Run Python code in a fresh interpreter, returning its output and duration."""
+    start = perf_counter()
+    output = subprocess.check_output([sys.executable, '-c', code] + list(args), cwd=REPO_ROOT)
+    return output, perf_counter() - start
+
+
+@pytest.mark.parametrize('command', ['status', 'get', 'run', 'upload', 'bench'])
+def test_commands_load_lightly(command):
+    """Ensure loading a command imports no heavy dependency nor reads the config file."""
+    output, _ = run_python(LOAD_COMMAND, command)
+    loaded = json.loads(output)
+    assert loaded['heavy'] == []
+    assert not loaded['config_read']
+
+
+def test_startup_time():
+    """Ensure loading a lightweight command stays within the startup budget."""
+    baseline = min(run_python('import click')[1] for _ in range(3))
+    startup = min(run_python(LOAD_COMMAND, 'status')[1] for _ in range(3))
+    print(f'CLI startup: {startup - baseline:.3f}s over bare click')
+    assert startup - baseline < STARTUP_BUDGET
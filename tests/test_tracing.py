@@ -0,0 +1,71 @@
+"""Test suite for span tracing."""
+import json
+from threading import Barrier, Thread
+
+from metagenscope_cli.tools.parsers import parse
+from metagenscope_cli.tools.synthetic import write_result_files
+from metagenscope_cli.tracing import Tracer, span, start_tracing, stop_tracing
+
+
+def test_span_is_noop_without_tracing():
+    """Ensure spans outside a traced run are not recorded."""
+    tracer = start_tracing()
+    stop_tracing()
+    with span('parse', 'parse') as span_args:
+        span_args['status'] = 200
+    assert tracer.summary()['stages'] == {}
+
+
+def test_summary_by_stage_and_result_type():
+    """Ensure spans are totalled per stage and per result type."""
+    tracer = Tracer()
+    with tracer.span('parse', 'parse', result_type='read_stats'):
+        pass
+    with tracer.span('parse', 'parse', result_type='microbe_census'):
+        pass
+    with tracer.span('POST', 'http', endpoint='/api/v1/samples'):
+        pass
+    summary = tracer.summary()
+    assert summary['stages']['parse']['count'] == 2
+    assert summary['stages']['http']['count'] == 1
+    assert set(summary['result_types']) == {'read_stats', 'microbe_census'}
+
+
+def test_write_chrome_trace(tmpdir):
+    """Ensure traces are written as Chrome trace events, naming every thread."""
+    tracer = Tracer()
+    # Keep threads alive together so none reuses another's identifier
+    barrier = Barrier(3)
+
+    def work():
+        """Record a span on this thread."""
+        with tracer.span('POST', 'http') as span_args:
+            span_args['status'] = 201
+        barrier.wait()
+
+    threads = [Thread(target=work, name=f'worker_{index}') for index in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    trace_filename = str(tmpdir.join('trace.json'))
+    tracer.write(trace_filename)
+    with open(trace_filename) as trace_file:
+        events = json.load(trace_file)['traceEvents']
+    spans = [event for event in events if event['ph'] == 'X']
+    names = {event['args']['name'] for event in events if event['ph'] == 'M'}
+    assert len(spans) == 3
+    assert all(event['args']['status'] == 201 and event['dur'] >= 0 for event in spans)
+    assert {'worker_0', 'worker_1', 'worker_2'} <= names
+
+
+def test_parse_is_traced(tmpdir):
+    """Ensure parsing a result records a span for its result type."""
+    files_dict = write_result_files('align_to_amr_genes', str(tmpdir), rows=10)
+    tracer = start_tracing()
+    try:
+        parse('align_to_amr_genes', files_dict)
+    finally:
+        stop_tracing()
+    assert tracer.summary()['result_types']['align_to_amr_genes']['count'] == 1
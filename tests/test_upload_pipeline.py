@@ -0,0 +1,118 @@
+"""Test suite for overlapping parsing with bounded concurrent uploads."""
+from threading import Event, Lock, Thread
+from time import sleep
+
+from click.testing import CliRunner
+
+from metagenscope_cli.cli.upload_cli import upload
+from metagenscope_cli.loadtest import FAKE_TOKEN
+from metagenscope_cli.network import Knex, Uploader
+from metagenscope_cli.network.token_auth import TokenAuth
+
+
+SAMPLE_COUNT = 12
+WAIT_SECONDS = 5
+
+
+class BlockingUploads:
+    """Stand-in for Uploader.upload_sample_result that holds uploads until released."""
+
+    def __init__(self):
+        """Start with no uploads."""
+        self.lock = Lock()
+        self.started = Event()
+        self.release = Event()
+        self.active = 0
+        self.peak = 0
+        self.uploaded = []
+
+    def __call__(self, sample_uuid, result_type, data, dryrun=False):
+        """Wait for release, tracking how many uploads run at once."""
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        self.started.set()
+        self.release.wait(WAIT_SECONDS)
+        with self.lock:
+            self.active -= 1
+            self.uploaded.append(sample_uuid)
+
+
+def samples(pulled):
+    """Yield one-result samples, appending each sample's name to `pulled`."""
+    for index in range(SAMPLE_COUNT):
+        pulled.append(f'sample_{index}')
+        yield f'sample_{index}', [{'result_type': 'read_stats', 'data': {'value': index}}]
+
+
+def make_uploader(knex, uploads, **kwargs):
+    """Return an Uploader whose uploads are handled by `uploads`."""
+    uploader = Uploader(knex, **kwargs)
+    uploader.upload_sample_result = uploads
+    return uploader
+
+
+def test_in_flight_results_are_bounded():
+    """Ensure no more than max_in_flight results wait while uploads are stalled."""
+    uploads = BlockingUploads()
+    pulled = []
+    sample_uuids = {f'sample_{index}': f'uuid_{index}' for index in range(SAMPLE_COUNT)}
+    with Knex(TokenAuth(jwt_token=FAKE_TOKEN), host='http://example.test') as knex:
+        uploader = make_uploader(knex, uploads, max_workers=2, max_in_flight=3)
+        outcome = {}
+        thread = Thread(target=lambda: outcome.update(results=uploader.upload_all_results(
+            'group', samples(pulled), queue_depth=0, sample_uuids=sample_uuids)))
+        thread.start()
+        assert uploads.started.wait(WAIT_SECONDS)
+        sleep(0.2)
+        # The uploader holds max_in_flight results and blocks pulling one more
+        assert len(pulled) == 3 + 1
+        assert uploads.active == 2
+        uploads.release.set()
+        thread.join(WAIT_SECONDS)
+
+    assert [result['type'] for result in outcome['results']] == ['success'] * SAMPLE_COUNT
+    assert sorted(uploads.uploaded) == sorted(sample_uuids.values())
+    assert uploads.peak == 2
+
+
+def test_parsing_overlaps_uploading():
+    """Ensure results upload while later samples are still being produced."""
+    uploads = BlockingUploads()
+    uploads.release.set()
+    overlapped = []
+
+    def slow_samples():
+        """Yield samples, waiting after the first until its upload has started."""
+        for index, sample in enumerate(samples([])):
+            yield sample
+            if index == 0:
+                overlapped.append(uploads.started.wait(WAIT_SECONDS))
+
+    sample_uuids = {f'sample_{index}': f'uuid_{index}' for index in range(SAMPLE_COUNT)}
+    with Knex(TokenAuth(jwt_token=FAKE_TOKEN), host='http://example.test') as knex:
+        uploader = make_uploader(knex, uploads, max_workers=2)
+        results = uploader.upload_all_results('group', slow_samples(), queue_depth=2,
+                                              sample_uuids=sample_uuids)
+    assert overlapped == [True]
+    assert len(results) == SAMPLE_COUNT
+
+
+def test_set_workers_resizes_pool():
+    """Ensure worker changes resize the connection pool and the in-flight bound."""
+    with Knex(TokenAuth(jwt_token=FAKE_TOKEN), host='http://example.test') as knex:
+        uploader = Uploader(knex)
+        uploader.set_workers(3, extra_connections=2)
+        assert (uploader.max_workers, uploader.max_in_flight, knex.pool_size) == (3, 6, 5)
+        uploader.set_workers(4, max_in_flight=1)
+        assert (uploader.max_workers, uploader.max_in_flight, knex.pool_size) == (4, 1, 4)
+
+
+def test_zero_workers_are_rejected(tmpdir):
+    """Ensure worker and in-flight counts below one are refused before uploading."""
+    for option in ['--workers', '--max-in-flight', '--concurrency']:
+        outcome = CliRunner().invoke(upload, [
+            'files', '-h', 'http://example.test', '-a', FAKE_TOKEN, option, '0', str(tmpdir),
+        ])
+        assert outcome.exit_code == 2
+        assert option in outcome.output
@@ -0,0 +1,75 @@
+from threading import Barrier
+
+from click.testing import CliRunner
+
+from metagenscope_cli.cli.get_cli import get
+from metagenscope_cli.loadtest import FakeMetaGenScope, FAKE_TOKEN
+from metagenscope_cli.network import Knex, Uploader
+from metagenscope_cli.network.token_auth import TokenAuth
+from metagenscope_cli.uuid_cache import UuidCache, SAMPLE_KIND, SAMPLE_GROUP_KIND
+
+
+def test_uuid_cache_round_trip(tmpdir):
+    """Ensure UUIDs are cached per host and kind."""
+    cache = UuidCache('.uuids.sqlite', str(tmpdir))
+    assert cache.get('http://a', SAMPLE_KIND, 'sample_1') is None
+    cache.put('http://a', SAMPLE_KIND, 'sample_1', 'uuid-1')
+    cache.close()
+
+    cache = UuidCache('.uuids.sqlite', str(tmpdir))
+    assert cache.get('http://a', SAMPLE_KIND, 'sample_1') == 'uuid-1'
+    assert cache.get('http://b', SAMPLE_KIND, 'sample_1') is None
+    assert cache.get('http://a', SAMPLE_GROUP_KIND, 'sample_1') is None
+
+
+def test_uuid_cache_expires(tmpdir):
+    """Ensure entries older than the TTL are ignored."""
+    cache = UuidCache('.uuids.sqlite', str(tmpdir), ttl=-1)
+    cache.put('http://a', SAMPLE_KIND, 'sample_1', 'uuid-1')
+    assert cache.get('http://a', SAMPLE_KIND, 'sample_1') is None
+
+
+def test_get_uuids_keeps_order(tmpdir, monkeypatch):
+    """Ensure names are looked up concurrently and reported in the order given."""
+    monkeypatch.setenv('HOME', str(tmpdir))
+    names = [f'sample_{index}' for index in range(10)]
+    # Lookups made one at a time would never meet in pairs and fail
+    pairs = Barrier(2, timeout=5)
+    get_sample_uuid = Uploader.get_sample_uuid
+
+    def paired_lookup(uploader, sample_name):
+        """Look a sample up once another lookup is running too."""
+        pairs.wait()
+        return get_sample_uuid(uploader, sample_name)
+
+    with FakeMetaGenScope() as server:
+        with Knex(TokenAuth(jwt_token=FAKE_TOKEN), host=server.url) as knex:
+            uploader = Uploader(knex)
+            group_uuid = uploader.create_sample_group('group')
+            for sample_name in names[::2]:
+                uploader.create_sample(sample_name, group_uuid)
+
+        monkeypatch.setattr(Uploader, 'get_sample_uuid', paired_lookup)
+        outcome = CliRunner().invoke(get, ['uuids', 'samples', '-h', server.url,
+                                           '-a', FAKE_TOKEN] + names)
+    assert outcome.exit_code == 0, outcome.output
+    lines = outcome.output.splitlines()
+    assert len(lines) == len(names)
+    for index, (line, name) in enumerate(zip(lines, names)):
+        if index % 2:
+            assert line.startswith(f'[uuid-error] {name} :: ')
+            assert '404' in line
+        else:
+            assert line == f'{name}\t{server.state.samples[name]}'
+
+
+def test_create_sample_uses_cached_uuid(tmpdir):
+    """Ensure no request is made to create a sample whose UUID is cached."""
+    cache = UuidCache('.uuids.sqlite', str(tmpdir))
+    with FakeMetaGenScope() as server:
+        cache.put(server.url, SAMPLE_KIND, 'sample_1', 'uuid-1')
+        with Knex(TokenAuth(jwt_token=FAKE_TOKEN), host=server.url) as knex:
+            uploader = Uploader(knex, uuid_cache=cache)
+            assert uploader.create_sample('sample_1', 'group-uuid') == 'uuid-1'
+        assert server.state.summary()['requests'] == 0
+    cache.close()
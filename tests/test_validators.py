@@ -0,0 +1,113 @@
+"""Test suite for local validation of parsed results."""
+import json
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from metagenscope_cli.cli.upload_cli import upload
+from metagenscope_cli.sample_sources import parse_sample, serialize_payloads
+from metagenscope_cli.tools import constants as const
+from metagenscope_cli.tools.parsers import JSON_TOOLS, SIMPLE_PARSE, parse
+from metagenscope_cli.tools.synthetic import write_result_files
+from metagenscope_cli.tools.validators import VALIDATORS, ValidationError, check_size, validate
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def test_every_result_type_has_a_validator():
+    """Ensure every parsed result type is validated."""
+    assert set(VALIDATORS) == set(JSON_TOOLS) | set(SIMPLE_PARSE)
+
+
+@pytest.mark.parametrize('result_type', sorted(set(JSON_TOOLS) | set(SIMPLE_PARSE)))
+def test_parsed_results_are_valid(tmpdir, result_type):
+    """Ensure parsers produce data their validator accepts."""
+    schema = write_result_files(result_type, str(tmpdir), rows=1500)
+    validate(result_type, parse(result_type, schema))
+
+
+def test_real_json_result_is_valid():
+    """Ensure a real JSON result is accepted."""
+    with open(os.path.join(RESULTS_DIR, 'reads_classified.json')) as json_file:
+        validate(const.READ_CLASS_PROPS, json.load(json_file))
+
+
+@pytest.mark.parametrize('result_type,data,message', [
+    (const.KRAKEN, {'k__a.b': 1.0}, 'unscrubbed key'),
+    (const.KRAKEN, {'$where': 1.0}, 'unscrubbed key'),
+    (const.KRAKEN, {'k__a': 'one'}, 'not a number'),
+    (const.KRAKEN, {'k__a': True}, 'not a number'),
+    (const.KRAKEN, {'k__a': float('nan')}, 'not finite'),
+    (const.KRAKEN, {f'k__{index}': 1.0 for index in range(const.TOP_N_FILTER + 1)},
+     'over the limit'),
+    (const.KRAKEN, [1.0], 'not an object'),
+    (const.MICROBE_CENSUS, {const.AGS_KEY: 1.0, const.GENOME_EQUIVALENTS_KEY: 2.0},
+     'missing total_bases'),
+    (const.MICROBE_CENSUS, {const.AGS_KEY: 1.0, const.TOTAL_BASES_KEY: 1.5,
+                            const.GENOME_EQUIVALENTS_KEY: 2.0}, 'not an integer'),
+    (const.VFDB, {'gene': {const.RPK_KEY: 1.0, const.RPKM_KEY: 1.0}}, 'missing rpkmg'),
+    (const.HUMANN2, {'path': {const.ABUNDANCE_KEY: 1.0, const.COVERAGE_KEY: 1.0,
+                              'extra': 1.0}}, 'unknown extra'),
+    (const.READ_STATS, {'nested': {'a.b': 1}}, "data['nested'] has unscrubbed key"),
+    (const.READ_STATS, {'values': [1.0, float('inf')]}, "data['values'][1] is not finite"),
+    ('unknown_result_type', {}, 'no validator'),
+])
+def test_invalid_results_are_rejected(result_type, data, message):
+    """Ensure data the server would reject fails validation with a useful message."""
+    with pytest.raises(ValidationError) as error:
+        validate(result_type, data)
+    assert message in str(error.value)
+
+
+def test_check_size(monkeypatch):
+    """Ensure oversized results are rejected."""
+    monkeypatch.setattr('metagenscope_cli.tools.validators.MAX_RESULT_BYTES', 100)
+    check_size(100)
+    with pytest.raises(ValidationError):
+        check_size(101)
+
+
+def test_parse_sample_reports_invalid_results(tmpdir):
+    """Ensure invalid results are reported and left out of the sample payloads."""
+    json_path = str(tmpdir.join('stats.json'))
+    with open(json_path, 'w') as json_file:
+        json.dump({'reads.total': 10}, json_file)
+    schema = {
+        const.READ_STATS: {'json': json_path},
+        const.KRAKEN: {'mpa': os.path.join(RESULTS_DIR, 'kraken.tsv')},
+    }
+    payloads, errors = parse_sample('sample', schema)
+    assert [payload['result_type'] for payload in payloads] == [const.KRAKEN]
+    assert errors == [f"[validation-error] sample :: {const.READ_STATS} :: "
+                      f"data has unscrubbed key 'reads.total'"]
+
+
+def test_serialize_payloads_leaves_out_oversized_results(monkeypatch):
+    """Ensure results over the size limit are reported instead of serialized."""
+    monkeypatch.setattr('metagenscope_cli.tools.validators.MAX_RESULT_BYTES', 20)
+    payloads = [{'result_type': 'small', 'data': {'a': 1}},
+                {'result_type': 'large', 'data': {'a': 'x' * 20}}]
+    errors = []
+    serialized = serialize_payloads('sample', payloads, errors)
+    assert serialized == [('small', b'{"a":1}')]
+    assert len(errors) == 1 and 'large :: data is 28 bytes' in errors[0]
+
+
+def test_validate_only_is_offline(tmpdir, monkeypatch):
+    """Ensure --validate-only checks every result without a host or token."""
+    monkeypatch.delenv('MGS_HOST', raising=False)
+    write_result_files(const.KRAKEN, str(tmpdir), sample_name='sample_a')
+    write_result_files(const.VFDB, str(tmpdir), sample_name='sample_b')
+    args = ['files', '--validate-only', '--no-parse-cache', str(tmpdir)]
+
+    outcome = CliRunner().invoke(upload, args)
+    assert outcome.exit_code == 0, outcome.output
+    assert 'validation: <samples: 2 valid: 2 invalid: 0>' in outcome.output
+
+    with open(str(tmpdir.join('sample_c.read_stats.json')), 'w') as json_file:
+        json.dump({'reads': float('nan')}, json_file)
+    outcome = CliRunner().invoke(upload, args)
+    assert outcome.exit_code == 1
+    assert 'validation: <samples: 3 valid: 2 invalid: 1>' in outcome.output
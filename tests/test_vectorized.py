@@ -0,0 +1,132 @@
+"""Test suite for vectorised selection of top ranked rows."""
+import json
+
+import pytest
+
+from metagenscope_cli.tools import vectorized
+from metagenscope_cli.tools.constants import TOP_N_FILTER
+from metagenscope_cli.tools.parsers import parse
+from metagenscope_cli.tools.synthetic import write_result_files
+
+
+pytest.importorskip('pandas')
+
+VECTORIZED_RESULT_TYPES = [
+    'align_to_amr_genes',
+    'align_to_methyltransferases',
+]
+
+
+def parse_both_ways(monkeypatch, result_type, files_dict):
+    """Return a result parsed line by line and vectorised, as JSON bytes."""
+    monkeypatch.setattr(vectorized, 'VECTORIZED_MIN_BYTES', float('inf'))
+    by_line = json.dumps(parse(result_type, files_dict)).encode('utf-8')
+    monkeypatch.setattr(vectorized, 'VECTORIZED_MIN_BYTES', 0)
+    by_column = json.dumps(parse(result_type, files_dict)).encode('utf-8')
+    return by_line, by_column
+
+
+def write_mpa(tmpdir, lines):
+    """Write an MPA file of lines, returning its schema."""
+    mpa_file = tmpdir.join('sample.kraken_taxonomy_profiling.mpa')
+    mpa_file.write('\n'.join(lines) + '\n')
+    return {'mpa': str(mpa_file)}
+
+
+def write_genes(tmpdir, lines):
+    """Write a gene table of lines below its header, returning its schema."""
+    gene_file = tmpdir.join('sample.align_to_methyltransferases.csv')
+    gene_file.write('gene,rpk,rpkm,rpkmg\n' + '\n'.join(lines) + '\n')
+    return {'table': str(gene_file)}
+
+
+@pytest.mark.parametrize('block_bytes', [vectorized.BLOCK_BYTES, 1024])
+@pytest.mark.parametrize('result_type', VECTORIZED_RESULT_TYPES)
+def test_vectorized_payloads_are_identical(tmpdir, monkeypatch, result_type, block_bytes):
+    """Ensure vectorised parsing, whole or a block at a time, produces byte-identical payloads."""
+    monkeypatch.setattr(vectorized, 'BLOCK_BYTES', block_bytes)
+    files_dict = write_result_files(result_type, str(tmpdir), rows=20 * TOP_N_FILTER)
+    by_line, by_column = parse_both_ways(monkeypatch, result_type, files_dict)
+    assert by_line == by_column
+
+
+def test_ties_keep_order_of_appearance(tmpdir, monkeypatch):
+    """Ensure tied ranks select the same rows as the line parser."""
+    lines = [f'gene.{index},1,{index % 3},1' for index in range(10 * TOP_N_FILTER)]
+    files_dict = write_genes(tmpdir, lines)
+    by_line, by_column = parse_both_ways(monkeypatch, 'align_to_methyltransferases', files_dict)
+    assert by_line == by_column
+
+
+def test_only_candidates_are_returned(tmpdir):
+    """Ensure only lines that may rank in the top are returned."""
+    lines = ['#SampleID\tvalue'] + [f'k__taxon_{index}\t{index}.5'
+                                   for index in range(10 * TOP_N_FILTER)]
+    files_dict = write_mpa(tmpdir, lines)
+    candidates = vectorized.top_candidate_lines(files_dict['mpa'], 1, skipchar='#',
+                                                limit=TOP_N_FILTER)
+    assert candidates == lines[-TOP_N_FILTER:]
+
+
+def test_comment_lines_are_skipped(tmpdir, monkeypatch):
+    """Ensure comment lines past the header neither rank nor affect the cutoff."""
+    monkeypatch.setattr(vectorized, 'BLOCK_BYTES', 256)
+    lines = [f'k__taxon_{index}\t{index}' for index in range(2 * TOP_N_FILTER)]
+    for position in (0, TOP_N_FILTER, len(lines)):
+        lines.insert(position, '#comment\t1e9')
+    files_dict = write_mpa(tmpdir, lines)
+    candidates = vectorized.top_candidate_lines(files_dict['mpa'], 1, skipchar='#',
+                                                limit=TOP_N_FILTER)
+    assert candidates == [line for line in lines if not line.startswith('#')][-TOP_N_FILTER:]
+
+
+def test_keys_repeated_across_blocks(tmpdir, monkeypatch):
+    """Ensure repeated keys are found in different blocks, after scrubbing periods."""
+    monkeypatch.setattr(vectorized, 'BLOCK_BYTES', 256)
+    lines = [f'k__taxon_{index}\t{index}' for index in range(2 * TOP_N_FILTER)]
+    lines = ['k__A\t5', 'k__B.1\t4'] + lines + ['#k__C\t1', 'k__A\t1', 'k__B_1\t2', 'k__C\t3']
+    mpa_file = write_mpa(tmpdir, lines)['mpa']
+    assert vectorized.keys_repeated(mpa_file, 0, {'k__A'}, skipchar='#')
+    assert vectorized.keys_repeated(mpa_file, 0, {'k__B_1'}, skipchar='#')
+    assert not vectorized.keys_repeated(mpa_file, 0, {'k__C', 'k__taxon_3'}, skipchar='#')
+
+
+def test_repeated_keys_match_line_parser(tmpdir, monkeypatch):
+    """Ensure repeated and scrub-colliding keys keep their last value vectorised too."""
+    lines = [f'gene_{index},1,{index},1' for index in range(2 * TOP_N_FILTER)]
+    lines = ['gene_A,1,5000,1', 'gene_B.1,1,4000,1'] + lines + ['gene_A,1,1,1', 'gene_B_1,1,2,1']
+    files_dict = write_genes(tmpdir, lines)
+    by_line, by_column = parse_both_ways(monkeypatch, 'align_to_methyltransferases', files_dict)
+    assert by_line == by_column
+    assert b'gene_A' not in by_column
+
+
+@pytest.mark.parametrize('irregular_line', [
+    '  gene_indented,1,1.0,1',
+    'gene_missing_value',
+    '#comment,1,1.0,1',
+    'gene_not_a_number,1,value,1',
+])
+def test_irregular_files_match_line_parser(tmpdir, monkeypatch, irregular_line):
+    """Ensure files the C parser could read differently parse as they do line by line."""
+    lines = [f'gene_{index},1,{index},1' for index in range(2 * TOP_N_FILTER)]
+    lines.insert(TOP_N_FILTER, irregular_line)
+    files_dict = write_genes(tmpdir, lines)
+    try:
+        by_line, by_column = parse_both_ways(monkeypatch, 'align_to_methyltransferases',
+                                             files_dict)
+    except (IndexError, ValueError):
+        # The line parser rejects the file, so must the vectorised one
+        monkeypatch.setattr(vectorized, 'VECTORIZED_MIN_BYTES', 0)
+        with pytest.raises((IndexError, ValueError)):
+            parse('align_to_methyltransferases', files_dict)
+    else:
+        assert by_line == by_column
+
+
+def test_leading_whitespace_is_irregular(tmpdir):
+    """Ensure lines starting with whitespace are left to the line parser."""
+    lines = [f'k__taxon_{index}\t{index}' for index in range(2 * TOP_N_FILTER)]
+    files_dict = write_mpa(tmpdir, lines + ['\tk__shifted\t1.0'])
+    with pytest.raises(vectorized.IrregularFileError):
+        vectorized.top_candidate_lines(files_dict['mpa'], 1, limit=TOP_N_FILTER)